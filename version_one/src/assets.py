@@ -0,0 +1,42 @@
+from functools import cache
+import pygame
+from constants import RoadDirections
+
+CAR_IMAGE = 'version_one/images/Car.png'
+
+# Rotation of the car image for every driving direction, the image itself faces east
+CAR_ANGLES = {
+    RoadDirections.EAST: 0,
+    RoadDirections.NORTH: 90,
+    RoadDirections.SOUTH: 270,
+    RoadDirections.WEST: 180,
+}
+
+# Process wide asset cache: every image, font and sprite is created once and then shared
+
+
+@cache
+def image(url: str, scale: tuple[int, int] | None = None) -> pygame.Surface:
+    img = pygame.image.load(url)
+    if scale is not None:
+        img = pygame.transform.scale(img, scale)
+    
+    # Blitting is a lot cheaper when the image already has the pixel format of the display
+    if pygame.display.get_surface() is not None:
+        img = img.convert_alpha()
+    return img
+
+
+@cache
+def font(name: str, size: int) -> pygame.font.Font:
+    return pygame.font.SysFont(name, size)
+
+
+@cache
+def car_sprite(direction: RoadDirections) -> pygame.Surface:
+    return pygame.transform.rotate(image(CAR_IMAGE), CAR_ANGLES[direction])
+
+
+@cache
+def text(text_font: pygame.font.Font, content: str, color: tuple[int, int, int]) -> pygame.Surface:
+    return text_font.render(content, True, color)
@@ -0,0 +1,178 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import statistics
+import time
+from constants import RoadType
+from main import Simulation, HeadlessGame
+from map_generator import generate_grid
+from profiler import PROFILER
+
+
+def place_cars(sim: Simulation, amount: int, spacing: float = 70) -> int:
+    # Fills the lanes of all roads round robin, with enough space between the cars that nobody starts blocked
+    lanes = [(road, direction) for road in sim.roads if road.road_type is not RoadType.INTERSECTION for direction in road.directions]
+    slots_per_lane = int(max(road.length for road, _ in lanes) // spacing)
+
+    placed = 0
+    for slot in range(slots_per_lane):
+        for road, direction in lanes:
+            if placed == amount:
+                return placed
+
+            distance = slot * spacing
+            if distance + spacing > road.length:
+                continue
+
+            sim.add_car(*road.lane_point(direction, distance), direction)
+            placed += 1
+
+    return placed
+
+
+class Benchmark:
+    # Measures how long the phases of one simulation step take.
+    # road_lookup and leader_search are probes: they repeat the lookup for every car on the current state
+    def __init__(self, sim: Simulation, draw: bool = False) -> None:
+        self.sim = sim
+        self.draw = draw
+        self.timings: dict[str, list[float]] = {}
+
+    def run(self, ticks: int) -> dict[str, dict[str, float]]:
+        for _ in range(ticks):
+            self.tick()
+
+        return {phase: self.__summary(values) for phase, values in self.timings.items()}
+
+    def tick(self) -> None:
+        sim = self.sim
+        start = time.perf_counter()
+
+        sim.delta_time = sim.clock.tick()
+        self.__measure("spawn_despawn", sim.create_cars, sim.remove_cars)
+        self.__measure("movement", sim.move_cars)
+        self.__measure("signals", sim.update_traffic_lights)
+        if self.draw:
+            self.__measure("draw", sim.draw)
+
+        self.timings.setdefault("step", []).append(time.perf_counter() - start)
+
+        self.__measure("road_lookup", self.__road_lookup)
+        self.__measure("leader_search", self.__leader_search)
+        
+        if PROFILER.enabled:
+            PROFILER.end_frame()
+
+    def __measure(self, phase: str, *functions) -> None:
+        start = time.perf_counter()
+        for function in functions:
+            function()
+        self.timings.setdefault(phase, []).append(time.perf_counter() - start)
+
+    def __road_lookup(self) -> None:
+        sim = self.sim
+        if sim.fleet is not None:
+            state = sim.fleet.state
+            alive = state.alive[:state.size]
+            sim.fleet.table.roads_at(state.x[:state.size][alive], state.y[:state.size][alive])
+            return
+
+        for car in sim.cars.values():
+            sim.road_index.road_at(car.logic.x, car.logic.y)
+
+    def __leader_search(self) -> None:
+        sim = self.sim
+        if sim.fleet is not None:
+            sim.fleet.find_leaders(sim.fleet.lanes())
+            return
+
+        # the same work as in a move: keep the lane in order, then find the car in front
+        cars = sim.cars.values()
+        for car in cars:
+            sim.lanes.update(car.logic)
+            car.logic.car_in_front(cars)
+
+    def __summary(self, values: list[float]) -> dict[str, float]:
+        values_ms = sorted(value * 1000 for value in values)
+        return {
+            "mean_ms": statistics.fmean(values_ms),
+            "p50_ms": values_ms[len(values_ms) // 2],
+            "p95_ms": values_ms[min(len(values_ms) - 1, int(len(values_ms) * 0.95))],
+            "max_ms": values_ms[-1],
+        }
+
+
+def create_simulation(engine: str, seed: int, draw: bool) -> Simulation:
+    if draw:
+        # drawing also works on servers without a display
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        from main import Game
+        return Game(seed=seed, realtime=False, engine=engine)
+
+    return HeadlessGame(seed=seed, engine=engine)
+
+
+def run_case(engine: str, rows: int, cols: int, cars: int, ticks: int, seed: int, draw: bool, profile: bool = False) -> dict:
+    sim = create_simulation(engine, seed, draw)
+
+    setup_start = time.perf_counter()
+    generate_grid(sim, rows, cols)
+    sim.max_cars = 0 # no cars besides the placed ones
+    placed = place_cars(sim, cars)
+    setup_time = time.perf_counter() - setup_start
+
+    if profile:
+        PROFILER.enable(window=ticks)
+    phases = Benchmark(sim, draw).run(ticks)
+    profile_phases = PROFILER.summary() if profile else None
+    PROFILER.disable()
+
+    return {
+        "engine": engine,
+        "rows": rows,
+        "cols": cols,
+        "roads": len(sim.roads),
+        "cars": placed,
+        "ticks": ticks,
+        "setup_s": setup_time,
+        "phases": phases,
+        "profile": profile_phases, # sub-steps of the car movement and the drawing, from the profiler
+    }
+
+
+def parse_grid(value: str) -> tuple[int, int]:
+    rows, cols = value.lower().split("x")
+    return int(rows), int(cols)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the simulation step and the render path")
+    parser.add_argument("--grid", type=parse_grid, nargs="+", default=[(3, 3), (10, 10)], help="intersection grids, e.g. 10x10")
+    parser.add_argument("--cars", type=int, nargs="+", default=[100, 1000], help="amount of cars per grid")
+    parser.add_argument("--engine", choices=["object", "vectorized", "partitioned"], nargs="+", default=["object", "vectorized"])
+    parser.add_argument("--ticks", type=int, default=300, help="measured steps per case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--draw", action="store_true", help="also measure Game.draw")
+    parser.add_argument("--profile", action="store_true", help="also report the sub-steps measured by the profiler")
+    parser.add_argument("--output", default="benchmark_results.json", help="where the results are written as json")
+    args = parser.parse_args()
+
+    results = []
+    for engine in args.engine:
+        for rows, cols in args.grid:
+            for cars in args.cars:
+                result = run_case(engine, rows, cols, cars, args.ticks, args.seed, args.draw, args.profile)
+                results.append(result)
+
+                phases = "  ".join(f"{phase}={summary['mean_ms']:.3f}ms" for phase, summary in result["phases"].items())
+                print(f"{engine:>10} {rows}x{cols} cars={result['cars']:<7} {phases}")
+
+    with open(args.output, "w") as file:
+        json.dump({
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "seed": args.seed,
+            "results": results,
+        }, file, indent=2)
@@ -0,0 +1,76 @@
+from __future__ import annotations
+import math
+import numpy as np
+from constants import CAR_SPEED, STOP_WINDOW
+
+# Lengths are pixels and times seconds, a car is 28 pixels long, so a pixel is about 16 cm
+EMERGENCY_DECELERATION = 36 # the hardest braking, a car which would need more drives over a yellow or red light
+STOP_SPEED = 1 # slower cars count as standing
+
+
+class DriverParameters:
+    # Intelligent driver model (IDM) parameters of one driver: 2 m/s² acceleration, 3 m/s² comfortable braking,
+    # 1 s time headway and 2 m to the back of a standing car in front. A queue then discharges with about
+    # 2.1 s between the cars (1700 cars per hour of green)
+    __slots__ = ("desired_speed", "max_acceleration", "comfort_deceleration", "time_headway", "min_gap")
+
+    def __init__(self, desired_speed: float = CAR_SPEED, max_acceleration: float = 12, comfort_deceleration: float = 18,
+                 time_headway: float = 1.0, min_gap: float = 12) -> None:
+        self.desired_speed = desired_speed
+        self.max_acceleration = max_acceleration
+        self.comfort_deceleration = comfort_deceleration
+        self.time_headway = time_headway
+        self.min_gap = min_gap
+
+    def varied(self, speed_factor: float, headway_factor: float) -> DriverParameters:
+        # drivers differ in how fast they want to drive and how much time they keep to the car in front
+        return DriverParameters(self.desired_speed * speed_factor, self.max_acceleration, self.comfort_deceleration,
+                                self.time_headway * headway_factor, self.min_gap)
+
+
+def idm_acceleration(speed, gap, leader_speed, desired_speed, max_acceleration, comfort_deceleration, time_headway, min_gap):
+    # Works on floats and on arrays with one entry per vehicle. gap is the space to the back of the leader,
+    # infinite on a free road. The braking is limited to the emergency deceleration
+    approach = speed * (speed - leader_speed) / (2 * np.sqrt(max_acceleration * comfort_deceleration))
+    desired_gap = min_gap + np.maximum(speed * time_headway + approach, 0.0)
+    acceleration = max_acceleration * (1 - (speed / desired_speed) ** 4 - (desired_gap / np.maximum(gap, 0.01)) ** 2)
+    return np.maximum(acceleration, -EMERGENCY_DECELERATION)
+
+
+def integrate(speed, acceleration, delta_time: float, max_distance):
+    # Speed and distance after one step, a braking car stops instead of rolling backwards. A car never drives
+    # further than max_distance (the back of its leader or the stop line), a car which is cut off there is slowed
+    # down, so it stands when there is no room left. Works on floats and arrays like idm_acceleration
+    limit = np.maximum(max_distance, 0.0)
+    new_speed = np.maximum(speed + acceleration * delta_time, 0.0)
+    distance = np.minimum((speed + new_speed) * 0.5 * delta_time, limit)
+    return np.minimum(new_speed, 2 * limit / delta_time), distance
+
+
+def idm_acceleration_of_one(speed: float, gap: float, leader_speed: float, driver: DriverParameters) -> float:
+    # idm_acceleration with the floats of one car, without the overhead of numpy
+    approach = speed * (speed - leader_speed) / (2 * math.sqrt(driver.max_acceleration * driver.comfort_deceleration))
+    desired_gap = driver.min_gap + max(speed * driver.time_headway + approach, 0.0)
+    acceleration = driver.max_acceleration * (1 - (speed / driver.desired_speed) ** 4 - (desired_gap / max(gap, 0.01)) ** 2)
+    return max(acceleration, -EMERGENCY_DECELERATION)
+
+
+def integrate_one(speed: float, acceleration: float, delta_time: float, max_distance: float) -> tuple[float, float]:
+    # integrate for one car
+    limit = max(max_distance, 0.0)
+    new_speed = max(speed + acceleration * delta_time, 0.0)
+    distance = min((speed + new_speed) * 0.5 * delta_time, limit)
+    return min(new_speed, 2 * limit / delta_time), distance
+
+
+def distance_to_stop(line_distance, forward):
+    # How far a car can drive until it reaches the stop window, negative in the window and behind it.
+    # forward is true for cars driving east or south
+    return np.where(forward, line_distance - STOP_WINDOW[1], STOP_WINDOW[0] - line_distance)
+
+
+def stops_for_light(speed, remaining):
+    # A car brakes for a red or yellow light unless it passed the stop window or is too fast to stop before
+    # its end with the emergency deceleration. A car in the window stands, like with the stop and go model
+    room = remaining + STOP_WINDOW[1] - STOP_WINDOW[0]
+    return (room >= 0) & (speed * speed <= 2 * EMERGENCY_DECELERATION * room)
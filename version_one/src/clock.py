@@ -0,0 +1,22 @@
+class SimulationClock:
+    # Fixed timestep clock: every tick advances the simulated time by the same step size,
+    # independent of how long the step took to compute
+    def __init__(self, step_size: float = 1 / 60) -> None:
+        self.step_size: float = step_size # simulated seconds per step
+        self.steps: int = 0
+
+    def tick(self) -> float:
+        self.steps += 1
+        return self.step_size
+
+    def steps_for(self, seconds: float) -> int:
+        return round(seconds / self.step_size)
+    
+    @property
+    def ticks(self) -> int:
+        # simulated milliseconds, computed from the step count so no float error accumulates
+        return int(self.steps * self.step_size * 1000)
+    
+    @property
+    def seconds(self) -> float:
+        return self.steps * self.step_size
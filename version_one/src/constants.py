@@ -22,6 +22,54 @@ class RoadDirections(Enum):
     WEST = "left"
 
 
+# Seconds of a red or green phase are drawn from this range for every intersection
+PHASE_RANGE = (4, 7)
+
+# Pixels per second a car drives
+CAR_SPEED = 60
+
+# Pixels from the back to the front of a car (its image), about 4.5 m
+CAR_LENGTH = 28
+
+# Pixels from the position of a car to its front when it checks the stop line, driving east or south.
+# Driving west or north the front is half of it away
+ROAD_SAFETY_DISTANCE = 30
+
+# A car stops for a red or yellow light while street end - car front (the distance both engines compute) is 1 to 5.
+# Driving east or south the distance gets smaller, so a car reaches 5 first, driving west or north it reaches 1 first
+STOP_WINDOW = (1, 5)
+
+
+OPPOSITE_DIRECTIONS = {
+    RoadDirections.NORTH: RoadDirections.SOUTH,
+    RoadDirections.SOUTH: RoadDirections.NORTH,
+    RoadDirections.WEST: RoadDirections.EAST,
+    RoadDirections.EAST: RoadDirections.WEST,
+}
+
+# Directions and colors stored as codes (e.g. in numpy arrays and files) are the position in these lists
+DIRECTIONS = [RoadDirections.NORTH, RoadDirections.EAST, RoadDirections.SOUTH, RoadDirections.WEST]
+DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+PHASE_CODES = {phase: code for code, phase in enumerate(ColorPhase)}
+
+# Where the cars drive on a road: offset of the lane from road.y (horizontal) or road.x (vertical).
+# The turn points of an intersection lie on these lanes
+LANE_OFFSETS = {
+    RoadDirections.EAST: 58,
+    RoadDirections.WEST: 20,
+    RoadDirections.SOUTH: 20,
+    RoadDirections.NORTH: 58,
+}
+
+
+class EventKind(Enum):
+    SPAWN = 0
+    DESPAWN = 1
+    TURN = 2
+    STOP_AT_RED = 3
+    PHASE_CHANGE = 4
+
+
 class RoadType(Enum):
     HORIZONTAL = "horizontal"
     VERTICAL = "vertical"
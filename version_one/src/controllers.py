@@ -0,0 +1,105 @@
+from __future__ import annotations
+from constants import ColorPhase, RoadDirections, OPPOSITE_DIRECTIONS
+from map import Intersection, TrafficLight
+
+# The lights of opposite sides are always green together
+SIDE_GROUPS = ((RoadDirections.WEST, RoadDirections.EAST), (RoadDirections.NORTH, RoadDirections.SOUTH))
+
+
+class Approach:
+    # The cars driving towards a intersection from one side: the queue in front of the traffic light
+    # and the queues of the roads they can turn into
+    __slots__ = ("traffic_light", "queue", "exits")
+
+    def __init__(self, traffic_light: TrafficLight, queue, exits: list) -> None:
+        self.traffic_light = traffic_light
+        self.queue = queue
+        self.exits = exits
+
+
+class SignalController:
+    # Decides when the lights of one intersection change. Every step the simulation calls update,
+    # a controller changes lights with set_information and returns them, so they are scheduled again.
+    # The queues come from sim.queue_sensor, counters which are read without looking at the cars
+    def attach(self, intersection: Intersection, sim, current_ticks: int) -> None:
+        self.intersection = intersection
+        self.sim = sim
+
+    def update(self, current_ticks: int) -> list[TrafficLight]:
+        return []
+
+
+class MaxPressureController(SignalController):
+    # Actuated control: a green lasts at least min_green seconds. Then it ends as soon as the waiting
+    # approaches have a higher pressure, at the latest after max_green seconds (the plan of the lights).
+    # The pressure of an approach is its queue minus the mean queue of the roads it leads to, so a green
+    # is not given to cars which could not leave the intersection
+    def __init__(self, min_green: int = 5, max_green: int = 30, yellow_phase: int = 2) -> None:
+        self.min_green = min_green
+        self.max_green = max_green
+        self.yellow_phase = yellow_phase
+        self.groups: list[list[Approach]] = []
+
+    def attach(self, intersection: Intersection, sim, current_ticks: int) -> None:
+        super().attach(intersection, sim, current_ticks)
+
+        self.groups = []
+        for sides in SIDE_GROUPS:
+            group = [self.__approach(side) for side in sides if side in intersection.acitve_traffic_lights]
+            if group:
+                self.groups.append(group)
+
+        # every light keeps its color, from now on a countdown is only the fallback for max_green
+        for group in self.groups:
+            for approach in group:
+                traffic_light = approach.traffic_light
+                traffic_light.set_information(traffic_light.starting_color_phase, self.max_green, self.yellow_phase, self.max_green,
+                                              self.max_green, current_ticks)
+
+    def __approach(self, side: RoadDirections) -> Approach:
+        intersection, queue_sensor = self.intersection, self.sim.queue_sensor
+        road = intersection.connected_roads[side]
+        direction = OPPOSITE_DIRECTIONS[side]
+
+        route = intersection.get_route(direction, road)
+        exits = [queue_sensor(exit_road, turn) for turn, exit_road in route.roads.items()] if route is not None else []
+        return Approach(intersection.acitve_traffic_lights[side], queue_sensor(road, direction), exits)
+
+    def update(self, current_ticks: int) -> list[TrafficLight]:
+        if len(self.groups) < 2:
+            return [] # nobody to give the green to
+
+        green, red = self.groups
+        if green[0].traffic_light.starting_color_phase is not ColorPhase.GREEN:
+            green, red = red, green
+
+        first = green[0].traffic_light
+        if first.color_phase is ColorPhase.YELLOW or current_ticks - first.start_ticks < self.min_green * 1000:
+            return [] # the lights are already changing or the green is too young
+
+        if self.__pressure(red) <= self.__pressure(green):
+            return []
+
+        # end the green now: only the yellow is left of every countdown
+        changed = []
+        for approach in green + red:
+            traffic_light = approach.traffic_light
+            traffic_light.set_information(traffic_light.starting_color_phase, self.max_green, self.yellow_phase, self.max_green,
+                                          self.yellow_phase, current_ticks)
+            changed.append(traffic_light)
+        return changed
+
+    def __pressure(self, group: list[Approach]) -> float:
+        pressure = 0
+        for approach in group:
+            pressure += approach.queue.stopped
+            if approach.exits:
+                pressure -= sum(queue.stopped for queue in approach.exits) / len(approach.exits)
+        return pressure
+
+
+# Names for the command line and the sweep, None keeps the fixed plan of the lights
+CONTROLLERS = {
+    "fixed": None,
+    "max-pressure": MaxPressureController,
+}
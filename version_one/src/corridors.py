@@ -0,0 +1,104 @@
+from __future__ import annotations
+from constants import ColorPhase, RoadDirections, RoadType, CAR_SPEED, OPPOSITE_DIRECTIONS
+from map import Intersection, Road
+
+# Corridors are coordinated west to east and north to south
+CORRIDOR_DIRECTIONS = (RoadDirections.EAST, RoadDirections.SOUTH)
+HORIZONTAL_SIDES = (RoadDirections.WEST, RoadDirections.EAST)
+
+
+class Corridor:
+    # The signalized intersections along a chain of road segments in one direction.
+    # distances[i] is how far a car drives from the first intersection to intersection i
+    __slots__ = ("direction", "intersections", "distances")
+
+    def __init__(self, direction: RoadDirections, intersections: list[Intersection], distances: list[float]) -> None:
+        self.direction = direction
+        self.intersections = intersections
+        self.distances = distances
+
+    def __len__(self) -> int:
+        return len(self.intersections)
+
+
+def find_corridors(roads: list[Road], direction: RoadDirections) -> list[Corridor]:
+    # Walks from every intersection without a intersection before it over the road segments to the
+    # next intersections. Intersections without traffic lights are passed, they do not stop anybody
+    corridors = []
+    for start in roads:
+        if start.road_type is not RoadType.INTERSECTION or _next_intersection(start, OPPOSITE_DIRECTIONS[direction]) is not None:
+            continue
+
+        intersections, distances = [], []
+        intersection = start
+        while intersection is not None:
+            if intersection.acitve_traffic_lights:
+                intersections.append(intersection)
+                distances.append(_distance(start, intersection, direction))
+            intersection = _next_intersection(intersection, direction)
+
+        if len(intersections) > 1:
+            corridors.append(Corridor(direction, intersections, distances))
+    return corridors
+
+
+def _next_intersection(intersection: Intersection, direction: RoadDirections) -> Intersection | None:
+    road = intersection.connected_roads.get(direction)
+    if road is None or road.road_type is RoadType.INTERSECTION:
+        return None
+    return road.downstream.get(direction)
+
+
+def _distance(start: Intersection, intersection: Intersection, direction: RoadDirections) -> float:
+    if direction in HORIZONTAL_SIDES:
+        return abs(intersection.x - start.x)
+    return abs(intersection.y - start.y)
+
+
+def green_wave(sim, phase: int | None = None, speed: float = CAR_SPEED) -> list[Corridor]:
+    # Gives every signalized intersection the same cycle of a green and a red phase and starts the green of
+    # a corridor at each intersection when the cars from the previous green arrive there (distance / speed).
+    # The longest corridors are timed first. An intersection keeps the timing of the first corridor which
+    # reaches it, a crossing corridor is timed around the intersections it shares with the earlier ones
+    phase = phase if phase is not None else sum(sim.phase_range) // 2
+    current_ticks = sim.get_ticks()
+
+    corridors = find_corridors(sim.roads, RoadDirections.EAST) + find_corridors(sim.roads, RoadDirections.SOUTH)
+    corridors.sort(key=len, reverse=True)
+
+    green_starts: dict[Intersection, tuple[bool, float]] = {} # intersection -> (horizontal green, ticks it starts)
+    for corridor in corridors:
+        horizontal = corridor.direction in HORIZONTAL_SIDES
+        travel_ticks = [distance / speed * 1000 for distance in corridor.distances]
+
+        # the first intersection which is already timed decides the start of the whole corridor
+        first_ticks = current_ticks
+        for intersection, ticks in zip(corridor.intersections, travel_ticks):
+            if intersection in green_starts:
+                first_ticks = _green_start(green_starts[intersection], horizontal, phase) - ticks
+                break
+
+        for intersection, ticks in zip(corridor.intersections, travel_ticks):
+            if intersection not in green_starts:
+                green_starts[intersection] = (horizontal, first_ticks + ticks)
+                _set_cycle(intersection, horizontal, first_ticks + ticks, phase, current_ticks)
+
+    return corridors
+
+
+def _green_start(timing: tuple[bool, float], horizontal: bool, phase: int) -> float:
+    # the crossing direction gets its green one phase after the other one
+    timed_horizontal, ticks = timing
+    return ticks if timed_horizontal == horizontal else ticks + phase * 1000
+
+
+def _set_cycle(intersection: Intersection, horizontal: bool, green_ticks: float, phase: int, current_ticks: int) -> None:
+    # Continues the cycle in which the lights of one direction turn green at green_ticks, at the current ticks
+    elapsed = (current_ticks - green_ticks) % (2 * phase * 1000)
+    corridor_green = elapsed < phase * 1000
+    start_ticks = int(current_ticks - (elapsed if corridor_green else elapsed - phase * 1000))
+
+    for side, traffic_light in intersection.acitve_traffic_lights.items():
+        green = corridor_green if (side in HORIZONTAL_SIDES) == horizontal else not corridor_green
+        starting_phase = ColorPhase.GREEN if green else ColorPhase.RED
+        traffic_light.set_information(starting_phase, phase, traffic_light.yellow_phase, phase, phase, start_ticks)
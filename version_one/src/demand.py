@@ -0,0 +1,146 @@
+from __future__ import annotations
+import json
+import numpy as np
+from constants import RoadDirections, RoadType, DIRECTION_CODES, LANE_OFFSETS, OPPOSITE_DIRECTIONS
+from map import Road
+
+
+def find_entries(roads: list[Road]) -> list[tuple[Road, RoadDirections]]:
+    # The lanes on which cars drive into the map: no intersection before them. In the order of the road list,
+    # rates and the rows of an origin destination matrix are given in this order
+    return [(road, direction) for road in roads if road.road_type is not RoadType.INTERSECTION
+            for direction in road.directions if OPPOSITE_DIRECTIONS[direction] not in road.downstream]
+
+
+def find_exits(roads: list[Road]) -> list[tuple[Road, RoadDirections]]:
+    # The lanes on which cars leave the map: no intersection after them, the columns of a origin destination matrix
+    return [(road, direction) for road in roads if road.road_type is not RoadType.INTERSECTION
+            for direction in road.directions if direction not in road.downstream]
+
+
+def entry_point(road: Road, direction: RoadDirections) -> tuple[float, float]:
+    # the start of the lane at the border of the road
+    min_x, min_y, max_x, max_y = road.bounds
+    match direction:
+        case RoadDirections.EAST:
+            return min_x, min_y + LANE_OFFSETS[direction]
+        case RoadDirections.WEST:
+            return max_x, min_y + LANE_OFFSETS[direction]
+        case RoadDirections.SOUTH:
+            return min_x + LANE_OFFSETS[direction], min_y
+        case RoadDirections.NORTH:
+            return min_x + LANE_OFFSETS[direction], max_y
+
+
+class Demand:
+    # Cars arriving at the entries of the map. Every step the arrivals of all entries are drawn at once
+    # (Poisson with the rate of the current period), they wait in the backlog of their entry until the
+    # entry lane has room: the car before drove at least the safety distance. The demand is not capped by max_cars.
+    # A period starts at the given simulated second and has a rate per entry in cars per hour, with an
+    # origin destination matrix (cars per hour from every entry to every exit) the destinations are drawn too
+    def __init__(self, sim, periods: list[tuple[float, np.ndarray, np.ndarray | None]], seed: int | None = None) -> None:
+        self.sim = sim
+        self.entries = find_entries(sim.roads)
+        self.exits = find_exits(sim.roads)
+        # without a seed of its own the stream is derived from the seed of the simulation (the child sweep.reseed
+        # uses too), it does not draw from sim.rng: a demand created after a restored snapshot changes nothing else
+        self.rng = np.random.default_rng(seed if seed is not None else np.random.SeedSequence(sim.seed).spawn(2)[1])
+        self.start_ticks = sim.get_ticks()
+
+        periods = sorted(periods, key=lambda period: period[0])
+        self.period_starts = np.array([start for start, _, _ in periods], dtype=np.float64)
+        self.rates = [np.asarray(rates, dtype=np.float64) for _, rates, _ in periods]
+        self.destinations = [self.__destination_cdf(od) for _, _, od in periods]
+        for rates in self.rates:
+            if rates.shape != (len(self.entries),):
+                raise ValueError(f"Expected a rate for each of the {len(self.entries)} entries, got {rates.shape}")
+
+        road_ids = {road: i for i, road in enumerate(sim.roads)}
+        points = np.array([entry_point(road, direction) for road, direction in self.entries], dtype=np.float64).reshape(-1, 2)
+        self.x, self.y = points[:, 0], points[:, 1]
+        self.direction = np.array([DIRECTION_CODES[direction] for _, direction in self.entries], dtype=np.int8)
+        self.road = np.array([road_ids[road] for road, _ in self.entries], dtype=np.int32)
+        self.exit_roads = np.array([road_ids[road] for road, _ in self.exits], dtype=np.int32)
+
+        # lane key (road * 4 + direction code) -> entry, to find the vehicles of the fleet on an entry lane
+        self.entry_of_lane = np.full(len(sim.roads) * 4, -1, dtype=np.int64)
+        self.entry_of_lane[self.road.astype(np.int64) * 4 + self.direction] = np.arange(len(self.entries))
+
+        self.backlog = np.zeros(len(self.entries), dtype=np.int64)
+
+    @classmethod
+    def uniform(cls, sim, rate: float) -> Demand:
+        # the same rate at every entry, the cars turn at random
+        return cls(sim, [(0, np.full(len(find_entries(sim.roads)), rate), None)])
+
+    def __destination_cdf(self, od) -> np.ndarray | None:
+        if od is None:
+            return None
+
+        od = np.asarray(od, dtype=np.float64)
+        if od.shape != (len(self.entries), len(self.exits)):
+            raise ValueError(f"Expected a {len(self.entries)}x{len(self.exits)} origin destination matrix, got {od.shape}")
+        totals = od.sum(axis=1, keepdims=True)
+        return np.cumsum(od, axis=1) / np.where(totals > 0, totals, 1)
+
+    def update(self) -> None:
+        sim = self.sim
+        period = max(0, int(np.searchsorted(self.period_starts, (sim.get_ticks() - self.start_ticks) / 1000, "right")) - 1)
+
+        self.backlog += self.rng.poisson(self.rates[period] * sim.delta_time / 3600)
+        waiting = np.flatnonzero(self.backlog)
+        if not len(waiting):
+            return
+
+        entering = waiting[self.__free(waiting)]
+        if not len(entering):
+            return
+
+        destinations = np.full(len(entering), -1, dtype=np.int32)
+        cdf = self.destinations[period]
+        if cdf is not None:
+            draw = self.rng.random(len(entering))
+            chosen = (cdf[entering] < draw[:, None]).sum(axis=1)
+            destinations = self.exit_roads[np.minimum(chosen, len(self.exits) - 1)]
+
+        self.backlog[entering] -= 1
+        sim.add_cars(self.x[entering], self.y[entering], self.direction[entering], self.road[entering], destinations)
+
+    def __free(self, entries: np.ndarray) -> np.ndarray:
+        # Which of the entries have no car closer than the safety distance to their start
+        sim = self.sim
+        occupied = np.zeros(len(self.entries), dtype=np.bool_)
+
+        if sim.fleet is not None:
+            state = sim.fleet.state
+            lane = sim.fleet.lanes()
+            slots = np.flatnonzero(lane >= 0)
+            entry = self.entry_of_lane[lane[slots]]
+            slots, entry = slots[entry >= 0], entry[entry >= 0]
+            distance = np.abs(state.x[slots] - self.x[entry]) + np.abs(state.y[slots] - self.y[entry])
+            occupied[entry[distance < sim.safety_distance]] = True
+        else:
+            # the last car of the lane is the one closest to its start
+            lanes = sim.lanes
+            for i in entries.tolist():
+                road, direction = self.entries[i]
+                back = lanes.lane(road, direction).back
+                if back is not None and abs(back.x - self.x[i]) + abs(back.y - self.y[i]) < sim.safety_distance:
+                    occupied[i] = True
+
+        return ~occupied[entries]
+
+
+def load_demand(path: str, sim) -> Demand:
+    # A json file with a list of periods, a period has the simulated second it starts at ("from") and either
+    # "rates" (cars per hour for each entry) or "od" (cars per hour from each entry to each exit):
+    # {"periods": [{"from": 0, "rates": [600, 300, ...]}, {"from": 900, "od": [[...], ...]}]}
+    with open(path) as file:
+        data = json.load(file)
+
+    periods = []
+    for period in data["periods"]:
+        od = period.get("od")
+        rates = np.asarray(od, dtype=np.float64).sum(axis=1) if od is not None else period["rates"]
+        periods.append((period.get("from", 0), rates, od))
+    return Demand(sim, periods, data.get("seed"))
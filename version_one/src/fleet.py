@@ -0,0 +1,701 @@
+from __future__ import annotations
+import numpy as np
+import pygame
+import assets
+from car_following import DriverParameters, STOP_SPEED, distance_to_stop, idm_acceleration, integrate, stops_for_light
+from constants import ColorPhase, EventKind, RoadDirections, RoadType, CAR_LENGTH, CAR_SPEED, DIRECTIONS, DIRECTION_CODES, ROAD_SAFETY_DISTANCE, STOP_WINDOW
+from map import Road, TrafficLight
+from profiler import PROFILER
+from routing import Router
+from time import perf_counter
+
+NO_DIRECTION = -1
+
+# More than the progress of a vehicle on any map, lane * PROGRESS_SPAN + progress sorts like the lane and the progress
+PROGRESS_SPAN = 1e6
+
+# Unit step in x and y for every direction code
+STEP_X = np.array([0, 1, 0, -1], dtype=np.float64)
+STEP_Y = np.array([-1, 0, 1, 0], dtype=np.float64)
+
+# How far in front of the car the stop line is checked (same values as CarLogic.__stop_line_distance)
+STOP_OFFSETS = {
+    RoadDirections.NORTH: ROAD_SAFETY_DISTANCE / 2,
+    RoadDirections.EAST: -ROAD_SAFETY_DISTANCE,
+    RoadDirections.SOUTH: -ROAD_SAFETY_DISTANCE,
+    RoadDirections.WEST: ROAD_SAFETY_DISTANCE / 2,
+}
+
+
+class VehicleState:
+    # Structure of arrays: one array per field, one slot per vehicle
+    FIELDS = (
+        ("id", np.int64),
+        ("x", np.float64),
+        ("y", np.float64),
+        ("speed", np.float64),
+        ("direction", np.int8),
+        ("next_direction", np.int8),
+        ("road", np.int32),
+        ("destination", np.int32), # road the vehicle wants to leave the map on, -1 for none
+        # the driver of the car following model, see car_following.DriverParameters
+        ("desired_speed", np.float32),
+        ("max_acceleration", np.float32),
+        ("comfort_deceleration", np.float32),
+        ("time_headway", np.float32),
+        ("min_gap", np.float32),
+        ("driving", np.bool_),
+        ("alive", np.bool_),
+    )
+    
+    def __init__(self, capacity: int = 1024, buffer=None) -> None:
+        self.capacity: int = capacity
+        self.size: int = 0 # every slot below size was used once
+        self.shared: bool = buffer is not None
+        
+        # With a buffer (e.g. shared memory) the arrays are views on it, one after another
+        offset = 0
+        for name, dtype in self.FIELDS:
+            if buffer is None:
+                setattr(self, name, np.zeros(capacity, dtype=dtype))
+                continue
+            
+            setattr(self, name, np.ndarray(capacity, dtype=dtype, buffer=buffer, offset=offset))
+            offset += _aligned(capacity * np.dtype(dtype).itemsize)
+    
+    @classmethod
+    def nbytes(cls, capacity: int) -> int:
+        # size of the buffer the arrays of a state with this capacity need
+        return sum(_aligned(capacity * np.dtype(dtype).itemsize) for _, dtype in cls.FIELDS)
+    
+    def grow(self, capacity: int) -> None:
+        if self.shared:
+            raise RuntimeError(f"The shared vehicle state is full ({self.capacity} vehicles)")
+        
+        for name, dtype in self.FIELDS:
+            array = np.zeros(capacity, dtype=dtype)
+            array[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, array)
+        
+        self.capacity = capacity
+
+
+def _aligned(nbytes: int) -> int:
+    return (nbytes + 7) // 8 * 8
+
+
+class RoadTable:
+    # Everything the fleet needs to know about the map as flat arrays.
+    # A lane is a road and a driving direction, its key is road * 4 + direction code
+    def __init__(self, roads: list[Road], traffic_lights: list[TrafficLight], cell_size: float = 100) -> None:
+        self.roads = roads
+        self.road_ids: dict[Road, int] = {road: i for i, road in enumerate(roads)}
+        self.light_ids = light_ids = {traffic_light: i for i, traffic_light in enumerate(traffic_lights)}
+        
+        self.bounds = np.array([road.bounds for road in roads], dtype=np.float64).reshape(-1, 4)
+        self.horizontal = np.array([road.road_type is RoadType.HORIZONTAL for road in roads], dtype=np.bool_)
+        
+        lanes = len(roads) * 4
+        self.light = np.full(lanes, -1, dtype=np.int32)
+        self.stop_line = np.zeros(lanes, dtype=np.float64)
+        self.next_intersection = np.full(lanes, -1, dtype=np.int32)
+        self.turn_options = np.full((lanes, 4), NO_DIRECTION, dtype=np.int8)
+        self.turn_counts = np.zeros(lanes, dtype=np.int8)
+        self.turn_points = np.full((lanes, 4, 2), np.nan, dtype=np.float64)
+        self.turn_lanes = np.full((lanes, 4), -1, dtype=np.int64) # the lane behind the next intersection for every turn
+        self.storage = np.zeros(lanes, dtype=np.float64) # length of the lane in which the cars queue up, see Lane.room
+        
+        for road_id, road in enumerate(roads):
+            if road.road_type is RoadType.INTERSECTION:
+                continue
+            
+            self.storage[road_id * 4:road_id * 4 + 4] = road.length - ROAD_SAFETY_DISTANCE
+            
+            for direction, intersection in road.downstream.items():
+                lane = road_id * 4 + DIRECTION_CODES[direction]
+                self.stop_line[lane] = self.__stop_line(road, direction) # a car also waits there for room behind the intersection
+                self.__set_turns(lane, road, direction, intersection)
+            
+            for direction, traffic_light in road.traffic_light.items():
+                lane = road_id * 4 + DIRECTION_CODES[direction]
+                self.light[lane] = light_ids[traffic_light]
+                self.stop_line[lane] = self.__stop_line(road, direction)
+        
+        self.__build_grid(cell_size)
+    
+    def __stop_line(self, road: Road, direction: RoadDirections) -> float:
+        match direction:
+            case RoadDirections.EAST:
+                street_end = road.street_end(RoadDirections.EAST)[0]
+            case RoadDirections.SOUTH:
+                street_end = road.street_end(RoadDirections.SOUTH)[1]
+            case RoadDirections.WEST:
+                street_end = road.x
+            case RoadDirections.NORTH:
+                street_end = road.y
+        
+        return street_end + STOP_OFFSETS[direction]
+    
+    def __set_turns(self, lane: int, road: Road, direction: RoadDirections, intersection: Road) -> None:
+        # The routing table of the intersection at the end of the lane
+        route = intersection.get_route(direction, road)
+        if route is None or not route.turns:
+            return
+        
+        self.next_intersection[lane] = self.road_ids[intersection]
+        
+        for i, turn in enumerate(route.turns):
+            self.turn_options[lane, i] = DIRECTION_CODES[turn]
+        
+        for turn, turn_point in route.turn_points.items():
+            self.turn_points[lane, DIRECTION_CODES[turn]] = turn_point
+        
+        for turn, road in route.roads.items():
+            self.turn_lanes[lane, DIRECTION_CODES[turn]] = self.road_ids[road] * 4 + DIRECTION_CODES[turn]
+        
+        self.turn_counts[lane] = len(route.turns)
+    
+    def __build_grid(self, cell_size: float) -> None:
+        # Same grid as the RoadIndex, but as a padded array: cell -> roads, in the order of the road list
+        self.cell_size = cell_size
+        roads = [i for i, road in enumerate(self.roads) if road.road_type is not RoadType.INTERSECTION]
+        
+        if not roads:
+            self.grid_origin = np.zeros(2)
+            self.grid_shape = (1, 1)
+            self.cell_roads = np.full((1, 1), -1, dtype=np.int32)
+            return
+        
+        cells = np.floor(self.bounds[roads] / cell_size).astype(np.int64)
+        min_cell = cells[:, :2].min(axis=0)
+        max_cell = cells[:, 2:].max(axis=0)
+        self.grid_origin = min_cell
+        self.grid_shape = tuple(max_cell - min_cell + 1)
+        
+        # one entry for every cell a road overlaps, in road order and per road column by column
+        cells = cells - np.tile(min_cell, 2)
+        rows = cells[:, 3] - cells[:, 1] + 1
+        counts = (cells[:, 2] - cells[:, 0] + 1) * rows
+        entry = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cell_x = np.repeat(cells[:, 0], counts) + entry // np.repeat(rows, counts)
+        cell_y = np.repeat(cells[:, 1], counts) + entry % np.repeat(rows, counts)
+        
+        # a stable sort by cell keeps the roads of a cell in the order of the road list
+        cell = cell_x * self.grid_shape[1] + cell_y
+        order = np.argsort(cell, kind="stable")
+        cell, road_ids = cell[order], np.repeat(roads, counts)[order]
+        depth = np.arange(len(cell)) - np.searchsorted(cell, cell)
+        
+        self.cell_roads = np.full((self.grid_shape[0] * self.grid_shape[1], depth.max() + 1), -1, dtype=np.int32)
+        self.cell_roads[cell, depth] = road_ids
+    
+    def roads_at(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        # Vectorized RoadIndex.road_at: the first road of the cell which contains the point, -1 for none
+        cell_x = np.floor(x / self.cell_size).astype(np.int64) - self.grid_origin[0]
+        cell_y = np.floor(y / self.cell_size).astype(np.int64) - self.grid_origin[1]
+        in_grid = (cell_x >= 0) & (cell_x < self.grid_shape[0]) & (cell_y >= 0) & (cell_y < self.grid_shape[1])
+        
+        candidates = self.cell_roads[np.where(in_grid, cell_x * self.grid_shape[1] + cell_y, 0)]
+        bounds = self.bounds[candidates]
+        inside = ((candidates >= 0) & in_grid[:, None]
+                  & (bounds[..., 0] <= x[:, None]) & (x[:, None] <= bounds[..., 2])
+                  & (bounds[..., 1] <= y[:, None]) & (y[:, None] <= bounds[..., 3]))
+        
+        first = inside.argmax(axis=1)
+        return np.where(inside.any(axis=1), candidates[np.arange(len(x)), first], -1)
+    
+    def on_road(self, road: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        bounds = self.bounds[road]
+        return (road >= 0) & (bounds[:, 0] <= x) & (x <= bounds[:, 2]) & (bounds[:, 1] <= y) & (y <= bounds[:, 3])
+
+
+class Fleet:
+    # Alternative to the per object Car engine: all vehicles live in a VehicleState and the
+    # whole fleet is advanced with one batched update per tick
+    def __init__(self, roads: list[Road], traffic_lights: list[TrafficLight], seed: int | None = None, screen=None, capacity: int = 1024) -> None:
+        self.table = RoadTable(roads, traffic_lights)
+        self.traffic_lights = traffic_lights
+        self.state = VehicleState(capacity)
+        self.rng = np.random.default_rng(seed)
+        self.screen = screen
+        
+        # Which traffic lights are not green, one extra entry for the index -1, which stands for no traffic light
+        self.waiting = np.zeros(len(traffic_lights) + 1, dtype=np.bool_)
+        self.update_signals(traffic_lights)
+        
+        self.safety_distance: float = 60
+        self.speed: float = CAR_SPEED
+        self.count: int = 0
+        self._id_counter: int = 0
+        self.free_slots: list[int] = [] # slots of removed vehicles, reused before the state grows
+        self.queues = np.zeros(len(roads) * 4, dtype=np.int64) # standing vehicles per lane, see count_queues
+        self.router: Router | None = None # next hop tables for the vehicles with a destination
+        
+        # "stop-and-go" drives at speed or stands, "idm" accelerates and brakes with the intelligent driver model.
+        # The desired speed and time headway of the drivers are varied by up to driver_variation (e.g. 0.1 = 10 %)
+        self.car_following: str = "stop-and-go"
+        self.driver = DriverParameters()
+        self.driver_variation: float = 0
+        
+        # Called with a batch of events: kind, vehicle ids, x, y and a value per event
+        self.on_event = None
+    
+    def spawn(self, x: float, y: float, direction: RoadDirections) -> int:
+        state = self.state
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            if state.size == state.capacity:
+                state.grow(state.capacity * 2)
+            slot = state.size
+            state.size += 1
+        self._id_counter += 1
+        
+        state.id[slot] = self._id_counter
+        state.x[slot] = x
+        state.y[slot] = y
+        self.__set_drivers(np.array([slot]))
+        state.direction[slot] = DIRECTION_CODES[direction]
+        state.next_direction[slot] = NO_DIRECTION
+        state.road[slot] = -1
+        state.destination[slot] = -1
+        state.driving[slot] = False
+        state.alive[slot] = True
+        self.count += 1
+        return slot
+    
+    def spawn_batch(self, x: np.ndarray, y: np.ndarray, direction: np.ndarray, road: np.ndarray, destination: np.ndarray) -> np.ndarray:
+        # Many vehicles at once, already placed on their road (direction codes and road ids).
+        # Free slots are used first, in the same order as spawn would use them. Returns the slots
+        count = len(x)
+        state = self.state
+        
+        reused = min(count, len(self.free_slots))
+        slots = np.empty(count, dtype=np.int64)
+        if reused:
+            slots[:reused] = self.free_slots[:-reused - 1:-1]
+            del self.free_slots[-reused:]
+        
+        new = count - reused
+        if state.size + new > state.capacity:
+            state.grow(max(state.capacity * 2, state.size + new))
+        slots[reused:] = np.arange(state.size, state.size + new)
+        state.size += new
+        
+        state.id[slots] = np.arange(self._id_counter + 1, self._id_counter + 1 + count)
+        self._id_counter += count
+        state.x[slots] = x
+        state.y[slots] = y
+        self.__set_drivers(slots)
+        state.direction[slots] = direction
+        state.next_direction[slots] = NO_DIRECTION
+        state.road[slots] = road
+        state.destination[slots] = destination
+        state.driving[slots] = False
+        state.alive[slots] = True
+        self.count += count
+        return slots
+    
+    def __set_drivers(self, slots: np.ndarray) -> None:
+        # with the car following model a new vehicle enters at the desired speed of its driver
+        state, driver = self.state, self.driver
+        speed_factor = headway_factor = 1.0
+        if self.car_following == "idm" and self.driver_variation:
+            speed_factor, headway_factor = 1 + self.driver_variation * (2 * self.rng.random((2, len(slots))) - 1)
+        
+        state.desired_speed[slots] = driver.desired_speed * speed_factor
+        state.max_acceleration[slots] = driver.max_acceleration
+        state.comfort_deceleration[slots] = driver.comfort_deceleration
+        state.time_headway[slots] = driver.time_headway * headway_factor
+        state.min_gap[slots] = driver.min_gap
+        state.speed[slots] = state.desired_speed[slots] if self.car_following == "idm" else self.speed
+    
+    def change_car_following(self, car_following: str) -> None:
+        # Switches the model of the vehicles on the map: with the idm the driving vehicles go on at their desired
+        # speed and the others stand, with stop and go every vehicle has the speed of the fleet
+        self.car_following = car_following
+        state = self.state
+        n = state.size
+        if car_following == "idm":
+            state.speed[:n] = np.where(state.driving[:n], state.desired_speed[:n], 0.0)
+        else:
+            state.speed[:n] = self.speed
+    
+    def step(self, delta_time: float) -> None:
+        start = perf_counter()
+        self.locate()
+        start = PROFILER.lap("fleet.road_lookup", start)
+        self.advance(delta_time)
+        PROFILER.lap("fleet.advance", start)
+    
+    def locate(self, owned: np.ndarray | None = None) -> np.ndarray:
+        # Road lookup: only for vehicles which left the rectangle of their road.
+        # With owned only those vehicles are touched, returns the slots which entered a new road
+        state, table = self.state, self.table
+        n = state.size
+        alive = state.alive[:n] if owned is None else state.alive[:n] & owned
+        x, y = state.x[:n], state.y[:n]
+        road = state.road[:n]
+        
+        lookup = np.flatnonzero(alive & ~table.on_road(road, x, y))
+        if not len(lookup):
+            return lookup
+        
+        found = table.roads_at(x[lookup], y[lookup])
+        entered = lookup[found >= 0]
+        road[entered] = found[found >= 0]
+        state.next_direction[entered] = NO_DIRECTION # a new road means a new decision
+        return entered
+    
+    def advance(self, delta_time: float, owned: np.ndarray | None = None) -> None:
+        # Moves the vehicles on their current roads. With owned only those vehicles are moved and
+        # written, so several processes can advance disjoint vehicles of the same shared state
+        state, table = self.state, self.table
+        n = state.size
+        alive = state.alive[:n] if owned is None else state.alive[:n] & owned
+        x, y = state.x[:n], state.y[:n]
+        direction = state.direction[:n].astype(np.int64)
+        road = state.road[:n]
+        on_road = table.on_road(road, x, y)
+        
+        has_road = alive & (road >= 0)
+        lane = np.where(has_road, road.astype(np.int64) * 4 + direction, -1)
+        
+        if self.car_following == "idm":
+            speed, distance, at_light = self.__follow(lane, has_road, x, y, direction, delta_time)
+            moving = alive & has_road
+            speed = np.where(moving, speed, state.speed[:n])
+            driving = moving & (speed > STOP_SPEED)
+            stopped = at_light & ~driving
+        else:
+            blocked = self.__blocked_by_leader(lane, x, y, road)
+            stopped = self.__stopped_at_light(lane, has_road, x, y, direction)
+            moving = driving = alive & ~blocked & ~stopped
+            speed, distance = state.speed[:n], state.speed[:n] * delta_time
+        
+        if self.on_event is not None:
+            self.__emit(EventKind.STOP_AT_RED, np.flatnonzero(stopped & state.driving[:n]), state.direction)
+        
+        self.__choose_next_direction(lane, moving & on_road & (road >= 0))
+        self.__turn(lane, moving & has_road, x, y)
+        
+        # Straight motion in the (possibly new) direction, a vehicle without a road does not move
+        direction = state.direction[:n].astype(np.int64)
+        distance = np.where(moving & has_road, distance, 0.0)
+        if owned is None:
+            x += STEP_X[direction] * distance
+            y += STEP_Y[direction] * distance
+            state.driving[:n] = driving
+            state.speed[:n] = speed
+            return
+        
+        index = np.flatnonzero(owned)
+        x[index] += STEP_X[direction[index]] * distance[index]
+        y[index] += STEP_Y[direction[index]] * distance[index]
+        state.driving[index] = driving[index]
+        state.speed[index] = speed[index]
+    
+    def find_leaders(self, lane: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # Sort by lane and progress in the driving direction, the leader is the next vehicle of the same lane.
+        # Returns the slots of all vehicles with a leader and the slots of their leaders
+        # Only vehicles on a lane are sorted, e.g. a partition worker sorts just its own vehicles
+        slots, lane = self.sort_lanes(lane)
+        same_lane = lane[:-1] == lane[1:]
+        return slots[:-1][same_lane], slots[1:][same_lane]
+    
+    def sort_lanes(self, lane: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # The slots of the vehicles on a lane ordered by lane and from the back to the front, with their lanes
+        state = self.state
+        slots = np.flatnonzero(lane >= 0)
+        lane = lane[slots]
+        direction = state.direction[slots].astype(np.int64)
+        progress = state.x[slots] * STEP_X[direction] + state.y[slots] * STEP_Y[direction]
+        order = np.lexsort((progress, lane))
+        return slots[order], lane[order]
+    
+    def lanes(self) -> np.ndarray:
+        # lane key of every slot, -1 for vehicles without a road
+        state = self.state
+        n = state.size
+        road = state.road[:n]
+        return np.where(state.alive[:n] & (road >= 0), road.astype(np.int64) * 4 + state.direction[:n], -1)
+    
+    def count_queues(self) -> None:
+        # The standing vehicles of every lane in one pass over the fleet, e.g. for the signal controllers
+        state = self.state
+        lane = self.lanes()
+        stopped = (lane >= 0) & ~state.driving[:state.size]
+        self.queues = np.bincount(lane[stopped], minlength=len(self.table.roads) * 4)
+    
+    def __blocked_by_leader(self, lane: np.ndarray, x: np.ndarray, y: np.ndarray, road: np.ndarray) -> np.ndarray:
+        follower, leader = self.find_leaders(lane)
+        
+        horizontal = self.table.horizontal[road[follower]]
+        gap = np.where(horizontal, np.abs(x[leader] - x[follower]), np.abs(y[leader] - y[follower]))
+        
+        blocked = np.zeros(len(lane), dtype=np.bool_)
+        blocked[follower] = ~self.state.driving[leader] & (gap < self.safety_distance)
+        return blocked
+    
+    def __follow(self, lane: np.ndarray, has_road: np.ndarray, x: np.ndarray, y: np.ndarray, direction: np.ndarray,
+                 delta_time: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # The intelligent driver model for all vehicles at once. The leaders come from the sort by lane and progress,
+        # a red or yellow light is a standing vehicle in the stop window for the vehicles which can still stop before it,
+        # so is a lane behind the intersection without room (see CarLogic.__exit_blocked).
+        # Returns the new speeds, the distances to drive and which vehicles brake for a light
+        state, table = self.state, self.table
+        n = len(lane)
+        speed = state.speed[:n]
+        drivers = (state.desired_speed[:n], state.max_acceleration[:n], state.comfort_deceleration[:n], state.time_headway[:n],
+                   state.min_gap[:n])
+        
+        counts = np.bincount(lane[lane >= 0], minlength=len(table.storage))
+        blocked = self.__exit_blocked(lane, direction, counts)
+        waiting = np.flatnonzero(blocked & ~state.driving[:n] & (state.next_direction[:n] != NO_DIRECTION) & table.on_road(state.road[:n], x, y))
+        if len(waiting):
+            self.__divert(waiting, lane, counts)
+            blocked = self.__exit_blocked(lane, direction, counts)
+        
+        gap = np.full(n, np.inf)
+        leader_speed = speed.copy()
+        follower, leader, distance = self.__chain_lanes(lane, x, y, direction)
+        # two vehicles which came into a lane at the same time can overlap, the one behind waits until it has room
+        gap[follower] = np.maximum(distance - CAR_LENGTH, 0.0)
+        leader_speed[follower] = speed[leader]
+        acceleration = idm_acceleration(speed, gap, leader_speed, *drivers)
+        
+        light = np.where(has_road, table.light[lane], -1)
+        position = np.where(STEP_X[direction] != 0, x, y)
+        remaining = distance_to_stop(table.stop_line[lane] - position, STEP_X[direction] + STEP_Y[direction] > 0)
+        red = (light >= 0) & self.waiting[light]
+        stopping = stops_for_light(speed, remaining)
+        at_light = red & stopping
+        
+        braking = np.flatnonzero(at_light | (~red & blocked & stopping))
+        if len(braking):
+            driver = tuple(values[braking] for values in drivers)
+            for_light = idm_acceleration(speed[braking], remaining[braking] + driver[4], 0.0, *driver)
+            acceleration[braking] = np.minimum(acceleration[braking], for_light)
+            gap[braking] = np.minimum(gap[braking], remaining[braking])
+        
+        speed, distance = integrate(speed, acceleration, delta_time, gap)
+        return speed, distance, at_light
+    
+    def __chain_lanes(self, lane: np.ndarray, x: np.ndarray, y: np.ndarray, direction: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Like find_leaders, but the front vehicle of a lane follows the lane it turns into behind the intersection,
+        # so a queue which reaches back to the intersection stops the vehicles before it. Like CarLogic.__back_of_next_lane
+        # its leader is the last vehicle of that lane which is not more than half a car behind the turn point and the
+        # distance is the way over the turn point. Returns the followers, their leaders and the distances to them
+        table = self.table
+        slots, sorted_lanes = self.sort_lanes(lane)
+        if not len(slots):
+            return slots, slots, np.zeros(0)
+        
+        same_lane = sorted_lanes[:-1] == sorted_lanes[1:]
+        follower, leader = slots[:-1][same_lane], slots[1:][same_lane]
+        forward = direction[follower]
+        distance = (x[leader] - x[follower]) * STEP_X[forward] + (y[leader] - y[follower]) * STEP_Y[forward]
+        
+        front = np.concatenate((~same_lane, [True]))
+        front_lanes, front = sorted_lanes[front], slots[front]
+        forward = direction[front]
+        next_direction = self.state.next_direction[front].astype(np.int64)
+        turn = np.where(next_direction >= 0, next_direction, forward)
+        next_lane = table.turn_lanes[front_lanes, turn]
+        
+        turning = turn != forward
+        turn_point = table.turn_points[front_lanes, turn]
+        merge_x = np.where(turning, turn_point[:, 0], x[front])
+        merge_y = np.where(turning, turn_point[:, 1], y[front])
+        
+        # the first vehicle of the next lane at or in front of the merge point, less half a car
+        progress = x[slots] * STEP_X[direction[slots]] + y[slots] * STEP_Y[direction[slots]]
+        merge = merge_x * STEP_X[turn] + merge_y * STEP_Y[turn] - CAR_LENGTH / 2
+        index = np.searchsorted(sorted_lanes * PROGRESS_SPAN + progress, next_lane * PROGRESS_SPAN + merge)
+        index = np.minimum(index, len(slots) - 1)
+        found = (next_lane >= 0) & (sorted_lanes[index] == next_lane)
+        
+        front, behind, forward, turn = front[found], slots[index[found]], forward[found], turn[found]
+        merge_x, merge_y = merge_x[found], merge_y[found]
+        merge_distance = ((merge_x - x[front]) * STEP_X[forward] + (merge_y - y[front]) * STEP_Y[forward]
+                          + (x[behind] - merge_x) * STEP_X[turn] + (y[behind] - merge_y) * STEP_Y[turn])
+        return np.concatenate((follower, front)), np.concatenate((leader, behind)), np.concatenate((distance, merge_distance))
+    
+    def __exit_blocked(self, lane: np.ndarray, direction: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        # Which vehicles have no room in the lane they turn into (see CarLogic.__exit_blocked), straight on until they chose
+        state, table = self.state, self.table
+        n = len(lane)
+        next_direction = state.next_direction[:n].astype(np.int64)
+        turn = np.where(next_direction >= 0, next_direction, direction)
+        next_lane = np.where(lane >= 0, table.turn_lanes[np.maximum(lane, 0), turn], -1)
+        return (next_lane >= 0) & self.__no_room(next_lane, state.min_gap[:n], counts)
+    
+    def __no_room(self, lane: np.ndarray, min_gap: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        # the vehicles of the lane would fill it up to less than a car length when they stand in a queue, see Lane.room
+        return self.table.storage[lane] - counts[lane] * (CAR_LENGTH + min_gap) < CAR_LENGTH
+    
+    def __divert(self, slots: np.ndarray, lane: np.ndarray, counts: np.ndarray) -> None:
+        # The standing vehicles which wait for a full lane take another turn with room, picked at random
+        state, table = self.state, self.table
+        options = table.turn_options[lane[slots]].astype(np.int64)
+        next_lanes = np.where(options >= 0, table.turn_lanes[lane[slots][:, None], np.maximum(options, 0)], -1)
+        free = (next_lanes >= 0) & ~self.__no_room(next_lanes, state.min_gap[slots][:, None], counts)
+        
+        count = free.sum(axis=1)
+        choice = (self.rng.random(len(slots)) * count).astype(np.int64)
+        pick = np.argmax(np.cumsum(free, axis=1) > choice[:, None], axis=1)
+        diverted = count > 0
+        state.next_direction[slots[diverted]] = options[diverted, pick[diverted]]
+    
+    def __stopped_at_light(self, lane: np.ndarray, has_road: np.ndarray, x: np.ndarray, y: np.ndarray, direction: np.ndarray) -> np.ndarray:
+        light = np.where(has_road, self.table.light[lane], -1)
+        waiting = self.waiting
+        
+        position = np.where(STEP_X[direction] != 0, x, y)
+        distance = self.table.stop_line[lane] - position
+        return (light >= 0) & waiting[light] & (distance >= STOP_WINDOW[0]) & (distance <= STOP_WINDOW[1])
+    
+    def update_signals(self, traffic_lights: list[TrafficLight]) -> None:
+        # only called with the lights which changed their color
+        for traffic_light in traffic_lights:
+            self.waiting[self.table.light_ids[traffic_light]] = traffic_light.color_phase is not ColorPhase.GREEN
+    
+    def __choose_next_direction(self, lane: np.ndarray, deciding: np.ndarray) -> None:
+        # Vehicles decide once per road, picking one of the possible turns at random.
+        # With a router the vehicles with a destination take the turn of its next hop table instead
+        state = self.state
+        deciding &= state.next_direction[:len(lane)] == NO_DIRECTION
+        deciding &= self.table.turn_counts[np.maximum(lane, 0)] > 0
+        
+        index = np.flatnonzero(deciding)
+        if not len(index):
+            return
+        
+        counts = self.table.turn_counts[lane[index]]
+        choice = (self.rng.random(len(index)) * counts).astype(np.int64)
+        state.next_direction[index] = self.table.turn_options[lane[index], choice]
+        
+        if self.router is not None:
+            self.__route(index, lane[index])
+    
+    def __route(self, index: np.ndarray, lane: np.ndarray) -> None:
+        # one table lookup per vehicle, the vehicles are grouped by destination
+        state = self.state
+        destination = state.destination[index]
+        routed = destination >= 0
+        for road in np.unique(destination[routed]).tolist():
+            chosen = np.flatnonzero(routed & (destination == road))
+            turn = self.router.table(road)[lane[chosen]]
+            found = turn != NO_DIRECTION
+            state.next_direction[index[chosen[found]]] = turn[found]
+    
+    def __turn(self, lane: np.ndarray, moving: np.ndarray, x: np.ndarray, y: np.ndarray) -> None:
+        # Only vehicles inside the next intersection of their lane can turn. With the intelligent driver model a vehicle
+        # is in the lane of the road behind the intersection as soon as it turned or drives straight over it (see
+        # CarLogic.__enter_lane), straight on once it left its road, roads and intersections overlap by a few pixels
+        state, table = self.state, self.table
+        intersection = np.where(moving, table.next_intersection[np.maximum(lane, 0)], -1)
+        candidates = np.flatnonzero(table.on_road(intersection, x, y))
+        if not len(candidates):
+            return
+        
+        next_direction = state.next_direction[candidates].astype(np.int64)
+        turn_points = table.turn_points[lane[candidates], np.maximum(next_direction, 0)]
+        at_turn = ((next_direction >= 0)
+                   & (np.abs(turn_points[:, 0] - x[candidates]) <= 3)
+                   & (np.abs(turn_points[:, 1] - y[candidates]) <= 3))
+        
+        turning = candidates[at_turn]
+        state.direction[turning] = state.next_direction[turning]
+        state.next_direction[turning] = NO_DIRECTION
+        
+        if self.car_following == "idm":
+            straight = ((next_direction == NO_DIRECTION) | (next_direction == state.direction[candidates])) & ~at_turn
+            straight = candidates[straight & ~table.on_road(state.road[candidates], x[candidates], y[candidates])]
+            state.next_direction[straight] = NO_DIRECTION
+            
+            entering = np.concatenate((turning, straight))
+            next_lane = table.turn_lanes[lane[entering], state.direction[entering]]
+            state.road[entering[next_lane >= 0]] = next_lane[next_lane >= 0] // 4
+        
+        if self.on_event is not None:
+            self.__emit(EventKind.TURN, turning, state.direction)
+    
+    def __emit(self, kind: EventKind, slots: np.ndarray, values: np.ndarray) -> None:
+        if len(slots):
+            state = self.state
+            self.on_event(kind, state.id[slots], state.x[slots], state.y[slots], values[slots])
+    
+    def remove_outside(self, width: int, height: int) -> np.ndarray:
+        # returns the slots of the removed vehicles
+        state = self.state
+        n = state.size
+        x, y = state.x[:n], state.y[:n]
+        outside = state.alive[:n] & ((x > width) | (y > height) | (x < -10) | (y < -10))
+        
+        state.alive[:n] &= ~outside
+        state.road[:n][outside] = -1
+        removed = np.flatnonzero(outside)
+        self.count -= len(removed)
+        self.free_slots.extend(removed.tolist())
+        return removed
+    
+    def cars(self) -> list[FleetCar]:
+        return [FleetCar(self, slot) for slot in np.flatnonzero(self.state.alive[:self.state.size])]
+    
+    def draw_vehicle(self, slot: int) -> pygame.Rect:
+        sprite = assets.car_sprite(DIRECTIONS[self.state.direction[slot]])
+        return self.screen.blit(sprite, (self.state.x[slot], self.state.y[slot]))
+
+
+class LaneQueue:
+    # The standing vehicles of one lane of a Fleet, read like Lane.stopped
+    __slots__ = ("fleet", "lane")
+    
+    def __init__(self, fleet: Fleet, lane: int) -> None:
+        self.fleet = fleet
+        self.lane = lane
+    
+    @property
+    def stopped(self) -> int:
+        return int(self.fleet.queues[self.lane])
+
+
+class FleetCar:
+    # Thin view on one vehicle of a Fleet with the read API of a Car
+    __slots__ = ("fleet", "slot")
+    
+    def __init__(self, fleet: Fleet, slot: int) -> None:
+        self.fleet = fleet
+        self.slot = slot
+    
+    def draw(self) -> pygame.Rect:
+        return self.fleet.draw_vehicle(self.slot)
+    
+    def deleteable(self, width: int, height: int) -> bool:
+        x, y = self.coordinates
+        return x > width or y > height or x < -10 or y < -10
+    
+    @property
+    def id(self) -> int:
+        return int(self.fleet.state.id[self.slot])
+    
+    @property
+    def x(self) -> float:
+        return float(self.fleet.state.x[self.slot])
+    
+    @property
+    def y(self) -> float:
+        return float(self.fleet.state.y[self.slot])
+    
+    @property
+    def coordinates(self) -> tuple[float, float]:
+        return (self.x, self.y)
+    
+    @property
+    def driving_status(self) -> bool:
+        return bool(self.fleet.state.driving[self.slot])
+    
+    @property
+    def driving_direction(self) -> RoadDirections:
+        return DIRECTIONS[self.fleet.state.direction[self.slot]]
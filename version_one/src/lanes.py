@@ -0,0 +1,130 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from constants import RoadDirections, ROAD_SAFETY_DISTANCE
+from map import Road
+
+if TYPE_CHECKING:
+    from verhicles import CarLogic
+
+
+class Lane:
+    # All cars on one road driving in one direction, ordered from the front to the back.
+    # The cars are chained with their leader and follower, so finding the car in front is a
+    # pointer lookup instead of a search over all cars
+    def __init__(self, road: Road, direction: RoadDirections) -> None:
+        self.road = road
+        self.direction = direction
+        self.front: CarLogic | None = None
+        self.back: CarLogic | None = None
+        self.size: int = 0
+        self.stopped: int = 0 # standing cars, kept up to date by the cars (e.g. the queue in front of a traffic light)
+
+    def progress(self, car: CarLogic) -> float:
+        # how far the car got in the driving direction, a bigger value is further in the front
+        match self.direction:
+            case RoadDirections.EAST:
+                return car.x
+            case RoadDirections.WEST:
+                return -car.x
+            case RoadDirections.SOUTH:
+                return car.y
+            case RoadDirections.NORTH:
+                return -car.y
+    
+    def room(self, spacing: float) -> float:
+        # The length of the road which is left for one more car when the cars of the lane stand in a queue in front
+        # of the stop line, spacing apart. The cars which already drive over the intersection before the road count too
+        return self.road.length - ROAD_SAFETY_DISTANCE - self.size * spacing
+    
+    def insert(self, car: CarLogic) -> None:
+        # New cars nearly always enter at the back, so the search starts there
+        progress = self.progress(car)
+        follower = None
+        leader = self.back
+        
+        while leader is not None and self.progress(leader) < progress:
+            follower = leader
+            leader = leader.leader
+        
+        car.leader, car.follower = leader, follower
+        
+        if leader is None:
+            self.front = car
+        else:
+            leader.follower = car
+        
+        if follower is None:
+            self.back = car
+        else:
+            follower.leader = car
+        
+        car.lane = self
+        self.size += 1
+        if not car.driving:
+            self.stopped += 1
+    
+    def remove(self, car: CarLogic) -> None:
+        if car.leader is None:
+            self.front = car.follower
+        else:
+            car.leader.follower = car.follower
+        
+        if car.follower is None:
+            self.back = car.leader
+        else:
+            car.follower.leader = car.leader
+        
+        car.leader, car.follower, car.lane = None, None, None
+        self.size -= 1
+        if not car.driving:
+            self.stopped -= 1
+    
+    def __iter__(self):
+        car = self.front
+        while car is not None:
+            yield car
+            car = car.follower
+    
+    def __len__(self) -> int:
+        return self.size
+
+
+class Lanes:
+    # Keeps every car in the lane of the road and direction it is driving on.
+    # The lanes are only touched when a car changes its road or direction
+    def __init__(self) -> None:
+        self._lanes: dict[tuple[Road, RoadDirections], Lane] = {}
+
+    def update(self, car: CarLogic) -> None:
+        road, direction = car.road_driving_on, car.driving_direction
+        lane = car.lane
+        
+        if lane is not None and lane.road is road and lane.direction is direction:
+            return
+        
+        if lane is not None:
+            lane.remove(car)
+        
+        if road is None:
+            return
+        
+        self.lane(road, direction).insert(car)
+    
+    def lane(self, road: Road, direction: RoadDirections) -> Lane:
+        key = (road, direction)
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = Lane(road, direction)
+            self._lanes[key] = lane
+        return lane
+    
+    def remove(self, car: CarLogic) -> None:
+        if car.lane is not None:
+            car.lane.remove(car)
+    
+    def get(self, road: Road, direction: RoadDirections) -> Lane | None:
+        return self._lanes.get((road, direction))
+    
+    def __iter__(self):
+        return iter(self._lanes.values())
+
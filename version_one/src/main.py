@@ -1,29 +1,84 @@
 from __future__ import annotations # To type hint car in the car class
+import argparse
+import os
+import sys
+import numpy as np
 import pygame
-from constants import Color, RoadDirections, RoadType
-from map import Road, HorizontalRaod, VerticalRoad, TrafficLight, Intersection, LANE_WIDTH
-from verhicles import Car
+from random import Random
+from clock import SimulationClock
+from constants import Color, EventKind, RoadDirections, RoadType, CAR_SPEED, DIRECTIONS, DIRECTION_CODES, PHASE_CODES, PHASE_RANGE
+from map import Road, HorizontalRaod, VerticalRoad, TrafficLight, Intersection, LANE_WIDTH, link_roads
+from spatial_index import RoadIndex
+from lanes import Lane, Lanes
+from fleet import Fleet, LaneQueue
+from signals import SignalScheduler
+from controllers import CONTROLLERS, SignalController
+from corridors import green_wave
+from demand import Demand
+from car_following import DriverParameters
+from routing import Router, TravelTimeRouter
+from profiler import PROFILER
+from time import perf_counter
+from verhicles import Car, CarLogic, CarPool
 
 
-class Game():
-    def __init__(self) -> None:
-        pygame.init()
-        pygame.display.set_caption("Traffic simulation")
-
-        self.SCREEN_WIDTH = 1600
-        self.SCREEN_HEIGHT = 1000
-        self.screen = pygame.display.set_mode((self.SCREEN_WIDTH, self.SCREEN_HEIGHT))
+class Simulation():
+    # The simulation core: map, cars and traffic lights. It never touches the display,
+    # so it can be driven by the windowed Game or by the HeadlessGame
+    SCREEN_WIDTH = 1600
+    SCREEN_HEIGHT = 1000
+    
+    # Tunables which are built into the traffic lights and their controllers, they only apply to a new map
+    MAP_TUNABLES = ("phase_range", "signal_plan", "signal_control")
+    
+    def __init__(self, screen=None, step_size: float = 1 / 60, seed: int | None = None, engine: str = "object") -> None:
+        self.screen = screen
+        self.engine = engine # "object": one Car per vehicle, "vectorized": one Fleet for all vehicles, "partitioned": one Fleet stepped by several processes
+        self.regions: int = os.cpu_count() or 1 # worker processes of the partitioned engine
+        
+        # All randomness and time come from here, so two runs with the same seed are identical
+        self.clock = SimulationClock(step_size)
+        self.rng = Random(seed)
+        self.seed = seed # other generators derive their streams from it instead of drawing from rng
         
-        self.clock = pygame.time.Clock()
-        self.prev_time = pygame.time.get_ticks()
-        self.cars: list[Car] = []
+        self.cars: dict[int, Car] = {} # by id, in spawn order
+        self.leaving_cars: list[int] = [] # cars which drove off the map and are not deleted yet
+        self.car_pool = CarPool() # despawned cars, reused by the next spawns
         self.roads: list[Road] = []
+        self.road_index: RoadIndex | None = None
+        self.lanes = Lanes()
+        self.fleet: Fleet | None = None
+        self.traffic_lights: list[TrafficLight] = []
+        self.signals = SignalScheduler([])
         self.car_spawn_cooldown: int = 2
-        self.last_car_spawn_time: int = pygame.time.get_ticks() - self.car_spawn_cooldown * 1000.
+        self.max_cars: int = 4
+        self.last_car_spawn_time: int = self.get_ticks() - self.car_spawn_cooldown * 1000.
+        
+        # Tunables of a scenario, they have to be set before the map is build
+        self.phase_range: tuple[int, int] = PHASE_RANGE
+        self.safety_distance: float = 60
+        self.signal_plan: str = "random" # random phases per intersection or a green wave along the corridors
+        self.signal_control: str = "fixed" # a name of controllers.CONTROLLERS
+        self.arrival_rate: float | None = None # cars per hour at every entry of the map, replaces the spawn point
+        self.routing: str = "random" # cars with a destination turn at random, on the shortest or the fastest path
+        self.car_following: str = "stop-and-go" # or "idm", cars accelerate and brake with the intelligent driver model
+        self.driver_variation: float = 0.1 # how much the desired speed and time headway of the idm drivers differ
+        self.driver = DriverParameters() # the cars keep its min_gap instead of the safety distance
+        self.demand: Demand | None = None
+        self.controllers: list[SignalController] = []
+        self.router: Router | None = None
+        
+        self.spawned_cars: int = 0
+        self.despawned_cars: int = 0
+        
+        # Observers (e.g. a recorder): step hooks are called after every update, event hooks with
+        # the step, the kind of the event, the vehicle or traffic light ids, x, y and a value per event
+        self.step_hooks: list = []
+        self.event_hooks: list = []
+        self.light_ids: dict[TrafficLight, int] = {}
 
-    def play(self) -> None:
-        self.generate_map()
-        self.game_loop()
+    def get_ticks(self) -> int:
+        return self.clock.ticks
     
     def generate_map(self) -> None:
         # starting road is coming from the west
@@ -60,12 +115,127 @@ class Game():
      
     def sync_intersects_with_roads(self) -> None:
         # intersections will know which roads are connected with them
-        for road in self.roads:
-            road.find_connected_roads(self.roads)
+        link_roads(self.roads)
         
         for intersect in self.roads:
             if intersect.road_type is RoadType.INTERSECTION:
-                intersect.acitvate_traffic_lights()
+                intersect.build_routes()
+        
+        for intersect in self.roads:
+            if intersect.road_type is RoadType.INTERSECTION:
+                intersect.acitvate_traffic_lights(self.get_ticks(), self.rng, self.phase_range)
+                self.traffic_lights.extend(intersect.acitve_traffic_lights.values())
+        
+        self.finish_map()
+    
+    def finish_map(self) -> None:
+        # Everything which is build once from the finished map
+        # before the scheduler, both change the timing of the lights
+        if self.signal_plan == "green-wave":
+            green_wave(self)
+        self.__attach_controllers()
+        self.signals = SignalScheduler(self.traffic_lights)
+        self.light_ids = {traffic_light: i for i, traffic_light in enumerate(self.traffic_lights)}
+        
+        # the roads do not change anymore, so the lookup grid is only build once
+        self.road_index = RoadIndex(self.roads)
+        
+        if self.engine == "vectorized":
+            self.fleet = Fleet(self.roads, self.traffic_lights, self.rng.getrandbits(64), self.screen)
+            self.fleet.safety_distance = self.safety_distance
+        
+        elif self.engine == "partitioned":
+            # the worker processes build the map again from the map file bytes
+            from map_file import map_bytes
+            from partition import PartitionedFleet
+            self.fleet = PartitionedFleet(self.roads, self.traffic_lights, map_bytes(self), self.regions, self.rng.getrandbits(64), self.screen)
+            self.fleet.safety_distance = self.safety_distance
+        
+        if self.fleet is not None:
+            self.fleet.car_following = self.car_following
+            self.fleet.driver = self.driver
+            self.fleet.driver_variation = self.driver_variation
+        
+        if self.fleet is not None and self.event_hooks:
+            self.fleet.on_event = self.emit
+        
+        # after the fleet, the travel times are read from its queues
+        match self.routing:
+            case "shortest":
+                self.router = Router(self.roads)
+            case "travel-time":
+                self.router = TravelTimeRouter(self.roads, self)
+            case _:
+                self.router = None
+        if self.fleet is not None:
+            self.fleet.router = self.router
+        
+        if self.arrival_rate is not None:
+            self.demand = Demand.uniform(self, self.arrival_rate)
+    
+    def set_tunables(self, tunables: dict) -> None:
+        # Changes tunables of a simulation which already has its map (e.g. a restored snapshot): the cars, the fleet
+        # and the demand which were build with the old values get the new ones
+        fixed = [name for name in tunables if name in self.MAP_TUNABLES]
+        if fixed:
+            raise ValueError(f"{', '.join(fixed)} can only be set before the map is build, the traffic lights keep their timing")
+        
+        changes_model = "car_following" in tunables and tunables["car_following"] != self.car_following
+        for name, value in tunables.items():
+            setattr(self, name, value)
+        
+        if self.fleet is not None:
+            self.fleet.safety_distance = self.safety_distance
+            self.fleet.driver_variation = self.driver_variation
+            if changes_model:
+                self.fleet.change_car_following(self.car_following)
+        
+        for car in self.cars.values():
+            logic = car.logic
+            logic.safety_distance = self.safety_distance
+            if not changes_model:
+                continue
+            
+            # like the fleet: idm drivers go on with their desired speed or stand, stop and go cars have the car speed
+            if self.car_following == "idm":
+                logic.driver = self.__new_driver()
+                logic.speed = logic.driver.desired_speed if logic.driving else 0.0
+            else:
+                logic.driver = None
+                logic.speed = CAR_SPEED
+        
+        if "arrival_rate" in tunables:
+            self.demand = Demand.uniform(self, self.arrival_rate) if self.arrival_rate is not None else None
+    
+    def __attach_controllers(self) -> None:
+        controller_type = CONTROLLERS[self.signal_control]
+        self.controllers = []
+        if controller_type is None:
+            return # the lights keep the fixed plan of synchronise_traffic_lights
+        
+        for intersection in self.roads:
+            if intersection.road_type is RoadType.INTERSECTION and intersection.acitve_traffic_lights:
+                controller = controller_type()
+                intersection.use_controller(controller, self, self.get_ticks())
+                self.controllers.append(controller)
+    
+    def queue_sensor(self, road: Road, direction: RoadDirections) -> Lane | LaneQueue:
+        # Counts the standing cars on a road in one direction, its stopped is read without looking at the cars
+        if self.fleet is not None:
+            return LaneQueue(self.fleet, self.fleet.table.road_ids[road] * 4 + DIRECTION_CODES[direction])
+        return self.lanes.lane(road, direction)
+    
+    def add_event_hook(self, hook) -> None:
+        # The cars only report events while somebody listens
+        self.event_hooks.append(hook)
+        if self.fleet is not None:
+            self.fleet.on_event = self.emit
+        for car in self.cars.values():
+            car.logic.on_event = self.emit
+    
+    def emit(self, kind: EventKind, ids, xs, ys, values) -> None:
+        for hook in self.event_hooks:
+            hook(self.clock.steps, kind, ids, xs, ys, values)
          
     def spawn_road(self, road: Road) -> None:
         self.roads.append(road)
@@ -92,52 +262,345 @@ class Game():
                 return it 
                     
     def spawn_car(self, x: int = 300, y: int = 405) -> None:
-        if len(self.cars) < 4:
-            self.cars.append(Car(self.screen, x, y, RoadDirections.EAST))       
-            self.cars.sort(key=lambda car: car.x) # sort the cars after x value
+        if self.car_count() < self.max_cars:
+            self.add_car(x, y, RoadDirections.EAST)
+
+    def add_car(self, x: float, y: float, direction: RoadDirections) -> None:
+        self.spawned_cars += 1
+        if self.fleet is not None:
+            slot = self.fleet.spawn(x, y, direction)
+            car_id = self.fleet.state.id[slot]
+        else:
+            car_id = self.__add_object_car(x, y, direction).id
+        
+        if self.event_hooks:
+            self.emit(EventKind.SPAWN, [car_id], [x], [y], [DIRECTION_CODES[direction]])
+    
+    def add_cars(self, xs: np.ndarray, ys: np.ndarray, directions: np.ndarray, roads: np.ndarray, destinations: np.ndarray) -> None:
+        # A batch of cars which start on known roads (direction codes, road ids and destination road ids or -1),
+        # e.g. the arrivals of one step. The fleet adds them at once, cars are placed in their lanes one by one
+        self.spawned_cars += len(xs)
+        if self.fleet is not None:
+            slots = self.fleet.spawn_batch(xs, ys, directions, roads, destinations)
+            car_ids = self.fleet.state.id[slots]
+        else:
+            car_ids = []
+            for x, y, code, destination in zip(xs.tolist(), ys.tolist(), directions.tolist(), destinations.tolist()):
+                car = self.__add_object_car(x, y, DIRECTIONS[code])
+                car.logic.destination = self.roads[destination] if destination >= 0 else None
+                car_ids.append(car.id)
+        
+        if self.event_hooks and len(xs):
+            self.emit(EventKind.SPAWN, car_ids, xs, ys, directions)
+    
+    def __add_object_car(self, x: float, y: float, direction: RoadDirections) -> Car:
+        car = self.car_pool.acquire(self.screen, x, y, direction, self.rng, self.safety_distance)
+        self.cars[car.id] = car
+        car.logic.on_leave = self.car_leaving
+        car.logic.router = self.router
+        if self.car_following == "idm":
+            car.logic.driver = self.__new_driver()
+            car.logic.speed = car.logic.driver.desired_speed
+        if self.event_hooks:
+            car.logic.on_event = self.emit
+        car.logic.enter(self.roads, self.road_index, self.lanes)
+        return car
+    
+    def __new_driver(self) -> DriverParameters:
+        if not self.driver_variation:
+            return self.driver
+        return self.driver.varied(1 + self.driver_variation * (2 * self.rng.random() - 1),
+                                  1 + self.driver_variation * (2 * self.rng.random() - 1))
+    
+    def car_count(self) -> int:
+        return self.fleet.count if self.fleet is not None else len(self.cars)
 
     def create_cars(self) -> None:
-        current_time = pygame.time.get_ticks()
+        # with a demand model the cars arrive at all entries of the map, otherwise at the one spawn point
+        if self.demand is not None:
+            self.demand.update()
+            return
+        
+        current_time = self.get_ticks()
         if (current_time - self.last_car_spawn_time) >= self.car_spawn_cooldown * 1000:
             self.spawn_car()
             self.last_car_spawn_time = current_time
-                  
-    def update_time(self, prev_time) -> tuple[int, float]:
-        current = pygame.time.get_ticks()
-        delta = (current - prev_time) / 1000.0  # Consistent car movement regardless of frame rate
-        return delta, current
+
        
-    def handle_events(self) -> None:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
+    def all_cars(self) -> list[Car]:
+        # with the vectorized engine the cars are views on the fleet
+        if self.fleet is not None:
+            return self.fleet.cars()
+        return list(self.cars.values())
+
+    def remove_cars(self) -> None:
+        # delete cars, which are not in the screen
+        if self.fleet is not None:
+            removed = self.fleet.remove_outside(self.SCREEN_WIDTH, self.SCREEN_HEIGHT)
+            self.despawned_cars += len(removed)
+            if self.event_hooks and len(removed):
+                state = self.fleet.state
+                self.emit(EventKind.DESPAWN, state.id[removed], state.x[removed], state.y[removed], state.direction[removed])
+            return
+        
+        # only the cars which drove off the map are checked, a car leaves the screen shortly after
+        still_leaving = []
+        for car_id in self.leaving_cars:
+            car = self.cars[car_id]
+            if car.deleteable(self.SCREEN_WIDTH, self.SCREEN_HEIGHT):
+                del self.cars[car_id]
+                self.lanes.remove(car.logic)
+                self.despawned_cars += 1
+                if self.event_hooks:
+                    self.emit(EventKind.DESPAWN, [car.id], [car.x], [car.y], [DIRECTION_CODES[car.logic.driving_direction]])
+                self.car_pool.release(car)
+            elif car.logic.off_network:
+                still_leaving.append(car_id)
+        
+        self.leaving_cars = still_leaving
+    
+    def car_leaving(self, car: CarLogic) -> None:
+        self.leaving_cars.append(car.id)
+
+    def stopped_car_count(self) -> int:
+        if self.fleet is not None:
+            state = self.fleet.state
+            return int((state.alive[:state.size] & ~state.driving[:state.size]).sum())
+        return sum(1 for car in self.cars.values() if not car.driving_status)
+
+    def move_cars(self) -> None:
+        if self.fleet is not None:
+            self.fleet.step(self.delta_time)
+            if self.controllers or isinstance(self.router, TravelTimeRouter):
+                self.fleet.count_queues()
+        else:
+            cars = self.cars.values()
+            for car in cars:
+                car.move(self.delta_time, cars ,self.roads, self.road_index, self.lanes)
+        
+        if self.router is not None:
+            self.router.observe(self.get_ticks())
+
+    def update_traffic_lights(self) -> None:
+        current_ticks = self.get_ticks()
+        for controller in self.controllers:
+            for traffic_light in controller.update(current_ticks):
+                self.signals.reschedule(traffic_light)
+        
+        changed = self.signals.update(current_ticks)
+        if changed and self.fleet is not None:
+            self.fleet.update_signals(changed)
+        
+        if changed and self.event_hooks:
+            self.emit(EventKind.PHASE_CHANGE, [self.light_ids[tl] for tl in changed], [tl.x for tl in changed],
+                      [tl.y for tl in changed], [PHASE_CODES[tl.color_phase] for tl in changed])
 
     def update(self) -> None:
-        self.delta_time, self.prev_time = self.update_time(self.prev_time)
+        self.delta_time = self.clock.tick() # Fixed step: consistent car movement regardless of frame rate
+        start = perf_counter()
         self.create_cars()
+        start = PROFILER.lap("spawn", start)
+        self.remove_cars()
+        start = PROFILER.lap("despawn", start)
+        self.move_cars()
+        start = PROFILER.lap("move", start)
+        self.update_traffic_lights()
+        PROFILER.lap("signals", start)
+        
+        for hook in self.step_hooks:
+            hook()
+
+
+class Game(Simulation):
+    def __init__(self, step_size: float = 1 / 60, seed: int | None = None, realtime: bool = True, engine: str = "object") -> None:
+        pygame.init()
+        pygame.display.set_caption("Traffic simulation")
+
+        screen = pygame.display.set_mode((self.SCREEN_WIDTH, self.SCREEN_HEIGHT))
+        super().__init__(screen, step_size, seed, engine)
+        
+        # In realtime mode one simulation step is shown per frame, otherwise the steps run as fast as possible
+        self.realtime = realtime
+        self.frame_clock = pygame.time.Clock()
+        self.fps = round(1 / step_size)
+        
+        self.background: pygame.Surface | None = None
+        self.dirty_rects: list[pygame.Rect] = []
+
+    def play(self) -> None:
+        if not self.roads: # a map can also be generated before
+            self.generate_map()
+        self.game_loop()
        
-        self.cars = [car for car in self.cars if not car.deleteable()] # delete cars, which are not in the screen
- 
-        for car in self.cars:
-            car.move(self.delta_time, self.cars ,self.roads)
+    def handle_events(self) -> None:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                sys.exit()
+            
+            # F3 switches the profiler with its overlay on and off
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                if PROFILER.enabled:
+                    PROFILER.disable()
+                else:
+                    PROFILER.enable(overlay=True, dump_path=PROFILER.dump_path, dump_interval=PROFILER.dump_interval)
 
+    def render_background(self) -> None:
+        # The roads never change, so they are rendered once to an off-screen surface
+        self.background = pygame.Surface(self.screen.get_size()).convert()
+        self.background.fill(Color.GRAY.value)
+        
+        [road.draw(self.background) for road in self.roads]
+    
     def draw(self) -> None:
-        self.screen.fill(Color.GRAY.value)
+        if self.background is None:
+            self.render_background()
+            self.screen.blit(self.background, (0, 0))
+            pygame.display.flip()
+        
+        # Only restore the background where something was drawn in the last frame
+        start = perf_counter()
+        for rect in self.dirty_rects:
+            self.screen.blit(self.background, rect, rect)
+        start = PROFILER.lap("draw.background", start)
         
-        [road.draw() for road in self.roads]
+        current_ticks = self.get_ticks()
+        drawn_rects = [traffic_light.draw(current_ticks) for traffic_light in self.traffic_lights]
+        start = PROFILER.lap("draw.traffic_lights", start)
+        drawn_rects += [car.draw() for car in self.all_cars()]
+        start = PROFILER.lap("draw.cars", start)
         
-        [car.draw() for car in self.cars]        
+        if PROFILER.overlay:
+            drawn_rects.append(PROFILER.draw_overlay(self.screen))
         
-        pygame.display.flip()
+        pygame.display.update(self.dirty_rects + drawn_rects)
+        self.dirty_rects = drawn_rects
+        PROFILER.lap("draw.display", start)
         
     def game_loop(self) -> None:
         while True:
-            self.clock.tick(60)
+            if self.realtime:
+                self.frame_clock.tick(self.fps)
+            
+            start = perf_counter()
             self.handle_events()
+            PROFILER.lap("events", start)
+            
             self.update()
             self.draw()
+            
+            if PROFILER.enabled:
+                PROFILER.end_frame()
+
+
+class HeadlessGame(Simulation):
+    # Runs the simulation without a display, fonts or images (e.g. for batch runs on servers).
+    # There is nothing to show, so the steps never wait for the wall clock
+    def __init__(self, step_size: float = 1 / 60, seed: int | None = None, engine: str = "object") -> None:
+        super().__init__(None, step_size, seed, engine)
+
+    def play(self, duration: float) -> None:
+        if not self.roads: # a map can also be generated before
+            self.generate_map()
+        self.run_for(duration)
+
+    def run(self, steps: int) -> None:
+        for _ in range(steps):
+            self.update()
+            if PROFILER.enabled:
+                PROFILER.end_frame()
+    
+    def run_for(self, seconds: float) -> None:
+        self.run(self.clock.steps_for(seconds))
 
 
 if __name__ == "__main__":
-    Game().play()
+    parser = argparse.ArgumentParser(description="Traffic simulation")
+    parser.add_argument("--headless", action="store_true", help="run the simulation without a display")
+    parser.add_argument("--duration", type=float, default=3600, help="simulated seconds of a headless run")
+    parser.add_argument("--fast", action="store_true", help="do not wait for the wall clock between frames")
+    parser.add_argument("--step-size", type=float, default=1 / 60, help="simulated seconds per step")
+    parser.add_argument("--seed", type=int, default=None, help="seed for reproducible runs")
+    parser.add_argument("--engine", choices=["object", "vectorized", "partitioned"], default="object", help="how the cars are simulated")
+    parser.add_argument("--signal-plan", choices=["random", "green-wave"], default="random", help="timing of the traffic lights")
+    parser.add_argument("--signal-control", choices=["fixed", "max-pressure"], default="fixed", help="how the traffic lights are controlled")
+    parser.add_argument("--routing", choices=["random", "shortest", "travel-time"], default="random", help="how cars with a destination choose their turns")
+    parser.add_argument("--car-following", choices=["stop-and-go", "idm"], default="stop-and-go", help="how the cars accelerate and brake")
+    parser.add_argument("--arrival-rate", type=float, default=None, help="cars per hour arriving at every entry of the map")
+    parser.add_argument("--demand", default=None, help="json file with the arrival rates or origin destination matrices per period")
+    parser.add_argument("--regions", type=int, default=None, help="worker processes of the partitioned engine, all cores by default")
+    parser.add_argument("--grid", default=None, help="generate a grid map with ROWSxCOLS intersections")
+    parser.add_argument("--map", default=None, help="load the map from a map file")
+    parser.add_argument("--save-map", default=None, help="write the map to a map file before the simulation starts")
+    parser.add_argument("--record", default=None, help="stream the vehicle states and events into a recording")
+    parser.add_argument("--record-every", type=int, default=1, help="record the vehicle states of every n-th step")
+    parser.add_argument("--compress", action="store_true", help="compress the chunks of the recording")
+    parser.add_argument("--restore", default=None, help="continue the simulation of a snapshot instead of building a map")
+    parser.add_argument("--save-snapshot", default=None, help="write a snapshot of the simulation when the run ends")
+    parser.add_argument("--profile", action="store_true", help="time the phases of every frame and show them (F3 switches it in the window)")
+    parser.add_argument("--profile-dump", default=None, help="append the phase timings to this file as json lines")
+    parser.add_argument("--profile-interval", type=float, default=10, help="wall clock seconds between two dumps")
+    args = parser.parse_args()
+    
+    if args.headless:
+        sim = HeadlessGame(args.step_size, args.seed, args.engine)
+    else:
+        sim = Game(args.step_size, args.seed, realtime=not args.fast, engine=args.engine)
+    
+    if args.regions:
+        sim.regions = args.regions
+    sim.signal_plan = args.signal_plan
+    sim.signal_control = args.signal_control
+    sim.arrival_rate = args.arrival_rate
+    sim.routing = args.routing
+    sim.car_following = args.car_following
+    
+    restored = None
+    if args.grid:
+        from map_generator import generate_grid
+        rows, cols = args.grid.lower().split("x")
+        generate_grid(sim, int(rows), int(cols))
+    elif args.map:
+        from map_file import load_map
+        load_map(args.map, sim)
+    elif args.restore:
+        from snapshot import read_snapshot, restore_snapshot
+        restored = read_snapshot(args.restore)
+        restore_snapshot(restored, sim)
+    
+    if args.save_map:
+        from map_file import save_map
+        if not sim.roads:
+            sim.generate_map()
+        save_map(args.save_map, sim)
+    
+    if args.demand:
+        from demand import load_demand
+        if not sim.roads:
+            sim.generate_map()
+        sim.demand = load_demand(args.demand, sim)
+        if restored is not None:
+            from snapshot import restore_demand
+            restore_demand(restored, sim.demand)
+    
+    if args.profile or args.profile_dump:
+        PROFILER.enable(overlay=args.profile, dump_path=args.profile_dump, dump_interval=args.profile_interval)
+    
+    recorder = None
+    if args.record:
+        from recorder import Recorder
+        if not sim.roads:
+            sim.generate_map()
+        recorder = Recorder(args.record, sim, args.record_every, compress=args.compress)
+    
+    try:
+        if args.headless:
+            sim.play(args.duration)
+        else:
+            sim.play()
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if args.save_snapshot:
+            from snapshot import save_snapshot
+            save_snapshot(args.save_snapshot, sim)
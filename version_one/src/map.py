@@ -1,9 +1,50 @@
 from __future__ import annotations
 import pygame
 import uuid
+import assets
 from abc import ABC
-from constants import Color, ColorPhase, RoadDirections, RoadType, LANE_WIDTH
-from random import randint
+from types import MappingProxyType
+from typing import NamedTuple
+from constants import Color, ColorPhase, RoadDirections, RoadType, LANE_WIDTH, LANE_OFFSETS, OPPOSITE_DIRECTIONS, PHASE_RANGE
+from random import Random
+
+
+def link_roads(roads: list[Road], margin: float = 5, cell_size: float = 100) -> None:
+    # Same result as calling find_connected_roads for every road, but without comparing every intersection
+    # with every road. The road edges are hashed by their position, an intersection only checks the
+    # roads which end close to one of its sides
+    edges: dict[tuple[str, int, int], list[int]] = {}
+    
+    def cells(start: float, end: float) -> range:
+        return range(int(start // cell_size), int(end // cell_size) + 1)
+    
+    for i, road in enumerate(roads):
+        # the edge position is bucketed with the margin, the cross position with the cell size
+        for cell in cells(road.x, road.x + road.width):
+            edges.setdefault(("y", int((road.y + road.length) // margin), cell), []).append(i)
+            edges.setdefault(("y", int(road.y // margin), cell), []).append(i)
+        for cell in cells(road.y, road.y + road.length):
+            edges.setdefault(("x", int((road.x + road.length) // margin), cell), []).append(i)
+            edges.setdefault(("x", int(road.x // margin), cell), []).append(i)
+    
+    def candidates(axis: str, position: float, start: float, end: float) -> set[int]:
+        found = set()
+        for bucket in range(int((position - margin) // margin), int((position + margin) // margin) + 1):
+            for cell in cells(start, end):
+                found.update(edges.get((axis, bucket, cell), ()))
+        return found
+    
+    for intersection in roads:
+        if intersection.road_type != RoadType.INTERSECTION:
+            continue
+        
+        found = candidates("y", intersection.y, intersection.x, intersection.x + intersection.width)
+        found |= candidates("y", intersection.y + intersection.length, intersection.x, intersection.x + intersection.width)
+        found |= candidates("x", intersection.x, intersection.y, intersection.y + intersection.length)
+        found |= candidates("x", intersection.x + intersection.width, intersection.y, intersection.y + intersection.length)
+        
+        # in list order, so the connected roads end up in the same order as with find_connected_roads
+        intersection.find_connected_roads([roads[i] for i in sorted(found)])
 
 
 class Road(ABC):
@@ -19,16 +60,18 @@ class Road(ABC):
         self.id = uuid.uuid4().hex[:6] # 6 chars for the id
         self._road_type:RoadType = road_type
         self.connected_roads = {}
+        self.downstream: dict[RoadDirections, Intersection] = {} # the intersection at the end of the road for each direction
         self._all_traffic_lights = {}
         self._active_traffic_lights = {}
 
-    def draw_rect(self, color, x: float, y: float, width:float , height: float) -> None:
-        pygame.draw.rect(self.screen, color, pygame.Rect(x, y, width, height))
+    def draw_rect(self, surface, color, x: float, y: float, width:float , height: float) -> None:
+        pygame.draw.rect(surface, color, pygame.Rect(x, y, width, height))
 
-    def draw(self) -> None:
+    def draw(self, surface=None) -> None:
+        # Only the static road, the traffic lights are drawn every frame on their own
         pass
     
-    def _create_seperator(self) -> None:
+    def _create_seperator(self, surface) -> None:
         pass
 
     def street_end(self, direction: RoadDirections) -> tuple[int, int]:
@@ -49,6 +92,18 @@ class Road(ABC):
                 print("This direction is not compatible with the road")
                 return None
     
+    def lane_point(self, direction: RoadDirections, distance: float) -> tuple[float, float]:
+        # The point on the lane of the direction, distance pixels after the end where the cars enter the road
+        match (direction):
+            case (RoadDirections.EAST):
+                return (self.x + distance, self.y + LANE_OFFSETS[direction])
+            case (RoadDirections.WEST):
+                return (self.x + self.length - distance, self.y + LANE_OFFSETS[direction])
+            case (RoadDirections.SOUTH):
+                return (self.x + LANE_OFFSETS[direction], self.y + distance)
+            case (RoadDirections.NORTH):
+                return (self.x + LANE_OFFSETS[direction], self.y + self.length - distance)
+    
     def find_connected_roads(self, roads: list[Road]) -> dict | None:
         if self._road_type != RoadType.INTERSECTION:
             return None
@@ -79,19 +134,11 @@ class Road(ABC):
         return self.connected_roads 
     
     def on_road(self, x: float, y: float) -> bool:
-        in_x_range, in_y_range = 0,0
-        
-        if isinstance(self, HorizontalRaod):
-            in_x_range = self.x <= x <= self.x + self.length
-            in_y_range = self.y <= y <= self.y + self.width
-        elif isinstance(self, VerticalRoad):
-            in_x_range = self.x <= x <= self.x + self.width
-            in_y_range = self.y <= y <= self.y + self.length
-        elif isinstance(self, Intersection):
-            in_x_range = self.x <= x <= self.x + self.width
-            in_y_range = self.y <= y <= self.y + self.width
-        
-        return in_x_range and in_y_range
+        min_x, min_y, max_x, max_y = self.bounds
+        return min_x <= x <= max_x and min_y <= y <= max_y
+    
+    def _calculate_bounds(self) -> tuple[float, float, float, float]:
+        pass
     
     def _create_traffic_ligts(self) -> None:
         for direction in self.directions:
@@ -108,10 +155,6 @@ class Road(ABC):
                 case(RoadDirections.EAST.value): # horizontal road
                     self._all_traffic_lights[RoadDirections.EAST]= TrafficLight(self.screen,  self.street_end(RoadDirections.EAST)[0] - 25  , self.street_end(RoadDirections.EAST)[1] + self.width + 15) # must be on the upper side
                     
-    def _draw_traffic_lights(self) -> None:
-        for traf in self._active_traffic_lights.values():
-            traf.draw()
-    
     def _set_traffic_lights(self, new_traffic_lights) -> None:
         self._active_traffic_lights.update(new_traffic_lights)
     
@@ -140,24 +183,24 @@ class HorizontalRaod(Road):
     def __init__(self, screen, road_type: RoadType, start_x: float, start_y: float, lenght: float, width: float, directions: list[RoadDirections]):
         super().__init__(screen, road_type, start_x, start_y, lenght, width, directions) 
         super()._create_traffic_ligts()
+        self.bounds = self._calculate_bounds()
     
-    def draw(self) -> None:
+    def draw(self, surface=None) -> None:
+        surface = surface if surface is not None else self.screen
         black = Color.BLACK.value
         white = Color.WHITE.value
         
         # Road : Black lane
-        self.draw_rect(black, self.x, self.y, self.length, self.lane_width)
-        self.draw_rect(black, self.x, self.y+self.width, self.length, self.lane_width)
+        self.draw_rect(surface, black, self.x, self.y, self.length, self.lane_width)
+        self.draw_rect(surface, black, self.x, self.y+self.width, self.length, self.lane_width)
         
         # Innerroad : White space
-        self.draw_rect(white, self.x, self.y+self.lane_width, self.length, self.width-self.lane_width)
+        self.draw_rect(surface, white, self.x, self.y+self.lane_width, self.length, self.width-self.lane_width)
 
         # Road seperator : Black 
-        self._create_seperator()
-        
-        self._draw_traffic_lights()
+        self._create_seperator(surface)
     
-    def _create_seperator(self) -> None:
+    def _create_seperator(self, surface) -> None:
         # Road separator (middle dashed line)
         separator_width = 10
         separator_height = 5
@@ -165,7 +208,10 @@ class HorizontalRaod(Road):
 
         # Middle y-position for the separator
         for i in range(self.x, self.x + self.length, separator_width + separator_gap):
-            pygame.draw.rect(self.screen, Color.BLACK.value, pygame.Rect(i, self.middle_y, separator_width, separator_height))
+            pygame.draw.rect(surface, Color.BLACK.value, pygame.Rect(i, self.middle_y, separator_width, separator_height))
+
+    def _calculate_bounds(self) -> tuple[float, float, float, float]:
+        return (self.x, self.y, self.x + self.length, self.y + self.width)
 
     def street_end(self, direction: RoadDirections) -> tuple[int, int] | None:
         if direction is RoadDirections.NORTH.value or direction is RoadDirections.SOUTH.value:
@@ -178,24 +224,24 @@ class VerticalRoad(Road):
     def __init__(self, screen, road_type: RoadType, start_x, start_y, lenght, width, directions):
         super().__init__(screen,road_type, start_x, start_y, lenght, width, directions)
         super()._create_traffic_ligts()
+        self.bounds = self._calculate_bounds()
 
-    def draw(self) -> None:
+    def draw(self, surface=None) -> None:
+        surface = surface if surface is not None else self.screen
         black = Color.BLACK.value
         white = Color.WHITE.value
         
         # Road : Black lane
-        self.draw_rect(black, self.x, self.y+self.lane_width, self.lane_width, self.length)
-        self.draw_rect(black,self.x+self.width, self.y+self.lane_width, self.lane_width, self.length)
+        self.draw_rect(surface, black, self.x, self.y+self.lane_width, self.lane_width, self.length)
+        self.draw_rect(surface, black,self.x+self.width, self.y+self.lane_width, self.lane_width, self.length)
                 
         # Innerroad : White space
-        self.draw_rect(white,self.x+self.lane_width, self.y+self.lane_width, self.width-self.lane_width, self.length)
+        self.draw_rect(surface, white,self.x+self.lane_width, self.y+self.lane_width, self.width-self.lane_width, self.length)
         
         # Road seperator : Black 
-        self._create_seperator()        
-        
-        self._draw_traffic_lights()
+        self._create_seperator(surface)        
 
-    def _create_seperator(self) -> None:
+    def _create_seperator(self, surface) -> None:
         # Road separator (middle dashed line)
         separator_width = 10
         separator_height = 5
@@ -203,8 +249,11 @@ class VerticalRoad(Road):
 
         # Middle y-position for the separator
         for i in range(self.y+self.lane_width, self.y + self.length, separator_width + separator_gap):
-            pygame.draw.rect(self.screen, Color.BLACK.value, pygame.Rect(self.middle_x, i,  separator_height, separator_width))
+            pygame.draw.rect(surface, Color.BLACK.value, pygame.Rect(self.middle_x, i,  separator_height, separator_width))
     
+    def _calculate_bounds(self) -> tuple[float, float, float, float]:
+        return (self.x, self.y, self.x + self.width, self.y + self.length)
+
     def street_end(self, direction: RoadDirections) -> tuple[int, int] | None:
         if direction is RoadDirections.EAST.value or direction is RoadDirections.WEST.value:
             direction = None
@@ -223,17 +272,21 @@ class Intersection(Road):
         self.length = reduced_side
         
         self.acitve_traffic_lights = {}
+        self.controller = None # decides the timing of the lights, without one the lights run a fixed plan
+        self.routes: MappingProxyType[tuple[Road, RoadDirections], Route] = MappingProxyType({})
+        self.bounds = self._calculate_bounds()
 
-    def draw(self) -> None:
+    def draw(self, surface=None) -> None:
+        surface = surface if surface is not None else self.screen
         white = Color.WHITE.value
-        self.draw_rect(white,self.x, self.y, self.side_length, self.side_length)
+        self.draw_rect(surface, white,self.x, self.y, self.side_length, self.side_length)
         
-        self.__create_boundries()
+        self.__create_boundries(surface)
         
-    def __draw_corner_pixel(self, x, y, w, h):
-        pygame.draw.rect(self.screen, Color.BLACK.value, pygame.Rect(x, y, w, h))
+    def __draw_corner_pixel(self, surface, x, y, w, h):
+        pygame.draw.rect(surface, Color.BLACK.value, pygame.Rect(x, y, w, h))
     
-    def __create_boundries(self) -> None:
+    def __create_boundries(self, surface) -> None:
         lane = self.lane_width
         size = self.side_length
         max_x = self.x + size
@@ -243,16 +296,16 @@ class Intersection(Road):
 
         # Side boundaries
         if RoadDirections.EAST not in self.directions:
-            self.__draw_corner_pixel(max_x, self.y, lane, size)
+            self.__draw_corner_pixel(surface, max_x, self.y, lane, size)
 
         if RoadDirections.WEST not in self.directions:
-            self.__draw_corner_pixel(self.x, self.y, lane, size )
+            self.__draw_corner_pixel(surface, self.x, self.y, lane, size )
 
         if RoadDirections.NORTH not in self.directions:
-            self.__draw_corner_pixel(self.x, self.y - lane, size , lane)
+            self.__draw_corner_pixel(surface, self.x, self.y - lane, size , lane)
 
         if RoadDirections.SOUTH not in self.directions:
-            self.__draw_corner_pixel(self.x, self.y+ size, size , lane)
+            self.__draw_corner_pixel(surface, self.x, self.y+ size, size , lane)
 
 
         # Draw corners
@@ -264,34 +317,54 @@ class Intersection(Road):
         ]
         
         for cx, cy in corners:
-            self.__draw_corner_pixel(cx, cy, corner_size, corner_size)
+            self.__draw_corner_pixel(surface, cx, cy, corner_size, corner_size)
     
-    def get_possible_turns(self, direction: RoadDirections, road: RoadType) -> dict[RoadDirections]:
-        translate_direction = { RoadDirections.NORTH: RoadDirections.SOUTH,
-                                RoadDirections.WEST: RoadDirections.EAST,
-                              }
-        
-        # switch the key with the value and it to the dict
-        translate_direction.update({value: key  for key, value in translate_direction.items()})
-        
-        new_direction = translate_direction.get(direction, None)
+    def _calculate_bounds(self) -> tuple[float, float, float, float]:
+        return (self.x, self.y, self.x + self.width, self.y + self.width)
+    
+    def build_routes(self) -> None:
+        # Precompute for every connected road what a car coming from it can do on the intersection.
+        # Must be called after find_connected_roads, the map does not change afterwards
+        turn_points = {
+            RoadDirections.EAST: {
+                RoadDirections.NORTH: self.lower_right_middle,
+                RoadDirections.SOUTH: self.lower_left_middle,
+            },
+            RoadDirections.WEST: {
+                RoadDirections.NORTH: self.upper_right_middle,
+                RoadDirections.SOUTH: self.upper_left_middle,
+            },
+            RoadDirections.NORTH: {
+                RoadDirections.EAST: self.lower_right_middle,
+                RoadDirections.WEST: self.upper_right_middle,
+            },
+            RoadDirections.SOUTH: {
+                RoadDirections.EAST: self.lower_left_middle,
+                RoadDirections.WEST: self.upper_left_middle,
+            },
+        }
+        
+        routes = {}
+        for side, road in self.connected_roads.items():
+            # a car on the road west of the intersection drives east into it
+            direction = OPPOSITE_DIRECTIONS[side]
+            roads = {turn: other for turn, other in self.connected_roads.items() if turn is not side}
+            points = {turn: point for turn, point in turn_points[direction].items() if turn in roads}
             
-        if new_direction is None:
-            raise ValueError("The direction is not found")
-       
-        found_road = self.connected_roads.get(new_direction, None)
-
-        # When the found road is the given road we know the road and the intersection are connected
-        # Only return the key value pairs with out the own road and direction
-        if found_road == road:
-            non_self_roads = self.connected_roads.copy()
-            non_self_roads.pop(new_direction)
-            return non_self_roads
+            routes[(road, direction)] = Route(tuple(roads), MappingProxyType(roads), MappingProxyType(points))
+            road.downstream.setdefault(direction, self)
         
-        else:
-            return None
+        self.routes: MappingProxyType[tuple[Road, RoadDirections], Route] = MappingProxyType(routes)
+    
+    def get_route(self, direction: RoadDirections, road: Road) -> Route | None:
+        return self.routes.get((road, direction))
     
-    def acitvate_traffic_lights(self) -> None:
+    def get_possible_turns(self, direction: RoadDirections, road: Road) -> MappingProxyType[RoadDirections, Road] | None:
+        # When the road is connected with the intersection, the other connected roads are the possible turns
+        route = self.routes.get((road, direction))
+        return route.roads if route is not None else None
+    
+    def acitvate_traffic_lights(self, start_ticks: int, rng: Random, phase_range: tuple[int, int] = PHASE_RANGE) -> None:
         translate_direction = { RoadDirections.NORTH: RoadDirections.SOUTH,
                                 RoadDirections.WEST: RoadDirections.EAST,
                               }
@@ -319,17 +392,27 @@ class Intersection(Road):
                     translated_road_direction = translate_direction.get(direction, None)
                     self.acitve_traffic_lights[translated_road_direction] = traffic_light
         
-        self.synchronise_traffic_lights()
-        
-    def synchronise_traffic_lights(self) -> None:
-        red_green_phase = randint(4,7)
+        self.synchronise_traffic_lights(start_ticks, rng, phase_range)
+    
+    def use_traffic_light(self, side: RoadDirections, road: Road, direction: RoadDirections) -> None:
+        # Activate the traffic light of a connected road directly, e.g. when the map is loaded from a file
+        traffic_light = road._all_traffic_lights[direction]
+        road._set_traffic_lights({direction: traffic_light})
+        self.acitve_traffic_lights[side] = traffic_light
+        
+    def use_controller(self, controller, sim, current_ticks: int) -> None:
+        # The controller takes over the timing of the active traffic lights, see controllers.SignalController
+        self.controller = controller
+        controller.attach(self, sim, current_ticks)
+    
+    def synchronise_traffic_lights(self, start_ticks: int, rng: Random, phase_range: tuple[int, int] = PHASE_RANGE) -> None:
+        red_green_phase = rng.randint(*phase_range)
         yellow_phase = 2
         
         starting_phase_first_tf = ColorPhase.GREEN
         starting_phase_other_tf = ColorPhase.RED
         
         countdown_start: int = red_green_phase
-        start_ticks = pygame.time.get_ticks()
 
 
         hor = (self.acitve_traffic_lights.get(RoadDirections.WEST, False), self.acitve_traffic_lights.get(RoadDirections.EAST, False))
@@ -395,6 +478,13 @@ class Intersection(Road):
         return self.x + (self.width // 2) -2
    
  
+class Route(NamedTuple):
+    # What a car coming from one road in one direction can do on an intersection
+    turns: tuple[RoadDirections, ...]
+    roads: MappingProxyType[RoadDirections, Road] # turn direction -> connected road
+    turn_points: MappingProxyType[RoadDirections, tuple[int, int]] # turn direction -> where the car has to turn
+    
+
 class TrafficLight:
     def __init__(self, screen, x, y):
         self.screen = screen
@@ -409,10 +499,14 @@ class TrafficLight:
         self.countdown_start: int = None
         self.start_ticks = None
         self.time_left = None
+        self.next_change_ticks: int = None # when the color changes the next time
         
-        self.my_font = pygame.font.SysFont('Freeroad', 20)
+        # Fonts and images are only needed when there is something to draw on
+        self.my_font = None
         self.img_green, self.img_red, self.img_yellow = None, None, None  
-        self.__set_img()
+        if self.screen is not None:
+            self.my_font = assets.font('Freeroad', 20)
+            self.__set_img()
     
     def set_information(self, starting_phase: ColorPhase, red_phase: ColorPhase, yellow_phase: ColorPhase, green_phase:ColorPhase, countdown_start: int, start_tick: int) -> None:
         self.starting_color_phase = starting_phase
@@ -425,37 +519,51 @@ class TrafficLight:
         self.countdown_start: int = countdown_start
         self.start_ticks: int = start_tick
         self.time_left: int= countdown_start
+        self.next_change_ticks = self.__next_change()
     
-    def draw(self) -> None:
-        self.__update_phase()
-        self.__remaining_time_text()
+    def draw(self, current_ticks: int) -> pygame.Rect:
+        # The countdown is only needed for drawing, the phase itself is updated by the simulation
+        self.time_left = max(0, self.countdown_start - (current_ticks - self.start_ticks) // 1000)
+        text_rect = self.__remaining_time_text()
         
         match (self.color_phase.value):
             case (ColorPhase.GREEN.value):
-                self.screen.blit(self.img_green,(self.x, self.y))
+                img_rect = self.screen.blit(self.img_green,(self.x, self.y))
             
             case (ColorPhase.YELLOW.value):
-                self.screen.blit(self.img_yellow,(self.x, self.y))
+                img_rect = self.screen.blit(self.img_yellow,(self.x, self.y))
             
             case (ColorPhase.RED.value):
-                self.screen.blit(self.img_red,(self.x, self.y))
+                img_rect = self.screen.blit(self.img_red,(self.x, self.y))
         
-    def __update_phase(self) -> None:
-        # Calculate how many full seconds have passed since the traffic light was created
-        self.seconds_passed = (pygame.time.get_ticks() - self.start_ticks) // 1000
-        # Calculate how much time is left before the countdown ends (traffic light turns red or green)
-        self.time_left = max(0, self.countdown_start - self.seconds_passed)
+        # the area which changed on the screen
+        return img_rect.union(text_rect)
         
+    def show(self, color_phase: ColorPhase, seconds_left: int, current_ticks: int) -> None:
+        # Shows a phase which was not computed by the light itself (e.g. from a recording), draw then
+        # counts down seconds_left until the next color change
+        self.color_phase = color_phase
+        self.start_ticks = current_ticks
+        self.countdown_start = seconds_left if color_phase is ColorPhase.YELLOW else seconds_left + self.yellow_phase
+    
+    def update(self, current_ticks: int) -> bool:
+        # Apply every color change which is due, returns if the color changed
+        changed = False
+        while current_ticks >= self.next_change_ticks:
+            self.__change_phase()
+            changed = True
+        
+        return changed
+    
+    def __change_phase(self) -> None:
         # when 2 and 1 seconds are left: Yellow 
-        if self.time_left <= self.yellow_phase and self.time_left != 0:
-            if self.starting_color_phase == ColorPhase.RED:
-                self.color_phase = ColorPhase.YELLOW
-                
-            elif self.starting_color_phase == ColorPhase.GREEN:
-                self.color_phase = ColorPhase.YELLOW
+        if self.color_phase is not ColorPhase.YELLOW:
+            self.color_phase = ColorPhase.YELLOW
 
         # when 0 seconds are letf, change the starting_color to red or green
-        elif self.time_left == 0:
+        else:
+            self.start_ticks = self.next_change_ticks # the new countdown starts exactly when the old one ended
+            
             if self.starting_color_phase == ColorPhase.RED:
                 self.color_phase = ColorPhase.GREEN
                 self.starting_color_phase = ColorPhase.GREEN
@@ -465,17 +573,25 @@ class TrafficLight:
                 self.color_phase = ColorPhase.RED
                 self.starting_color_phase = ColorPhase.RED
                 self.countdown_start: int = self.red_phase # restart the countdown for the timer
-            
-            self.start_ticks = pygame.time.get_ticks()
+        
+        self.next_change_ticks = self.__next_change()
+    
+    def __next_change(self) -> int:
+        # Yellow starts when yellow_phase seconds of the countdown are left, at the end of the countdown the color switches
+        # A countdown lasts at least a second, with 0 seconds the colors would change forever in the same tick
+        if self.color_phase is not ColorPhase.YELLOW:
+            return self.start_ticks + max(0, self.countdown_start - self.yellow_phase) * 1000
+        return self.start_ticks + max(1, self.countdown_start) * 1000
             
     def get_phase(self) -> str:
         return self.color_phase.name
 
-    def __remaining_time_text(self) -> None:
+    def __remaining_time_text(self) -> pygame.Rect:
         time_left = str(self.remaining_time)
         
-        self.text1 = self.my_font.render(time_left, True, Color.BLACK.value)
-        self.screen.blit(self.text1,(self.x + 5, self.y+60))
+        # there are only a few different numbers, every one is rendered once
+        self.text1 = assets.text(self.my_font, time_left, Color.BLACK.value)
+        return self.screen.blit(self.text1,(self.x + 5, self.y+60))
     
     def __set_img(self) -> None:
         scale = (20, 56)
@@ -484,10 +600,9 @@ class TrafficLight:
         self.img_yellow = self.__load_img('version_one/images/YellowTrafficLight.png', scale)
         self.img_red = self.__load_img('version_one/images/RedTrafficLight.png', scale)
     
-    def __load_img(self, url: str, scale: tuple[int,int]) -> pygame.image:
-        img = pygame.image.load(url)
-        img = pygame.transform.scale(img, scale)
-        return img
+    def __load_img(self, url: str, scale: tuple[int,int]) -> pygame.Surface:
+        # every traffic light shares the same three images
+        return assets.image(url, scale)
     
     @property
     def remaining_time(self) -> int:
@@ -0,0 +1,64 @@
+from __future__ import annotations
+from random import Random
+from constants import RoadDirections, RoadType, LANE_WIDTH
+from main import Simulation
+
+ROAD_WIDTH = 80
+INTERSECTION_SIZE = ROAD_WIDTH - LANE_WIDTH # the reduced side length of an intersection
+
+ROAD_DIRECTIONS_HOR = [RoadDirections.WEST, RoadDirections.EAST]
+ROAD_DIRECTIONS_VER = [RoadDirections.NORTH, RoadDirections.SOUTH]
+
+
+def generate_network(sim: Simulation, horizontal_lengths: list[float], vertical_lengths: list[float], start_x: float = 20, start_y: float = 20) -> None:
+    # A network of horizontal and vertical roads with an intersection wherever they cross.
+    # horizontal_lengths are the road segments of every row from west to east, vertical_lengths
+    # the segments of every column from north to south. Uses the measurements of Simulation.generate_map
+    # x of the road segments and intersections of a row, y of the segments and intersections of a column
+    segment_x, intersection_x = _positions(start_x, horizontal_lengths)
+    segment_y, row_y = _positions(start_y, vertical_lengths)
+    
+    for y in row_y:
+        for x, length in zip(segment_x, horizontal_lengths):
+            sim.create_road(x, y, length, ROAD_WIDTH, ROAD_DIRECTIONS_HOR, RoadType.HORIZONTAL)
+    
+    for x in intersection_x:
+        for y, length in zip(segment_y, vertical_lengths):
+            sim.create_road(x - LANE_WIDTH, y, length, ROAD_WIDTH, ROAD_DIRECTIONS_VER, RoadType.VERTICAL)
+    
+    for y in row_y:
+        for x in intersection_x:
+            sim.create_road(x, y + LANE_WIDTH, ROAD_WIDTH, ROAD_WIDTH, ROAD_DIRECTIONS_HOR + ROAD_DIRECTIONS_VER, RoadType.INTERSECTION)
+    
+    sim.sync_intersects_with_roads()
+    
+    # cars are removed when they leave the map instead of the screen
+    sim.SCREEN_WIDTH = segment_x[-1] + horizontal_lengths[-1] + start_x
+    sim.SCREEN_HEIGHT = segment_y[-1] + vertical_lengths[-1] + start_y
+
+
+def generate_grid(sim: Simulation, rows: int, cols: int, road_length: float = 220) -> None:
+    # rows x cols intersections, all roads have the same length
+    generate_network(sim, [road_length] * (cols + 1), [road_length] * (rows + 1))
+
+
+def generate_arterial(sim: Simulation, intersections: int, rng: Random, min_block: float = 150, max_block: float = 500, cross_length: float = 220) -> None:
+    # One long west-east arterial with cross streets at irregular distances
+    blocks = [rng.randint(min_block, max_block) for _ in range(intersections + 1)]
+    generate_network(sim, blocks, [cross_length, cross_length])
+
+
+def _positions(start: float, lengths: list[float]) -> tuple[list[float], list[float]]:
+    # Where every segment starts and where the intersection after it starts
+    segments, intersections = [], []
+    position = start
+    
+    for i, length in enumerate(lengths):
+        segments.append(position)
+        position += length
+        
+        if i < len(lengths) - 1:
+            intersections.append(position)
+            position += INTERSECTION_SIZE
+    
+    return segments, intersections
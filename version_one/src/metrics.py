@@ -0,0 +1,54 @@
+from __future__ import annotations
+import statistics
+
+
+class TrafficMetrics:
+    # Collects the traffic statistics of one simulation run, sample is called after every step.
+    # Delay is the time a car stands still, the queue length is the amount of standing cars.
+    # Only what happens after the creation counts, e.g. a run which continues a snapshot
+    def __init__(self, sim) -> None:
+        self.start_spawned: int = sim.spawned_cars
+        self.start_despawned: int = sim.despawned_cars
+        self.steps: int = 0
+        self.simulated_time: float = 0
+        self.stopped_time: float = 0 # vehicle seconds
+        self.queue_sum: int = 0 # standing cars summed over the steps, a long run keeps no list of them
+        self.max_queue: int = 0
+        self.spawned_cars: int = 0
+        self.despawned_cars: int = 0
+
+    def sample(self, sim) -> None:
+        stopped = sim.stopped_car_count()
+
+        self.steps += 1
+        self.simulated_time += sim.delta_time
+        self.stopped_time += stopped * sim.delta_time
+        self.queue_sum += stopped
+        self.max_queue = max(self.max_queue, stopped)
+        self.spawned_cars = sim.spawned_cars - self.start_spawned
+        self.despawned_cars = sim.despawned_cars - self.start_despawned
+
+    def summary(self) -> dict[str, float]:
+        hours = self.simulated_time / 3600
+        return {
+            "throughput_per_hour": self.despawned_cars / hours if hours else 0.0,
+            "mean_delay_s": self.stopped_time / self.spawned_cars if self.spawned_cars else 0.0,
+            "mean_queue_length": self.queue_sum / self.steps if self.steps else 0.0,
+            "max_queue_length": self.max_queue,
+            "spawned_cars": self.spawned_cars,
+            "despawned_cars": self.despawned_cars,
+        }
+
+
+def aggregate(summaries: list[dict[str, float]]) -> dict[str, dict[str, float]]:
+    # Mean, standard deviation and range of every metric over the runs of one scenario
+    result = {}
+    for name in summaries[0]:
+        values = [summary[name] for summary in summaries]
+        result[name] = {
+            "mean": statistics.fmean(values),
+            "stdev": statistics.stdev(values) if len(values) > 1 else 0.0,
+            "min": min(values),
+            "max": max(values),
+        }
+    return result
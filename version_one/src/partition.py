@@ -0,0 +1,196 @@
+from __future__ import annotations
+import weakref
+from collections import deque
+from multiprocessing import Barrier, Pipe, Process
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from constants import RoadType
+from fleet import Fleet, VehicleState
+from map import Road, TrafficLight
+from routing import Router
+
+NO_OWNER = -1
+
+
+def partition_roads(roads: list[Road], regions: int) -> np.ndarray:
+    # Splits the network into regions of neighbouring intersections: the intersections are visited
+    # breadth first over connected_roads and the visiting order is cut into equal parts.
+    # Every road belongs to the region of the first intersection it is connected with
+    road_ids = {road: i for i, road in enumerate(roads)}
+    intersections = [road for road in roads if road.road_type is RoadType.INTERSECTION]
+
+    order = []
+    visited = set()
+    for start in intersections: # restarts for parts of the network which are not connected
+        if start in visited:
+            continue
+
+        visited.add(start)
+        queue = deque([start])
+        while queue:
+            intersection = queue.popleft()
+            order.append(intersection)
+
+            for road in intersection.connected_roads.values():
+                for neighbour in road.downstream.values():
+                    if neighbour not in visited:
+                        visited.add(neighbour)
+                        queue.append(neighbour)
+
+    region_of = np.full(len(roads), NO_OWNER, dtype=np.int16)
+    for position, intersection in enumerate(order):
+        region = position * regions // len(order)
+        region_of[road_ids[intersection]] = region
+
+        for road in intersection.connected_roads.values():
+            if region_of[road_ids[road]] == NO_OWNER:
+                region_of[road_ids[road]] = region
+
+    region_of[region_of == NO_OWNER] = 0 # roads without an intersection
+    return region_of
+
+
+class SharedBlock:
+    # The vehicle state, the owner of every vehicle, the waiting lights and the map file in one shared memory block.
+    # The workers load the map from the block, so it is not copied into the arguments of every process
+    def __init__(self, capacity: int, light_count: int, map_size: int, name: str | None = None) -> None:
+        state_size = VehicleState.nbytes(capacity)
+        owner_size = capacity * np.dtype(np.int16).itemsize
+        waiting_size = (light_count + 1 + 7) // 8 * 8 # the map columns are 8 byte aligned
+        size = state_size + owner_size + waiting_size + map_size
+
+        self.memory = SharedMemory(name, create=name is None, size=size)
+        self.state = VehicleState(capacity, self.memory.buf)
+        self.owner = np.ndarray(capacity, dtype=np.int16, buffer=self.memory.buf, offset=state_size)
+        self.waiting = np.ndarray(light_count + 1, dtype=np.bool_, buffer=self.memory.buf, offset=state_size + owner_size)
+        self.map_data = self.memory.buf[state_size + owner_size + waiting_size:size]
+
+    def close(self) -> None:
+        # the arrays have to be released before the memory can be closed
+        self.state = self.owner = self.waiting = None
+        self.map_data.release()
+        self.memory.close()
+
+
+class PartitionedFleet(Fleet):
+    # A Fleet of one large network, stepped by one worker process per region.
+    # The vehicles live in shared memory and belong to the region of their road. A tick has two phases:
+    # every worker looks up the roads of its vehicles and hands vehicles which entered a road of another
+    # region over, after a barrier every worker moves its vehicles. Lanes never cross regions, so the
+    # leader of a vehicle always belongs to the same worker
+    DEFAULT_CAPACITY = 1 << 18
+
+    def __init__(self, roads: list[Road], traffic_lights: list[TrafficLight], map_data: bytes, regions: int, seed: int | None = None,
+                 screen=None, capacity: int = DEFAULT_CAPACITY) -> None:
+        super().__init__(roads, traffic_lights, seed, screen, capacity=1) # the state is replaced with the shared one
+        self.regions = regions
+        self.region_of = partition_roads(roads, regions)
+
+        self.block = SharedBlock(capacity, len(traffic_lights), len(map_data))
+        self.block.map_data[:] = map_data
+        self.state = self.block.state
+        self.owner = self.block.owner
+        self.waiting = self.block.waiting
+        self.update_signals(traffic_lights)
+
+        self.seeds = np.random.SeedSequence(seed).spawn(regions)
+        self.connections = []
+        self.workers = []
+        weakref.finalize(self, _shutdown, self.connections, self.workers, self.block)
+
+    def spawn(self, x, y, direction) -> int:
+        slot = super().spawn(x, y, direction)
+        self.owner[slot] = NO_OWNER # the first road lookup decides the region
+        return slot
+
+    def spawn_batch(self, x, y, direction, road, destination) -> np.ndarray:
+        slots = super().spawn_batch(x, y, direction, road, destination)
+        self.owner[slots] = self.region_of[road] # the road is known, so is the region
+        return slots
+
+    def step(self, delta_time: float) -> None:
+        if not self.workers: # started with the first step, so changed settings like the safety distance are used
+            self.__start_workers()
+        
+        for connection in self.connections:
+            connection.send((self.state.size, delta_time))
+        for connection in self.connections:
+            connection.recv()
+
+    def close(self) -> None:
+        self.state = self.owner = self.waiting = None
+        _shutdown(self.connections, self.workers, self.block)
+
+    def __start_workers(self) -> None:
+        barrier = Barrier(self.regions)
+        for region in range(self.regions):
+            connection, worker_connection = Pipe()
+            worker = Process(target=_run_region, daemon=True, args=(
+                region, self.block.memory.name, self.state.capacity, len(self.traffic_lights), len(self.block.map_data), self.region_of,
+                self.seeds[region], self.safety_distance, self.speed, self.car_following, self.router is not None, barrier,
+                worker_connection))
+            worker.start()
+            self.connections.append(connection)
+            self.workers.append(worker)
+
+
+def _run_region(region: int, memory_name: str, capacity: int, light_count: int, map_size: int, region_of: np.ndarray, seed,
+                safety_distance: float, speed: float, car_following: str, routing: bool, barrier, connection) -> None:
+    # Worker process of one region. The map is loaded from the map file in the shared block, so are the vehicles.
+    # A worker routes with the shortest paths, the travel times seen by the main process stay there
+    from main import HeadlessGame
+    from map_file import load_map
+
+    block = SharedBlock(capacity, light_count, map_size, memory_name)
+    sim = HeadlessGame()
+    load_map(block.map_data, sim)
+    fleet = Fleet(sim.roads, sim.traffic_lights, seed)
+    fleet.safety_distance = safety_distance
+    fleet.speed = speed
+    fleet.car_following = car_following # the drivers of the vehicles are in the shared state
+    if routing:
+        fleet.router = Router(sim.roads, speed)
+
+    fleet.state = block.state
+    fleet.waiting = block.waiting
+
+    while True:
+        command = connection.recv()
+        if command is None:
+            break
+
+        size, delta_time = command
+        fleet.state.size = size
+        owner = block.owner[:size]
+
+        # vehicles without a road yet are handled by the first region
+        entered = fleet.locate(_owned(owner, region))
+        owner[entered] = region_of[fleet.state.road[entered]]
+        barrier.wait()
+
+        fleet.advance(delta_time, _owned(owner, region))
+        connection.send(None)
+
+    fleet.state = fleet.waiting = owner = None
+    block.close()
+
+
+def _owned(owner: np.ndarray, region: int) -> np.ndarray:
+    if region == 0:
+        return (owner == region) | (owner == NO_OWNER)
+    return owner == region
+
+
+def _shutdown(connections, workers, block: SharedBlock) -> None:
+    for connection, worker in zip(connections, workers):
+        if worker.is_alive():
+            connection.send(None)
+    for worker in workers:
+        worker.join()
+
+    connections.clear()
+    workers.clear()
+    if block.memory is not None:
+        block.close()
+        block.memory.unlink()
+        block.memory = None
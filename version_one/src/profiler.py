@@ -0,0 +1,97 @@
+from __future__ import annotations
+import json
+import time
+from collections import deque
+from time import perf_counter
+import pygame
+from constants import Color
+
+
+class Profiler:
+    # Collects how long the phases of every frame take. A disabled profiler costs one call per phase
+    # of a step and one attribute lookup per car.
+    # Timings of one frame are summed per phase, the last window frames are kept for the overlay and the dump
+    def __init__(self, window: int = 120) -> None:
+        self.enabled: bool = False
+        self.overlay: bool = False
+        self.frames: deque[dict[str, float]] = deque(maxlen=window)
+        self.current: dict[str, float] = {}
+
+        self.dump_path: str | None = None
+        self.dump_interval: float = 10 # wall clock seconds
+        self.last_dump: float = perf_counter()
+
+        self.font: pygame.font.Font | None = None
+
+    def enable(self, overlay: bool = False, dump_path: str | None = None, dump_interval: float = 10, window: int | None = None) -> None:
+        if window is not None:
+            self.frames = deque(maxlen=window)
+        
+        self.enabled = True
+        self.overlay = overlay
+        self.dump_path = dump_path
+        self.dump_interval = dump_interval
+
+    def disable(self) -> None:
+        self.enabled = False
+        self.overlay = False
+        self.frames.clear()
+        self.current = {}
+
+    def lap(self, phase: str, start: float) -> float:
+        # Adds the time since start to the phase and returns the start of the next phase. A disabled profiler
+        # only returns the time, so the timed code has one path. Code which runs for every car checks enabled first
+        now = perf_counter()
+        if self.enabled:
+            self.current[phase] = self.current.get(phase, 0) + now - start
+        return now
+
+    def end_frame(self) -> None:
+        self.frames.append(self.current)
+        self.current = {}
+
+        if self.dump_path is not None and perf_counter() - self.last_dump >= self.dump_interval:
+            self.dump()
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        # mean and max milliseconds per frame of every phase over the window
+        frames = len(self.frames)
+        if not frames:
+            return {}
+
+        totals: dict[str, float] = {}
+        peaks: dict[str, float] = {}
+        for frame in self.frames:
+            for phase, seconds in frame.items():
+                totals[phase] = totals.get(phase, 0) + seconds
+                peaks[phase] = max(peaks.get(phase, 0), seconds)
+
+        return {phase: {"mean_ms": totals[phase] / frames * 1000, "max_ms": peaks[phase] * 1000} for phase in totals}
+
+    def dump(self) -> None:
+        # one json line per dump, so a long run can be followed with tail
+        self.last_dump = perf_counter()
+        with open(self.dump_path, "a") as file:
+            file.write(json.dumps({"time": time.time(), "frames": len(self.frames), "phases": self.summary()}) + "\n")
+
+    def draw_overlay(self, screen: pygame.Surface) -> pygame.Rect:
+        # The slowest phases first. The numbers change every frame, so the lines are not cached in assets
+        if self.font is None:
+            self.font = pygame.font.SysFont("monospace", 14)
+
+        lines = [f"{phase:<20}{values['mean_ms']:7.3f} {values['max_ms']:7.3f} ms"
+                 for phase, values in sorted(self.summary().items(), key=lambda item: -item[1]["mean_ms"])]
+        lines.insert(0, f"{'phase':<20}{'mean':>7} {'max':>7}")
+
+        line_height = self.font.get_linesize()
+        width = max(self.font.size(line)[0] for line in lines) + 10
+        area = pygame.Rect(5, 5, width, line_height * len(lines) + 10)
+
+        pygame.draw.rect(screen, Color.BLACK.value, area)
+        for i, line in enumerate(lines):
+            screen.blit(self.font.render(line, True, Color.WHITE.value), (area.x + 5, area.y + 5 + i * line_height))
+        return area
+
+
+# Process wide profiler, like the asset cache there is one per process
+PROFILER = Profiler()
@@ -0,0 +1,293 @@
+from __future__ import annotations
+import struct
+import zlib
+from bisect import bisect_right
+from contextlib import ExitStack
+from functools import lru_cache
+import numpy as np
+from constants import EventKind, DIRECTION_CODES, PHASE_CODES
+
+# Recording format: a header, then chunks of rows and at the end an index of all chunks.
+# A chunk holds the columns of its rows one after another, optionally compressed as a whole.
+# Without the index (e.g. after a crash) the chunks can still be read one by one
+MAGIC = b"TSREC"
+VERSION = 2
+
+HEADER = struct.Struct("<5sBxxd") # magic, version, step size
+CHUNK = struct.Struct("<BBxxIqqQ") # kind, compressed, rows, first step, last step, payload size
+INDEX_ENTRY = struct.Struct("<BxxxIqqQ") # kind, rows, first step, last step, offset of the chunk
+TRAILER = struct.Struct("<QI5s") # offset of the index, chunks, magic
+
+# Chunk kinds
+TRAJECTORY = 0
+EVENTS = 1
+MAP = 2
+STEPS = 3 # one row for every recorded step with the amount of its trajectory rows, also for a step without vehicles
+
+SCHEMAS = {
+    TRAJECTORY: (("step", "<i8"), ("id", "<i8"), ("x", "<f4"), ("y", "<f4"), ("direction", "<i1"), ("driving", "<u1")),
+    EVENTS: (("step", "<i8"), ("kind", "<u1"), ("subject", "<i8"), ("x", "<f4"), ("y", "<f4"), ("value", "<i1")),
+    STEPS: (("step", "<i8"), ("rows", "<u4")),
+}
+
+
+class ChunkBuffer:
+    # Fixed size column buffers, so a recording never needs more memory than one chunk per kind
+    def __init__(self, kind: int, rows: int) -> None:
+        self.kind = kind
+        self.columns = {name: np.zeros(rows, dtype=dtype) for name, dtype in SCHEMAS[kind]}
+        self.capacity = rows
+        self.size = 0
+
+    def free(self) -> int:
+        return self.capacity - self.size
+
+    def append(self, values: dict[str, np.ndarray], start: int, stop: int) -> None:
+        count = stop - start
+        for name, column in self.columns.items():
+            value = values[name]
+            column[self.size:self.size + count] = value[start:stop] if np.ndim(value) else value
+        self.size += count
+
+
+class Recorder:
+    # Streams the vehicle states of every n-th step and all events of a simulation into a file
+    def __init__(self, path: str, sim, every: int = 1, chunk_rows: int = 1 << 16, compress: bool = False, level: int = 1) -> None:
+        self.sim = sim
+        self.every = every
+        self.compress = compress
+        self.level = level
+
+        self.index: list[tuple[int, int, int, int, int]] = []
+        self.trajectory = ChunkBuffer(TRAJECTORY, chunk_rows)
+        self.events = ChunkBuffer(EVENTS, chunk_rows)
+        self.steps = ChunkBuffer(STEPS, chunk_rows)
+
+        # the map is part of the recording, so it can be replayed without the original map
+        from map_file import map_bytes
+        with ExitStack() as stack:
+            self.file = stack.enter_context(open(path, "wb"))
+            self.file.write(HEADER.pack(MAGIC, VERSION, sim.clock.step_size))
+            self.__write_chunk(MAP, 0, sim.clock.steps, sim.clock.steps, map_bytes(sim))
+            stack.pop_all() # written, the file stays open until close
+
+        sim.step_hooks.append(self.record_step)
+        sim.add_event_hook(self.record_events)
+        
+        # the colors at the start, later only the changes are recorded
+        lights = sim.traffic_lights
+        self.record_events(sim.clock.steps, EventKind.PHASE_CHANGE, [sim.light_ids[tl] for tl in lights], [tl.x for tl in lights],
+                           [tl.y for tl in lights], [PHASE_CODES[tl.color_phase] for tl in lights])
+
+    def record_step(self) -> None:
+        step = self.sim.clock.steps
+        if step % self.every:
+            return
+
+        sim = self.sim
+        if sim.fleet is not None:
+            state = sim.fleet.state
+            alive = np.flatnonzero(state.alive[:state.size])
+            values = {
+                "id": state.id[alive],
+                "x": state.x[alive],
+                "y": state.y[alive],
+                "direction": state.direction[alive],
+                "driving": state.driving[alive],
+            }
+        else:
+            cars = [car.logic for car in sim.cars.values()]
+            values = {
+                "id": np.fromiter((car.id for car in cars), np.int64, len(cars)),
+                "x": np.fromiter((car.x for car in cars), np.float32, len(cars)),
+                "y": np.fromiter((car.y for car in cars), np.float32, len(cars)),
+                "direction": np.fromiter((DIRECTION_CODES[car.driving_direction] for car in cars), np.int8, len(cars)),
+                "driving": np.fromiter((car.driving for car in cars), np.uint8, len(cars)),
+            }
+
+        rows = len(values["id"])
+        values["step"] = step
+        self.__append(self.steps, {"step": step, "rows": rows}, 1)
+        self.__append(self.trajectory, values, rows)
+
+    def record_events(self, step: int, kind: EventKind, ids, xs, ys, values) -> None:
+        ids = np.asarray(ids, dtype=np.int64)
+        self.__append(self.events, {"step": step, "kind": kind.value, "subject": ids, "x": np.asarray(xs),
+                                    "y": np.asarray(ys), "value": np.asarray(values)}, len(ids))
+
+    def close(self) -> None:
+        if self.file.closed:
+            return
+
+        self.sim.step_hooks.remove(self.record_step)
+        self.sim.event_hooks.remove(self.record_events)
+
+        # the file is closed also when a chunk can not be written, the complete chunks before can still be read
+        with self.file:
+            self.__flush(self.trajectory)
+            self.__flush(self.events)
+
+            index_offset = self.file.tell()
+            for entry in self.index:
+                self.file.write(INDEX_ENTRY.pack(*entry))
+            self.file.write(TRAILER.pack(index_offset, len(self.index), MAGIC))
+
+    def __enter__(self) -> Recorder:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __append(self, buffer: ChunkBuffer, values: dict, rows: int) -> None:
+        start = 0
+        while start < rows:
+            stop = min(rows, start + buffer.free())
+            buffer.append(values, start, stop)
+            start = stop
+            if not buffer.free():
+                self.__flush(buffer)
+
+    def __flush(self, buffer: ChunkBuffer) -> None:
+        if buffer is self.trajectory:
+            # the steps go first, so even a recording which was not closed knows the steps of every trajectory chunk
+            self.__flush(self.steps)
+        if not buffer.size:
+            return
+
+        steps = buffer.columns["step"][:buffer.size]
+        payload = b"".join(column[:buffer.size].tobytes() for column in buffer.columns.values())
+        self.__write_chunk(buffer.kind, buffer.size, int(steps[0]), int(steps[-1]), payload)
+        buffer.size = 0
+
+    def __write_chunk(self, kind: int, rows: int, first_step: int, last_step: int, payload: bytes) -> None:
+        if self.compress:
+            payload = zlib.compress(payload, self.level)
+
+        self.index.append((kind, rows, first_step, last_step, self.file.tell()))
+        self.file.write(CHUNK.pack(kind, self.compress, rows, first_step, last_step, len(payload)))
+        self.file.write(payload)
+
+
+class RecordingReader:
+    # Reads a recording chunk by chunk, only the chunks of the requested steps are loaded
+    def __init__(self, path: str) -> None:
+        with ExitStack() as stack:
+            self.file = stack.enter_context(open(path, "rb"))
+            magic, version, self.step_size = HEADER.unpack(self.file.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError("This is not a recording")
+            if version != VERSION:
+                raise ValueError(f"The recording has version {version}, only version {VERSION} is supported")
+
+            self.index = self.__read_index()
+            
+            # the trajectory chunks are in step order, so the chunk of a step is found by bisection
+            self.frame_chunks = [entry for entry in self.index if entry[0] == TRAJECTORY]
+            self.frame_starts = [entry[2] for entry in self.frame_chunks]
+            self.__chunk_columns = lru_cache(maxsize=8)(self.__load_frame_chunk)
+            
+            # every recorded step and its amount of vehicles, a few bytes per step
+            steps = self.steps()
+            self.recorded_steps, self.step_rows = steps["step"], steps["rows"]
+            stack.pop_all() # the file stays open for reading until close
+
+    def map_data(self) -> bytes:
+        entry = next(entry for entry in self.index if entry[0] == MAP)
+        return self.__read_chunk(entry[4])[1]
+
+    def trajectory(self, first_step: int = 0, last_step: int | None = None) -> dict[str, np.ndarray]:
+        return self.__read_rows(TRAJECTORY, first_step, last_step)
+
+    def events(self, first_step: int = 0, last_step: int | None = None) -> dict[str, np.ndarray]:
+        return self.__read_rows(EVENTS, first_step, last_step)
+
+    def steps(self, first_step: int = 0, last_step: int | None = None) -> dict[str, np.ndarray]:
+        # the recorded steps with their amount of vehicles, a step with an empty map has 0 rows
+        return self.__read_rows(STEPS, first_step, last_step)
+
+    def frame(self, step: int) -> dict[str, np.ndarray]:
+        # The vehicle states of the last recorded step at or before step, nothing when the map was empty then.
+        # Only the chunks of this step are read, the last few are cached for playback and scrubbing
+        recorded = np.searchsorted(self.recorded_steps, step, "right") - 1
+        position = bisect_right(self.frame_starts, self.recorded_steps[recorded]) - 1 if recorded >= 0 else -1
+        if position < 0 or not self.step_rows[recorded]:
+            return {name: np.zeros(0, dtype) for name, dtype in SCHEMAS[TRAJECTORY]}
+        recorded = int(self.recorded_steps[recorded])
+        
+        # the rows of one step can start in earlier chunks
+        first = position
+        while first > 0 and self.frame_chunks[first - 1][3] == recorded:
+            first -= 1
+        
+        parts = []
+        for chunk in range(first, position + 1):
+            columns = self.__chunk_columns(chunk)
+            rows = slice(*np.searchsorted(columns["step"], [recorded, recorded + 1]))
+            parts.append({name: column[rows] for name, column in columns.items()})
+        
+        return {name: np.concatenate([part[name] for part in parts]) for name, _ in SCHEMAS[TRAJECTORY]}
+    
+    @property
+    def last_step(self) -> int:
+        return max((entry[3] for entry in self.index), default=0)
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self) -> RecordingReader:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __read_rows(self, kind: int, first_step: int, last_step: int | None) -> dict[str, np.ndarray]:
+        last_step = self.last_step if last_step is None else last_step
+        parts = []
+        for entry_kind, rows, chunk_first, chunk_last, offset in self.index:
+            if entry_kind == kind and chunk_last >= first_step and chunk_first <= last_step:
+                parts.append(self.__columns(kind, rows, self.__read_chunk(offset)[1]))
+
+        columns = {name: np.concatenate([part[name] for part in parts]) if parts else np.zeros(0, dtype)
+                   for name, dtype in SCHEMAS[kind]}
+        selected = (columns["step"] >= first_step) & (columns["step"] <= last_step)
+        return {name: column[selected] for name, column in columns.items()}
+
+    def __load_frame_chunk(self, position: int) -> dict[str, np.ndarray]:
+        _, rows, _, _, offset = self.frame_chunks[position]
+        return self.__columns(TRAJECTORY, rows, self.__read_chunk(offset)[1])
+
+    def __columns(self, kind: int, rows: int, payload: bytes) -> dict[str, np.ndarray]:
+        columns = {}
+        offset = 0
+        for name, dtype in SCHEMAS[kind]:
+            columns[name] = np.frombuffer(payload, dtype=dtype, count=rows, offset=offset)
+            offset += rows * np.dtype(dtype).itemsize
+        return columns
+
+    def __read_chunk(self, offset: int) -> tuple[tuple, bytes]:
+        self.file.seek(offset)
+        header = CHUNK.unpack(self.file.read(CHUNK.size))
+        payload = self.file.read(header[5])
+        return header, zlib.decompress(payload) if header[1] else payload
+
+    def __read_index(self) -> list[tuple[int, int, int, int, int]]:
+        end = self.file.seek(0, 2)
+        if end >= HEADER.size + TRAILER.size:
+            self.file.seek(end - TRAILER.size)
+            index_offset, count, magic = TRAILER.unpack(self.file.read(TRAILER.size))
+            if magic == MAGIC:
+                self.file.seek(index_offset)
+                return [INDEX_ENTRY.unpack(self.file.read(INDEX_ENTRY.size)) for _ in range(count)]
+
+        # the recording was not closed: walk over the chunks
+        index = []
+        offset = HEADER.size
+        while offset + CHUNK.size <= end:
+            self.file.seek(offset)
+            kind, _, rows, first_step, last_step, size = CHUNK.unpack(self.file.read(CHUNK.size))
+            if offset + CHUNK.size + size > end:
+                break # the last chunk was not written completely
+            index.append((kind, rows, first_step, last_step, offset))
+            offset += CHUNK.size + size
+        return index
+
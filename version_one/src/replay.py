@@ -0,0 +1,152 @@
+from __future__ import annotations
+import argparse
+import math
+import sys
+import numpy as np
+import pygame
+from constants import Color, ColorPhase, EventKind, DIRECTIONS
+from main import Game
+from map_file import load_map, read_map
+from recorder import RecordingReader
+from verhicles import CarUI
+
+PHASES = list(ColorPhase)
+TIMELINE_HEIGHT = 12
+
+
+class ReplayCar:
+    # A recorded car position, drawn by the CarUI of its direction
+    __slots__ = ("ui", "x", "y")
+
+    def __init__(self, ui: CarUI, x: float, y: float) -> None:
+        self.ui = ui
+        self.x = x
+        self.y = y
+
+    def draw(self) -> pygame.Rect:
+        return self.ui.draw(self.x, self.y)
+
+
+class Replay(Game):
+    # Plays a recording back with the rendering of the Game, nothing is simulated.
+    # Space pauses, left and right seek 5 seconds (with shift 60), up and down change the speed,
+    # r reverses and a click or drag on the timeline at the bottom jumps to that point
+    def __init__(self, path: str, speed: float = 1) -> None:
+        self.reader = RecordingReader(path)
+        map_data = read_map(self.reader.map_data())
+
+        # the window has the size of the recorded world
+        self.SCREEN_WIDTH = int(map_data.world_width)
+        self.SCREEN_HEIGHT = int(map_data.world_height)
+        super().__init__(self.reader.step_size)
+        pygame.display.set_caption("Traffic simulation replay")
+        load_map(map_data, self)
+
+        self.speed = speed
+        self.paused = False
+        self.position: float = 0 # the shown step, fractional steps are used for slow motion
+        self.last_step = self.reader.last_step
+        self.car_uis = {code: CarUI(self.screen, direction) for code, direction in enumerate(DIRECTIONS)}
+
+        self.__load_phases()
+        self.timeline = pygame.Rect(0, self.SCREEN_HEIGHT - TIMELINE_HEIGHT, self.SCREEN_WIDTH, TIMELINE_HEIGHT)
+        self.scrubbing = False
+
+    def __load_phases(self) -> None:
+        # The color changes of every light, the color at a step is the last change before it
+        events = self.reader.events()
+        changes = events["kind"] == EventKind.PHASE_CHANGE.value
+        lights, steps, phases = events["subject"][changes], events["step"][changes], events["value"][changes]
+
+        order = np.lexsort((steps, lights))
+        self.phase_changes = []
+        for light in range(len(self.traffic_lights)):
+            selected = order[lights[order] == light]
+            self.phase_changes.append((steps[selected], phases[selected]))
+
+    def seek(self, step: float) -> None:
+        self.position = min(max(step, 0), self.last_step)
+
+    def handle_events(self) -> None:
+        steps_per_second = 1 / self.reader.step_size
+
+        for event in pygame.event.get():
+            match event.type:
+                case pygame.QUIT:
+                    self.reader.close()
+                    pygame.quit()
+                    sys.exit()
+
+                case pygame.KEYDOWN:
+                    seconds = 60 if event.mod & pygame.KMOD_SHIFT else 5
+                    match event.key:
+                        case pygame.K_SPACE:
+                            self.paused = not self.paused
+                        case pygame.K_RIGHT:
+                            self.seek(self.position + seconds * steps_per_second)
+                        case pygame.K_LEFT:
+                            self.seek(self.position - seconds * steps_per_second)
+                        case pygame.K_UP:
+                            self.speed *= 2
+                        case pygame.K_DOWN:
+                            self.speed /= 2
+                        case pygame.K_r:
+                            self.speed = -self.speed
+                        case pygame.K_HOME:
+                            self.seek(0)
+
+                case pygame.MOUSEBUTTONDOWN if self.timeline.collidepoint(event.pos):
+                    self.scrubbing = True
+                    self.__scrub(event.pos[0])
+
+                case pygame.MOUSEMOTION if self.scrubbing:
+                    self.__scrub(event.pos[0])
+
+                case pygame.MOUSEBUTTONUP:
+                    self.scrubbing = False
+
+    def __scrub(self, x: int) -> None:
+        self.seek(x / self.timeline.width * self.last_step)
+
+    def update(self) -> None:
+        if not self.paused and not self.scrubbing:
+            self.seek(self.position + self.speed)
+
+        step = int(self.position)
+        self.clock.steps = step # the traffic lights count down with the ticks of the clock
+        self.__show_phases(step)
+
+    def __show_phases(self, step: int) -> None:
+        current_ticks = self.get_ticks()
+        for traffic_light, (steps, phases) in zip(self.traffic_lights, self.phase_changes):
+            change = np.searchsorted(steps, step, "right") - 1
+            if change < 0:
+                continue
+
+            # the countdown shows the seconds until the next recorded change
+            next_change = steps[change + 1] if change + 1 < len(steps) else step
+            seconds_left = math.ceil((next_change - step) * self.reader.step_size)
+            traffic_light.show(PHASES[phases[change]], seconds_left, current_ticks)
+
+    def all_cars(self) -> list[ReplayCar]:
+        frame = self.reader.frame(int(self.position))
+        car_uis = self.car_uis
+        return [ReplayCar(car_uis[direction], x, y) for direction, x, y in zip(frame["direction"].tolist(), frame["x"].tolist(), frame["y"].tolist())]
+
+    def draw(self) -> None:
+        super().draw()
+
+        # the timeline is drawn over everything else in every frame
+        progress = self.position / self.last_step if self.last_step else 0
+        pygame.draw.rect(self.screen, Color.BLACK.value, self.timeline)
+        pygame.draw.rect(self.screen, Color.WHITE.value, (0, self.timeline.y, int(progress * self.timeline.width), TIMELINE_HEIGHT))
+        pygame.display.update(self.timeline)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play a recorded simulation back")
+    parser.add_argument("recording", help="recording written with --record")
+    parser.add_argument("--speed", type=float, default=1, help="recorded steps per shown frame")
+    args = parser.parse_args()
+
+    Replay(args.recording, args.speed).play()
@@ -0,0 +1,131 @@
+from __future__ import annotations
+import heapq
+import numpy as np
+from functools import lru_cache
+from constants import RoadDirections, RoadType, CAR_SPEED, DIRECTIONS, DIRECTION_CODES, OPPOSITE_DIRECTIONS
+from map import Road
+
+NO_TURN = -1
+HORIZONTAL_DIRECTIONS = (RoadDirections.WEST, RoadDirections.EAST)
+
+
+def lane_length(road: Road, direction: RoadDirections) -> float:
+    min_x, min_y, max_x, max_y = road.bounds
+    return max_x - min_x if direction in HORIZONTAL_DIRECTIONS else max_y - min_y
+
+
+class Router:
+    # Shortest paths over the lanes of the map. A lane is a road in one direction with the key
+    # road id * 4 + direction code (like in the fleet), it leads over the intersection at its end into the
+    # lanes of the possible turns. Driving through a lane costs the time to cross the intersection before it
+    # and to drive along the road. For every destination road a next hop table tells each lane which turn
+    # to take, a table is build the first time a car wants to go there and the last cache_size tables are kept
+    def __init__(self, roads: list[Road], speed: float = CAR_SPEED, cache_size: int = 64) -> None:
+        self.roads = roads
+        self.road_ids: dict[Road, int] = {road: i for i, road in enumerate(roads)}
+
+        lanes = len(roads) * 4
+        self.free_flow = np.full(lanes, np.inf, dtype=np.float64) # seconds to drive through a lane
+        self.predecessors: list[list[tuple[int, int]]] = [[] for _ in range(lanes)] # lane -> (lane before, turn code)
+
+        for road_id, road in enumerate(roads):
+            if road.road_type is RoadType.INTERSECTION:
+                continue
+
+            for direction in road.directions:
+                lane = road_id * 4 + DIRECTION_CODES[direction]
+                before = road.downstream.get(OPPOSITE_DIRECTIONS[direction])
+                length = lane_length(road, direction) + (lane_length(before, direction) if before is not None else 0)
+                self.free_flow[lane] = length / speed
+
+                intersection = road.downstream.get(direction)
+                route = intersection.get_route(direction, road) if intersection is not None else None
+                if route is None:
+                    continue
+                for turn, next_road in route.roads.items():
+                    if next_road.road_type is not RoadType.INTERSECTION:
+                        self.predecessors[self.road_ids[next_road] * 4 + DIRECTION_CODES[turn]].append((lane, DIRECTION_CODES[turn]))
+
+        self.weights = self.free_flow.copy()
+        self.table = lru_cache(maxsize=cache_size)(self.__build_table)
+
+    def next_turn(self, road: Road, direction: RoadDirections, destination: Road) -> RoadDirections | None:
+        # The turn at the end of the lane towards the destination, None when it can not be reached from there
+        code = self.table(self.road_ids[destination])[self.road_ids[road] * 4 + DIRECTION_CODES[direction]]
+        return DIRECTIONS[code] if code != NO_TURN else None
+
+    def __build_table(self, destination: int) -> np.ndarray:
+        # Dijkstra backwards from the lanes of the destination road: the cost of a lane is the time from its
+        # end to the destination, its next hop the turn into the cheapest lane after it
+        cost = np.full(len(self.weights), np.inf)
+        next_hop = np.full(len(self.weights), NO_TURN, dtype=np.int8)
+        weights, predecessors = self.weights.tolist(), self.predecessors
+
+        heap = []
+        for code in range(4):
+            lane = destination * 4 + code
+            if weights[lane] != np.inf:
+                cost[lane] = 0
+                heap.append((0.0, lane))
+
+        done = set()
+        while heap:
+            lane_cost, lane = heapq.heappop(heap)
+            if lane in done:
+                continue
+            done.add(lane)
+
+            through = lane_cost + weights[lane]
+            for before, turn in predecessors[lane]:
+                if through < cost[before]:
+                    cost[before] = through
+                    next_hop[before] = turn
+                    heapq.heappush(heap, (through, before))
+
+        # the destination road is reached, nothing to decide there anymore
+        next_hop[destination * 4:destination * 4 + 4] = NO_TURN
+        return next_hop
+
+    def observe(self, current_ticks: int) -> None:
+        # called after every step, the shortest paths do not change
+        pass
+
+
+class TravelTimeRouter(Router):
+    # The cost of a lane follows the traffic: every interval seconds the standing cars of each lane are read
+    # from the queue sensors and delay_per_car seconds per car are added to its free flow time. The weights
+    # move smoothly towards these observations, only when a weight changed by more than min_change seconds
+    # the tables are dropped and build again with the new weights when they are needed
+    def __init__(self, roads: list[Road], sim, speed: float = CAR_SPEED, cache_size: int = 64, interval: float = 10,
+                 delay_per_car: float = 2.0, smoothing: float = 0.5, min_change: float = 1.0) -> None:
+        super().__init__(roads, speed, cache_size)
+        self.sim = sim
+        self.interval = interval
+        self.delay_per_car = delay_per_car
+        self.smoothing = smoothing
+        self.min_change = min_change
+        self.last_update_ticks: int = sim.get_ticks()
+
+        self.lane_keys = np.flatnonzero(np.isfinite(self.free_flow))
+        self.sensors = [sim.queue_sensor(roads[lane // 4], DIRECTIONS[lane % 4]) for lane in self.lane_keys.tolist()]
+        self.observed = self.free_flow[self.lane_keys].copy() # weights of the tables in the cache
+
+    def observe(self, current_ticks: int) -> None:
+        if current_ticks - self.last_update_ticks < self.interval * 1000:
+            return
+        self.last_update_ticks = current_ticks
+
+        fleet = self.sim.fleet
+        if fleet is not None:
+            queues = fleet.queues[self.lane_keys]
+        else:
+            queues = np.array([sensor.stopped for sensor in self.sensors], dtype=np.float64)
+
+        keys = self.lane_keys
+        target = self.free_flow[keys] + queues * self.delay_per_car
+        self.weights[keys] += self.smoothing * (target - self.weights[keys])
+
+        if np.abs(self.weights[keys] - self.observed).max(initial=0) > self.min_change:
+            self.observed = self.weights[keys].copy()
+            self.table.cache_clear()
+
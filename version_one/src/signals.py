@@ -0,0 +1,41 @@
+from __future__ import annotations
+import heapq
+from map import TrafficLight
+
+
+class SignalScheduler:
+    # Event driven traffic light updates: the lights are kept in a heap ordered by their next color change,
+    # so a step only touches the lights which actually change
+    def __init__(self, traffic_lights: list[TrafficLight]) -> None:
+        self.traffic_lights = traffic_lights
+        self._queue: list[tuple[int, int, TrafficLight]] = []
+        # lights which change in the same tick change in the order of the list, so every run reports them alike
+        self._order: dict[TrafficLight, int] = {traffic_light: i for i, traffic_light in enumerate(traffic_lights)}
+        
+        for traffic_light in traffic_lights:
+            self.reschedule(traffic_light)
+    
+    def reschedule(self, traffic_light: TrafficLight) -> None:
+        # Must be called when the timing of a light was changed from the outside (e.g. set_information).
+        # The old heap entry stays, but is skipped as it does not match the light anymore
+        if traffic_light.next_change_ticks is not None:
+            heapq.heappush(self._queue, (traffic_light.next_change_ticks, self._order[traffic_light], traffic_light))
+    
+    def update(self, current_ticks: int) -> list[TrafficLight]:
+        changed = []
+        queue = self._queue
+        
+        while queue and queue[0][0] <= current_ticks:
+            change_ticks, _, traffic_light = heapq.heappop(queue)
+            if change_ticks != traffic_light.next_change_ticks:
+                continue # outdated entry
+            
+            traffic_light.update(current_ticks)
+            changed.append(traffic_light)
+            self.reschedule(traffic_light)
+        
+        return changed
+    
+    @property
+    def next_change_ticks(self) -> int | None:
+        return self._queue[0][0] if self._queue else None
@@ -0,0 +1,231 @@
+from __future__ import annotations
+import pickle
+import numpy as np
+from constants import DIRECTIONS, DIRECTION_CODES
+from car_following import DriverParameters
+from fleet import VehicleState
+from map_file import load_map, map_bytes
+from verhicles import Car
+
+# A snapshot is a pickled dict of plain values and numpy arrays: the map as map file bytes, the clock,
+# the random generators, the spawn timer, every traffic light and every vehicle.
+# Only restore snapshots you wrote yourself, loading a pickle can run code
+VERSION = 6
+
+LIGHT_FIELDS = ("color_phase", "starting_color_phase", "red_phase", "yellow_phase", "green_phase",
+                "countdown_start", "start_ticks", "next_change_ticks")
+SIMULATION_FIELDS = ("last_car_spawn_time", "car_spawn_cooldown", "max_cars", "phase_range", "safety_distance",
+                     "spawned_cars", "despawned_cars", "signal_plan", "signal_control", "arrival_rate", "routing",
+                     "car_following", "driver_variation")
+
+
+def take_snapshot(sim) -> dict:
+    if sim.engine == "partitioned":
+        raise ValueError("Snapshots of the partitioned engine are not supported, the workers keep their own random generators")
+
+    road_ids = {road: i for i, road in enumerate(sim.roads)}
+    return {
+        "version": VERSION,
+        "engine": sim.engine,
+        "map": map_bytes(sim),
+        "step_size": sim.clock.step_size,
+        "steps": sim.clock.steps,
+        "rng": sim.rng.getstate(),
+        "car_id_counter": sim.car_pool._id_counter,
+        "simulation": {name: getattr(sim, name) for name in SIMULATION_FIELDS},
+        "traffic_lights": [{name: getattr(traffic_light, name) for name in LIGHT_FIELDS} for traffic_light in sim.traffic_lights],
+        "cars": _car_columns(list(sim.cars.values()), road_ids),
+        "fleet": _fleet_state(sim.fleet) if sim.fleet is not None else None,
+        "demand": _demand_state(sim.demand) if sim.demand is not None else None,
+        "router": _router_state(sim.router) if sim.router is not None else None,
+    }
+
+
+def save_snapshot(path: str, sim) -> None:
+    with open(path, "wb") as file:
+        pickle.dump(take_snapshot(sim), file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def read_snapshot(path: str) -> dict:
+    # a snapshot which was read once can be restored into many simulations (e.g. what-if branches)
+    with open(path, "rb") as file:
+        snapshot = pickle.load(file)
+
+    if snapshot.get("version") != VERSION:
+        raise ValueError(f"The snapshot has version {snapshot.get('version')}, only version {VERSION} is supported")
+    return snapshot
+
+
+def restore_snapshot(snapshot: dict | str, sim) -> None:
+    # Restores into a new simulation without a map. The map comes from the snapshot, so it is not
+    # generated or linked again
+    if isinstance(snapshot, str):
+        snapshot = read_snapshot(snapshot)
+    if snapshot["engine"] != sim.engine:
+        raise ValueError(f"The snapshot was taken with the {snapshot['engine']} engine, the simulation uses {sim.engine}")
+
+    for name, value in snapshot["simulation"].items():
+        setattr(sim, name, value)
+
+    sim.clock.step_size = snapshot["step_size"]
+    sim.clock.steps = snapshot["steps"]
+    load_map(snapshot["map"], sim)
+
+    for traffic_light, fields in zip(sim.traffic_lights, snapshot["traffic_lights"]):
+        for name, value in fields.items():
+            setattr(traffic_light, name, value)
+    sim.signals = type(sim.signals)(sim.traffic_lights) # the heap is ordered by the restored change times
+
+    # the generator is restored last, loading the map draws from it
+    sim.rng.setstate(snapshot["rng"])
+    _restore_cars(sim, snapshot["cars"])
+    sim.car_pool._id_counter = snapshot["car_id_counter"]
+
+    if snapshot["fleet"] is not None:
+        _restore_fleet(sim.fleet, snapshot["fleet"])
+        sim.fleet.update_signals(sim.traffic_lights)
+    
+    # a demand of the arrival rate is created again with the map, a demand file has to be loaded again
+    if snapshot["demand"] is not None and sim.demand is not None:
+        _restore_demand(sim.demand, snapshot["demand"])
+    
+    if snapshot["router"] is not None:
+        _restore_router(sim.router, snapshot["router"])
+
+
+def restore_demand(snapshot: dict | str, demand) -> None:
+    # A demand loaded from a file after restore_snapshot goes on where the demand of the snapshot stopped
+    if isinstance(snapshot, str):
+        snapshot = read_snapshot(snapshot)
+    if snapshot["demand"] is not None:
+        _restore_demand(demand, snapshot["demand"])
+
+
+def _car_columns(cars: list[Car], road_ids: dict) -> dict:
+    logics = [car.logic for car in cars]
+
+    # position in the lane from the front, so the lanes are rebuilt in the same order
+    lane_ranks = {}
+    for logic in logics:
+        if logic.lane is not None and logic.lane not in lane_ranks:
+            lane_ranks.update({car: rank for rank, car in enumerate(logic.lane)})
+
+    return {
+        "id": np.array([logic.id for logic in logics], dtype=np.int64),
+        "x": np.array([logic.x for logic in logics], dtype=np.float64),
+        "y": np.array([logic.y for logic in logics], dtype=np.float64),
+        "speed": np.array([logic.speed for logic in logics], dtype=np.float64),
+        "safety_distance": np.array([logic.safety_distance for logic in logics], dtype=np.float64),
+        "driving": np.array([logic.driving for logic in logics], dtype=np.bool_),
+        "rotation": np.array([logic.rotation for logic in logics], dtype=np.bool_),
+        "off_network": np.array([logic.off_network for logic in logics], dtype=np.bool_),
+        "direction": np.array([DIRECTION_CODES[logic.driving_direction] for logic in logics], dtype=np.int8),
+        "next_direction": np.array([DIRECTION_CODES.get(logic.next_direction, -1) for logic in logics], dtype=np.int8),
+        "road": np.array([road_ids.get(logic.road_driving_on, -1) for logic in logics], dtype=np.int32),
+        "prev_road": np.array([road_ids.get(logic.prev_road_driving_on, -1) for logic in logics], dtype=np.int32),
+        "destination": np.array([road_ids.get(logic.destination, -1) for logic in logics], dtype=np.int32),
+        "lane_road": np.array([road_ids[logic.lane.road] if logic.lane else -1 for logic in logics], dtype=np.int32),
+        "lane_direction": np.array([DIRECTION_CODES[logic.lane.direction] if logic.lane else -1 for logic in logics], dtype=np.int8),
+        "lane_rank": np.array([lane_ranks.get(logic, -1) for logic in logics], dtype=np.int32),
+        # one row of DriverParameters per car, nan for the cars without a driver
+        "driver": np.array([[getattr(logic.driver, name) for name in DriverParameters.__slots__] if logic.driver else
+                            [np.nan] * len(DriverParameters.__slots__) for logic in logics], dtype=np.float64).reshape(-1, len(DriverParameters.__slots__)),
+    }
+
+
+def _restore_cars(sim, columns: dict) -> None:
+    roads = sim.roads
+    cars = []
+
+    for i, car_id in enumerate(columns["id"]):
+        car = Car(int(car_id), sim.screen, float(columns["x"][i]), float(columns["y"][i]), DIRECTIONS[columns["direction"][i]], sim.rng,
+                  float(columns["safety_distance"][i]))
+        logic = car.logic
+        logic.speed = float(columns["speed"][i])
+        logic.driving = bool(columns["driving"][i])
+        logic.rotation = bool(columns["rotation"][i])
+        logic.off_network = bool(columns["off_network"][i])
+        logic.next_direction = DIRECTIONS[columns["next_direction"][i]] if columns["next_direction"][i] >= 0 else None
+        logic.road_driving_on = roads[columns["road"][i]] if columns["road"][i] >= 0 else None
+        logic.prev_road_driving_on = roads[columns["prev_road"][i]] if columns["prev_road"][i] >= 0 else None
+        logic.destination = roads[columns["destination"][i]] if columns["destination"][i] >= 0 else None
+        logic.all_roads, logic.road_index, logic.lanes = roads, sim.road_index, sim.lanes
+        logic.on_leave = sim.car_leaving
+        logic.router = sim.router
+        if not np.isnan(columns["driver"][i, 0]):
+            logic.driver = DriverParameters(*columns["driver"][i].tolist())
+        if sim.event_hooks:
+            logic.on_event = sim.emit
+        cars.append(car)
+    
+    sim.cars = {car.id: car for car in cars}
+    sim.leaving_cars = [car.id for car in cars if car.logic.off_network]
+
+    # front to back, a lane insert then keeps the order of cars at the same position
+    in_lane = np.flatnonzero(columns["lane_road"] >= 0)
+    order = in_lane[np.lexsort((columns["lane_rank"][in_lane], columns["lane_direction"][in_lane], columns["lane_road"][in_lane]))]
+    for i in order:
+        lane = sim.lanes.lane(roads[columns["lane_road"][i]], DIRECTIONS[columns["lane_direction"][i]])
+        lane.insert(cars[i].logic)
+
+
+def _fleet_state(fleet) -> dict:
+    state = fleet.state
+    return {
+        "arrays": {name: getattr(state, name)[:state.size].copy() for name, _ in VehicleState.FIELDS},
+        "size": state.size,
+        "count": fleet.count,
+        "id_counter": fleet._id_counter,
+        "free_slots": list(fleet.free_slots),
+        "rng": fleet.rng.bit_generator.state,
+        "safety_distance": fleet.safety_distance,
+        "speed": fleet.speed,
+    }
+
+
+def _restore_fleet(fleet, saved: dict) -> None:
+    state = fleet.state
+    if saved["size"] > state.capacity:
+        state.grow(saved["size"])
+
+    for name, array in saved["arrays"].items():
+        getattr(state, name)[:saved["size"]] = array
+    state.size = saved["size"]
+
+    fleet.count = saved["count"]
+    fleet._id_counter = saved["id_counter"]
+    fleet.free_slots = list(saved["free_slots"])
+    fleet.rng.bit_generator.state = saved["rng"]
+    fleet.safety_distance = saved["safety_distance"]
+    fleet.speed = saved["speed"]
+
+
+def _demand_state(demand) -> dict:
+    return {
+        "rng": demand.rng.bit_generator.state,
+        "backlog": demand.backlog.copy(),
+        "start_ticks": demand.start_ticks,
+    }
+
+
+def _restore_demand(demand, saved: dict) -> None:
+    demand.rng.bit_generator.state = saved["rng"]
+    demand.backlog[:] = saved["backlog"]
+    demand.start_ticks = saved["start_ticks"]
+
+
+def _router_state(router) -> dict:
+    # the weights of a travel time router follow the traffic, the tables are build again from them
+    return {
+        "weights": router.weights.copy(),
+        "observed": getattr(router, "observed", None),
+        "last_update_ticks": getattr(router, "last_update_ticks", None),
+    }
+
+
+def _restore_router(router, saved: dict) -> None:
+    router.weights[:] = saved["weights"]
+    if saved["observed"] is not None:
+        router.observed = saved["observed"].copy()
+        router.last_update_ticks = saved["last_update_ticks"]
+    router.table.cache_clear()
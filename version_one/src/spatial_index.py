@@ -0,0 +1,37 @@
+from __future__ import annotations
+from constants import RoadType
+from map import Road
+
+
+class RoadIndex:
+    # Uniform grid over the road rectangles. Every cell knows the roads which overlap it,
+    # so a point lookup only has to check the few roads of one cell
+    def __init__(self, roads: list[Road], cell_size: float = 100) -> None:
+        self.cell_size: float = cell_size
+        self._cells: dict[tuple[int, int], list[Road]] = {}
+        self._intersection_cells: dict[tuple[int, int], list[Road]] = {}
+        
+        # the roads are added in list order, so a cell returns the same road as a linear scan would
+        for road in roads:
+            cells = self._intersection_cells if road.road_type is RoadType.INTERSECTION else self._cells
+            min_x, min_y, max_x, max_y = road.bounds
+            
+            for cell_x in range(self.__cell(min_x), self.__cell(max_x) + 1):
+                for cell_y in range(self.__cell(min_y), self.__cell(max_y) + 1):
+                    cells.setdefault((cell_x, cell_y), []).append(road)
+
+    def road_at(self, x: float, y: float) -> Road | None:
+        # Intersections are not returned, a car on a intersection still belongs to the road it came from
+        for road in self._cells.get((self.__cell(x), self.__cell(y)), ()):
+            if road.on_road(x, y):
+                return road
+        return None
+    
+    def intersection_at(self, x: float, y: float) -> Road | None:
+        for intersection in self._intersection_cells.get((self.__cell(x), self.__cell(y)), ()):
+            if intersection.on_road(x, y):
+                return intersection
+        return None
+    
+    def __cell(self, value: float) -> int:
+        return int(value // self.cell_size)
@@ -0,0 +1,163 @@
+from __future__ import annotations
+import argparse
+import itertools
+import json
+import os
+from collections.abc import Iterator
+from multiprocessing import Pool
+import numpy as np
+from main import HeadlessGame
+from metrics import TrafficMetrics, aggregate
+
+
+def parameter_grid(values: dict[str, list]) -> list[dict]:
+    # Every combination of the given parameter values
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*(values[name] for name in names))]
+
+
+def run_scenario(task: tuple[dict, int, dict]) -> tuple[dict, int, dict[str, float]]:
+    # One headless run, executed in a worker process of the pool (in this process with the partitioned engine)
+    parameters, seed, settings = task
+
+    sim = HeadlessGame(settings["step_size"], seed, settings["engine"])
+    if settings["regions"]:
+        sim.regions = settings["regions"]
+
+    if settings["snapshot"]:
+        # a branch of a warmed up state: the seed only decides what happens from now on and
+        # the timing of the traffic lights is the one of the snapshot
+        from snapshot import restore_snapshot
+        restore_snapshot(settings["snapshot"], sim)
+        sim.set_tunables(parameters)
+        reseed(sim, seed)
+        return _measure(sim, parameters, seed, settings)
+
+    for name, value in parameters.items():
+        setattr(sim, name, value)
+    if settings["map"]:
+        from map_file import load_map
+        load_map(settings["map"], sim)
+    elif settings["grid"]:
+        from map_generator import generate_grid
+        generate_grid(sim, *settings["grid"])
+    else:
+        sim.generate_map()
+    return _measure(sim, parameters, seed, settings)
+
+
+def _measure(sim, parameters: dict, seed: int, settings: dict) -> tuple[dict, int, dict[str, float]]:
+    metrics = TrafficMetrics(sim)
+    for _ in range(sim.clock.steps_for(settings["duration"])):
+        sim.update()
+        metrics.sample(sim)
+
+    if settings["engine"] == "partitioned":
+        sim.fleet.close() # stops the region workers of this run
+    return parameters, seed, metrics.summary()
+
+
+def reseed(sim, seed: int) -> None:
+    # Starts every generator of the simulation again from the seed. The fleet and the demand get their own
+    # streams of it, so they do not repeat the numbers of the simulation generator
+    sim.rng.seed(seed)
+    fleet_seed, demand_seed = np.random.SeedSequence(seed).spawn(2)
+    if sim.fleet is not None:
+        sim.fleet.rng.bit_generator.state = np.random.PCG64(fleet_seed).state
+    if sim.demand is not None:
+        sim.demand.rng.bit_generator.state = np.random.PCG64(demand_seed).state
+
+
+def sweep(values: dict[str, list], seeds: list[int], duration: float, processes: int | None = None, engine: str = "object",
+          step_size: float = 1 / 60, map_path: str | None = None, grid: tuple[int, int] | None = None, snapshot: str | None = None) -> list[dict]:
+    # Runs every scenario with every seed on a process pool and aggregates the runs per scenario.
+    # A run from a snapshot keeps the traffic lights of the snapshot, the MAP_TUNABLES can not be swept then.
+    # The partitioned engine starts its own worker processes, one per region, which the daemonic processes
+    # of a pool are not allowed to do: its runs are done one after another with processes as the regions
+    fixed = [name for name in values if name in HeadlessGame.MAP_TUNABLES]
+    if snapshot is not None and fixed:
+        raise ValueError(f"{', '.join(fixed)} only apply to freshly built maps, not to runs from a snapshot")
+    
+    partitioned = engine == "partitioned"
+    settings = {"duration": duration, "engine": engine, "step_size": step_size, "map": map_path, "grid": grid, "snapshot": snapshot,
+                "regions": processes if partitioned else None}
+    scenarios = parameter_grid(values)
+    tasks = [(parameters, seed, settings) for parameters in scenarios for seed in seeds]
+
+    runs: dict[int, list[dict[str, float]]] = {i: [] for i in range(len(scenarios))}
+    for parameters, seed, summary in (map(run_scenario, tasks) if partitioned else _run_on_pool(tasks, processes)):
+        runs[scenarios.index(parameters)].append(summary)
+
+    return [
+        {"parameters": parameters, "runs": len(runs[i]), "metrics": aggregate(runs[i])}
+        for i, parameters in enumerate(scenarios)
+    ]
+
+
+def _run_on_pool(tasks: list[tuple[dict, int, dict]], processes: int | None) -> Iterator[tuple[dict, int, dict[str, float]]]:
+    with Pool(processes) as pool:
+        # the runs take about the same time, so small chunks keep all workers busy until the end
+        chunksize = max(1, len(tasks) // ((processes or os.cpu_count() or 1) * 4))
+        yield from pool.imap_unordered(run_scenario, tasks, chunksize)
+
+
+def parse_range(value: str) -> tuple[int, int]:
+    # a light with a phase of 0 seconds would never finish its countdown
+    low, high = (int(bound) for bound in value.split("-"))
+    if low < 1 or low > high:
+        raise argparse.ArgumentTypeError(f"expected LOW-HIGH with 1 <= LOW <= HIGH seconds, got {value}")
+    return low, high
+
+
+def parse_grid(value: str) -> tuple[int, int]:
+    rows, cols = value.lower().split("x")
+    return int(rows), int(cols)
+
+
+if __name__ == "__main__":
+    # A parameter which is not given keeps the value of the simulation (4-7, 2, 60, 4, none, random, fixed,
+    # stop-and-go) or of the snapshot. The phase range, signal plan and signal control are built into the
+    # traffic lights of a new map, a snapshot keeps its lights and they can not be swept with --snapshot
+    parser = argparse.ArgumentParser(description="Run headless simulations for a grid of parameters on all cores")
+    parser.add_argument("--phase-range", type=parse_range, nargs="+", help="seconds of a red or green phase, e.g. 4-7 (new maps only)")
+    parser.add_argument("--spawn-cooldown", type=float, nargs="+", help="seconds between two spawned cars")
+    parser.add_argument("--safety-distance", type=float, nargs="+", help="distance a car keeps to the car in front")
+    parser.add_argument("--max-cars", type=int, nargs="+", help="most cars at the same time")
+    parser.add_argument("--arrival-rate", type=float, nargs="+", help="cars per hour at every entry, instead of the spawn point")
+    parser.add_argument("--signal-plan", choices=["random", "green-wave"], nargs="+", help="timing of the traffic lights (new maps only)")
+    parser.add_argument("--signal-control", choices=["fixed", "max-pressure"], nargs="+", help="how the traffic lights are controlled (new maps only)")
+    parser.add_argument("--car-following", choices=["stop-and-go", "idm"], nargs="+", help="how the cars accelerate and brake")
+    parser.add_argument("--seeds", type=int, default=8, help="runs per scenario, seeded 0 to SEEDS - 1")
+    parser.add_argument("--duration", type=float, default=600, help="simulated seconds per run")
+    parser.add_argument("--step-size", type=float, default=1 / 60, help="simulated seconds per step")
+    parser.add_argument("--engine", choices=["object", "vectorized", "partitioned"], default="object")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (regions of a partitioned run), all cores by default")
+    parser.add_argument("--map", default=None, help="map file used by all runs")
+    parser.add_argument("--snapshot", default=None, help="start every run from this snapshot instead of an empty map")
+    parser.add_argument("--grid", type=parse_grid, default=None, help="generate a grid map with ROWSxCOLS intersections")
+    parser.add_argument("--output", default="sweep_results.json", help="where the results are written as json")
+    args = parser.parse_args()
+
+    values = {
+        "phase_range": args.phase_range,
+        "car_spawn_cooldown": args.spawn_cooldown,
+        "safety_distance": args.safety_distance,
+        "max_cars": args.max_cars,
+        "signal_plan": args.signal_plan,
+        "arrival_rate": args.arrival_rate,
+        "signal_control": args.signal_control,
+        "car_following": args.car_following,
+    }
+    values = {name: value for name, value in values.items() if value is not None}
+    fixed = [name for name in values if name in HeadlessGame.MAP_TUNABLES]
+    if args.snapshot and fixed:
+        parser.error(f"{', '.join('--' + name.replace('_', '-') for name in fixed)} only apply to new maps, not with --snapshot")
+    results = sweep(values, list(range(args.seeds)), args.duration, args.processes, args.engine, args.step_size, args.map, args.grid, args.snapshot)
+
+    for result in results:
+        metrics = result["metrics"]
+        print(f"{result['parameters']}  throughput={metrics['throughput_per_hour']['mean']:.1f}/h  "
+              f"delay={metrics['mean_delay_s']['mean']:.2f}s  queue={metrics['mean_queue_length']['mean']:.2f}")
+
+    with open(args.output, "w") as file:
+        json.dump({"duration": args.duration, "seeds": args.seeds, "results": results}, file, indent=2)
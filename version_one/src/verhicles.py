@@ -1,9 +1,17 @@
 from __future__ import annotations # To type hint car in the car class
 import pygame
-from constants import  ColorPhase, RoadDirections, RoadType
-from map import Road
+import assets
+import math
+from car_following import DriverParameters, STOP_SPEED, idm_acceleration_of_one, integrate_one, stops_for_light
+from constants import  ColorPhase, EventKind, RoadDirections, RoadType, CAR_LENGTH, CAR_SPEED, DIRECTION_CODES, ROAD_SAFETY_DISTANCE, STOP_WINDOW
+from map import Road, Intersection, Route
+from spatial_index import RoadIndex
+from lanes import Lane, Lanes
+from profiler import PROFILER
+from routing import Router
 import logging
-from random import randint
+from random import Random
+from time import perf_counter
 
 logging.basicConfig(
     level=logging.INFO,
@@ -11,33 +19,55 @@ logging.basicConfig(
     datefmt='%H:%M:%S'
 )
 
+def _distance_ahead(direction: RoadDirections, x: float, y: float, to_x: float, to_y: float) -> float:
+    # how far the point to_x, to_y is in front of x, y in the direction, negative behind it
+    match direction:
+        case RoadDirections.EAST:
+            return to_x - x
+        case RoadDirections.WEST:
+            return x - to_x
+        case RoadDirections.SOUTH:
+            return to_y - y
+        case RoadDirections.NORTH:
+            return y - to_y
+
+
 class Car:
-    _id_counter = 0
+    # The three objects of a car have slots instead of a dict and the id is a number,
+    # a car needs a few hundred bytes and a despawned car is reused by the CarPool
+    __slots__ = ("id", "x", "y", "screen", "ui_handler", "logic")
     
-    def __init__(self, screen, start_x, start_y, direction: RoadDirections):
-        Car._id_counter += 1
+    def __init__(self, id: int, screen, start_x, start_y, direction: RoadDirections, rng: Random | None = None, safety_distance: float = 60):
+        self.screen = screen
         
-        self.id = f"car_{Car._id_counter}"
+        # A headless car has no ui handler and never touches an image
+        self.ui_handler: CarUI | None = None
+        if self.screen is not None:
+            self.ui_handler = CarUI(self.screen, direction)
+
+        self.logic = CarLogic(id, start_x, start_y, direction, self.ui_handler, rng, safety_distance)
+        self.reset(id, start_x, start_y, direction, rng, safety_distance)
+
+    def reset(self, id: int, start_x, start_y, direction: RoadDirections, rng: Random | None = None, safety_distance: float = 60) -> None:
+        # starts the car again as a new car with a new id
+        self.id = id
         self.x = start_x
         self.y = start_y
-        self.screen = screen
         
-        img = pygame.image.load('version_one/images/Car.png')
-
-        self.ui_handler = CarUI(self.screen, direction, img)
-        self.logic = CarLogic(self.id, start_x, start_y, direction, self.ui_handler)
-        self.ui_handler.first_rotation(direction) 
+        if self.ui_handler is not None:
+            self.ui_handler.first_rotation(direction)
+        self.logic.reset(self.id, start_x, start_y, direction, rng, safety_distance)
 
-    def draw(self) -> None:
+    def draw(self) -> pygame.Rect:
         self.__update_coordinates()
-        self.ui_handler.draw(self.x, self.y)
+        return self.ui_handler.draw(self.x, self.y)
     
-    def move(self, delta_time: int, all_cars: list[Car], all_roads: list[Road]) -> None:
-        self.logic.move(delta_time, all_cars, all_roads)
+    def move(self, delta_time: int, all_cars: list[Car], all_roads: list[Road], road_index: RoadIndex | None = None, lanes: Lanes | None = None) -> None:
+        self.logic.move(delta_time, all_cars, all_roads, road_index, lanes)
     
-    def deleteable(self) -> bool:
+    def deleteable(self, width: int, height: int) -> bool:
         self.__update_coordinates()
-        return self.x > self.screen.get_width() or self.y > self.screen.get_height() or self.x < -10 or self.y < -10
+        return self.x > width or self.y > height or self.x < -10 or self.y < -10
     
     def __update_coordinates(self):
         self.x, self.y = self.logic.coordinates
@@ -47,16 +77,45 @@ class Car:
         return self.logic.driving_status
     
 
+class CarPool:
+    # Free list of despawned cars. A new car takes a car from the list before a car is created,
+    # so a simulation with many cars coming and going does not allocate and collect cars all the time.
+    # Every simulation has its own pool, so the ids count from 1 in every simulation (like the ids of a Fleet)
+    def __init__(self) -> None:
+        self.free: list[Car] = []
+        self._id_counter: int = 0
+    
+    def acquire(self, screen, x: float, y: float, direction: RoadDirections, rng: Random | None = None, safety_distance: float = 60) -> Car:
+        self._id_counter += 1
+        if self.free:
+            car = self.free.pop()
+            car.reset(self._id_counter, x, y, direction, rng, safety_distance)
+            return car
+        return Car(self._id_counter, screen, x, y, direction, rng, safety_distance)
+    
+    def release(self, car: Car) -> None:
+        # the car has to be removed from its lane before
+        self.free.append(car)
+    
+
 class CarLogic:
-    def __init__(self, id, start_x, start_y, direction: RoadDirections, ui_handler: CarUI):
-        self.id = id
+    __slots__ = ("id", "ui_handler", "rng", "x", "y", "safety_distance", "speed", "driving", "_driving_direction", "next_direction",
+                 "rotation", "all_roads", "road_index", "road_driving_on", "prev_road_driving_on", "destination", "router", "lanes", "lane", "leader", "follower",
+                 "off_network", "on_event", "on_leave", "driver")
+    
+    def __init__(self, id: int, start_x, start_y, direction: RoadDirections, ui_handler: CarUI | None, rng: Random | None = None, safety_distance: float = 60):
         self.ui_handler = ui_handler
+        self.reset(id, start_x, start_y, direction, rng, safety_distance)
+    
+    def reset(self, id: int, start_x, start_y, direction: RoadDirections, rng: Random | None = None, safety_distance: float = 60) -> None:
+        self.id = id
+        self.rng = rng if rng is not None else Random()
         
         self.x = start_x
         self.y = start_y        
         
-        self.safety_distance = 60
-        self.speed = 60
+        self.safety_distance = safety_distance
+        self.speed = CAR_SPEED
         self.driving = False
         self._driving_direction = direction
         self.next_direction: RoadDirections = None
@@ -64,74 +123,234 @@ class CarLogic:
         self.rotation = False
             
         self.all_roads: list[Road] = None
+        self.road_index: RoadIndex | None = None
         self.road_driving_on: Road = None
         self.prev_road_driving_on = None
+        self.destination: Road | None = None # the road the car wants to leave the map on
+        self.router: Router | None = None # finds the turns towards the destination, without one the car turns at random
+        
+        # Position in the lane of the road and direction the car is driving on
+        self.lanes: Lanes | None = None
+        self.lane: Lane | None = None
+        self.leader: CarLogic | None = None
+        self.follower: CarLogic | None = None
+        
+        # Called with a batch of events: kind, vehicle ids, x, y and a value per event
+        self.on_event = None
+        
+        # Called once with the car, when it drove off every road and intersection
+        self.off_network = False
+        self.on_leave = None
+        
+        # With a driver the car follows the intelligent driver model, otherwise it drives at speed or stands
+        self.driver: DriverParameters | None = None
 
-    def move(self, delta_time: int, all_cars: list[Car], all_roads: list[Road]) -> None:
+    def enter(self, all_roads: list[Road], road_index: RoadIndex | None = None, lanes: Lanes | None = None) -> None:
+        # Puts a new car on its road and into its lane, before it moves the first time
         self.all_roads = all_roads
+        self.road_index = road_index
+        self.lanes = lanes
+        self.__set_road_driving_on()
+        self.__update_lane()
+
+    def move(self, delta_time: int, all_cars: list[Car], all_roads: list[Road], road_index: RoadIndex | None = None, lanes: Lanes | None = None) -> None:
+        self.all_roads = all_roads
+        self.road_index = road_index
+        self.lanes = lanes
+        
+        # the sub-steps are timed only while profiling, a disabled profiler costs one check per sub-step
+        profiling = PROFILER.enabled
+        start = perf_counter() if profiling else 0.0
+        
         self.__set_road_driving_on() # needs the all_roads var
+        if profiling:
+            start = PROFILER.lap("car.road_lookup", start)
+        
+        if self.driver is not None:
+            self.__follow(delta_time, all_cars, profiling, start)
+            return
         
-        if self.__should_move(all_cars):
+        self.__update_lane()
+        blocked = self.__blocked_by_car(all_cars)
+        if profiling:
+            start = PROFILER.lap("car.leader_search", start)
+        
+        should_move = not blocked and self.__free_from_light()
+        if profiling:
+            start = PROFILER.lap("car.signal_check", start)
+        
+        if should_move:
             new_direction = self.__get_next_direction()
 
             if new_direction is not None:
                 self.next_direction = new_direction
             
-            self.__apply_move(delta_time)
-            self.driving = True
+            self.__apply_move(self.speed * delta_time)
+            self.__set_driving(True)
             
         else:
-            self.driving = False
+            self.__set_driving(False)
+        if profiling:
+            PROFILER.lap("car.turning", start)
     
-    def __should_move(self, all_cars: list[Car]) -> bool:
-        cars_in_front = self.__get_cars_in_front(all_cars)
-        if cars_in_front: 
-            if not self.__car_in_front_moving(cars_in_front):
-                return False
+    def __follow(self, delta_time: int, all_cars: list[Car], profiling: bool, start: float) -> None:
+        # Intelligent driver model: the car accelerates towards its desired speed and brakes for the car in front
+        # and for a red or yellow light (a standing car in the stop window), unless it can not stop before it anymore.
+        # Timed in the same sub-steps as the stop and go model
+        driver = self.driver
+        self.__update_lane()
+        if self.next_direction is None:
+            # the turn is chosen once per road, the first car of a lane follows the lane it turns into
+            self.next_direction = self.__get_next_direction()
+        elif not self.driving and self.__exit_blocked() and self.road_driving_on.on_road(self.x, self.y):
+            # a car which waits for a full lane takes another turn with room, otherwise the full lanes
+            # around a block could wait for each other forever
+            self.__divert()
         
+        gap, leader_speed = math.inf, self.speed
+        leader = self.car_in_front(all_cars)
+        if leader is not None:
+            leader = leader.logic if isinstance(leader, Car) else leader
+            distance = _distance_ahead(self._driving_direction, self.x, self.y, leader.x, leader.y)
+        else:
+            leader, distance = self.__back_of_next_lane()
+        if leader is not None:
+            # two cars which came into a lane at the same time can overlap, the one behind waits until it has room
+            gap, leader_speed = max(distance - CAR_LENGTH, 0.0), leader.speed
+        
+        acceleration = idm_acceleration_of_one(self.speed, gap, leader_speed, driver)
+        if profiling:
+            start = PROFILER.lap("car.leader_search", start)
+        
+        at_light = False
+        line_distance = self.__stop_line_distance()
+        held = line_distance is None and self.__exit_blocked()
+        if held:
+            line_distance = self.__line_distance(self.road_driving_on)
+        if line_distance is not None:
+            forward = self._driving_direction in (RoadDirections.EAST, RoadDirections.SOUTH)
+            remaining = line_distance - STOP_WINDOW[1] if forward else STOP_WINDOW[0] - line_distance
+            stopping = bool(stops_for_light(self.speed, remaining))
+            if stopping:
+                acceleration = min(acceleration, idm_acceleration_of_one(self.speed, remaining + driver.min_gap, 0.0, driver))
+                gap = min(gap, remaining)
+            at_light = stopping and not held
+        if profiling:
+            start = PROFILER.lap("car.signal_check", start)
         
+        self.speed, distance = integrate_one(self.speed, acceleration, delta_time, gap)
+        driving = self.speed > STOP_SPEED
+        if at_light and self.driving and not driving:
+            self.__emit(EventKind.STOP_AT_RED)
+        
+        if distance > 0:
+            new_direction = self.__get_next_direction()
+            if new_direction is not None:
+                self.next_direction = new_direction
+            self.__apply_move(distance)
+        self.__set_driving(driving)
+        if profiling:
+            PROFILER.lap("car.turning", start)
+    
+    def __back_of_next_lane(self) -> tuple[CarLogic | None, float]:
+        # The first car of a lane follows the lane it turns into behind the intersection, so a queue which reaches
+        # back to the intersection stops the cars before it. Its leader is the last car of that lane which is not
+        # more than half a car behind the point where it merges in (the turn point), the distance is the way over it
+        route, turn = self.__next_turn()
+        lane = self.lanes.get(route.roads[turn], turn) if route is not None and self.lanes is not None else None
+        if lane is None:
+            return None, math.inf
+        
+        merge_x, merge_y = route.turn_points[turn] if turn is not self._driving_direction else (self.x, self.y)
+        leader = lane.back
+        while leader is not None and _distance_ahead(turn, merge_x, merge_y, leader.x, leader.y) < -CAR_LENGTH / 2:
+            leader = leader.leader
+        if leader is None:
+            return None, math.inf
+        return leader, _distance_ahead(self._driving_direction, self.x, self.y, merge_x, merge_y) + _distance_ahead(turn, merge_x, merge_y, leader.x, leader.y)
+    
+    def __exit_blocked(self) -> bool:
+        # A car waits at the stop line until the lane it turns into has room for it, even when the cars of the lane
+        # come to a stand. So a car does not stop on the intersection and block the cars which cross it
+        route, turn = self.__next_turn()
+        return route is not None and self.__no_room(route.roads[turn], turn)
+    
+    def __no_room(self, road: Road, direction: RoadDirections) -> bool:
+        # the cars of the lane fill it up to less than a car length when they stand in a queue at the minimum gap
+        lane = self.lanes.get(road, direction) if self.lanes is not None else None
+        return lane is not None and lane.room(CAR_LENGTH + self.driver.min_gap) < CAR_LENGTH
+    
+    def __divert(self) -> None:
+        # A standing car which waits for a full lane takes another turn with room, so two full lanes which wait for each
+        # other around a block do not lock up
+        route, _ = self.__next_turn()
+        turns = [turn for turn in route.turns if not self.__no_room(route.roads[turn], turn)]
+        if turns:
+            self.next_direction = turns[self.rng.randint(0, len(turns) - 1)]
+    
+    def __next_turn(self) -> tuple[Route | None, RoadDirections | None]:
+        # the route over the next intersection and the direction the car leaves it in, straight on until it chose a turn
+        next_intersection = self.__get_next_intersection()
+        route = next_intersection.get_route(self._driving_direction, self.road_driving_on) if next_intersection else None
+        if route is None:
+            return None, None
+        
+        turn = self.next_direction if self.next_direction is not None else self._driving_direction
+        return (route, turn) if turn in route.roads else (None, None)
+    
+    def __blocked_by_car(self, all_cars: list[Car]) -> bool:
+        car_in_front = self.car_in_front(all_cars)
+        return car_in_front is not None and not self.__car_in_front_moving(car_in_front)
+    
+    def __free_from_light(self) -> bool:
+        line_distance = self.__stop_line_distance()
+        if line_distance is not None and STOP_WINDOW[0] <= line_distance <= STOP_WINDOW[1]:
+            if self.driving:
+                self.__emit(EventKind.STOP_AT_RED)
+            return False
+        return True
+    
+    def __stop_line_distance(self) -> float | None:
+        # street end - car front, when the traffic light of the road in front of the car is red or yellow
         wait_phases = [ColorPhase.RED.name, ColorPhase.YELLOW.name]
         road = self.road_driving_on
         
-        road_safety_distance = 30
-        
         if road and road.road_type is not RoadType.INTERSECTION: # An intersection has no traffic light
             traffic_lights = road.traffic_light # Get the traffic light in both directions
             traffic_light = traffic_lights.get(self._driving_direction, {}) # The traffic light for our direction
             
-            if traffic_light:
-                phase = traffic_light.get_phase()
-            
-                if traffic_light:    
-                    match(self._driving_direction): # Determine the coordinates where the road ends in our driving direction, along with the corresponding car position
-                        case (RoadDirections.EAST):
-                            car_front = self.x + road_safety_distance
-                            street_end = road.street_end(RoadDirections.EAST)[0] 
-                        case (RoadDirections.WEST):
-                            car_front = self.x - road_safety_distance / 2
-                            street_end = road.x
-                        case(RoadDirections.NORTH):
-                            car_front = self.y - road_safety_distance / 2
-                            street_end = road.y
-                        case(RoadDirections.SOUTH):
-                            car_front = self.y + road_safety_distance
-                            street_end = road.street_end(RoadDirections.SOUTH)[1] 
-                    
-                    if street_end - car_front <= 5 and street_end - car_front >= 1 and phase in wait_phases:
-                        return False
+            if traffic_light and traffic_light.get_phase() in wait_phases:
+                return self.__line_distance(road)
                     
-        return True
+        return None
+    
+    def __line_distance(self, road: Road) -> float:
+        match(self._driving_direction): # Determine the coordinates where the road ends in our driving direction, along with the corresponding car position
+            case (RoadDirections.EAST):
+                car_front = self.x + ROAD_SAFETY_DISTANCE
+                street_end = road.street_end(RoadDirections.EAST)[0] 
+            case (RoadDirections.WEST):
+                car_front = self.x - ROAD_SAFETY_DISTANCE / 2
+                street_end = road.x
+            case(RoadDirections.NORTH):
+                car_front = self.y - ROAD_SAFETY_DISTANCE / 2
+                street_end = road.y
+            case(RoadDirections.SOUTH):
+                car_front = self.y + ROAD_SAFETY_DISTANCE
+                street_end = road.street_end(RoadDirections.SOUTH)[1] 
+        
+        return street_end - car_front
            
-    def __apply_move(self, delta_time: int) -> None:
-        self.driving = True
+    def __apply_move(self, distance: float) -> None:
+        self.__set_driving(True)
         if not self.road_driving_on:
             return
 
         if self.__at_intersection():
-            self.__handle_turning(delta_time)
+            self.__handle_turning(distance)
         else:
             self.rotation = False
-            self.__drive_straight(delta_time)   
+            self.__drive_straight(distance)   
                   
     def __at_intersection(self) -> bool:
         next_intersection = self.__get_next_intersection()
@@ -139,55 +358,61 @@ class CarLogic:
             return True
         return False
 
-    def __handle_turning(self, delta_time: int) -> None:
+    def __handle_turning(self, distance: float) -> None:
         next_intersection = self.__get_next_intersection()
         if not next_intersection:
-            self.__drive_straight(delta_time)
+            self.__drive_straight(distance)
             return
 
-        directions = {
-            RoadDirections.EAST: {
-                RoadDirections.NORTH: next_intersection.lower_right_middle,
-                RoadDirections.SOUTH: next_intersection.lower_left_middle,
-            },
-            RoadDirections.WEST: {
-                RoadDirections.NORTH: next_intersection.upper_right_middle,
-                RoadDirections.SOUTH: next_intersection.upper_left_middle,
-            },
-            RoadDirections.NORTH: {
-                RoadDirections.EAST: next_intersection.lower_right_middle,
-                RoadDirections.WEST: next_intersection.upper_right_middle,
-            },
-            RoadDirections.SOUTH: {
-                RoadDirections.EAST: next_intersection.lower_left_middle,
-                RoadDirections.WEST: next_intersection.upper_left_middle,
-            },
-        }
-
         # Find turn coordinates
-        turn_coords = directions.get(self._driving_direction, {}).get(self.next_direction)
+        route = next_intersection.get_route(self._driving_direction, self.road_driving_on)
+        turn_coords = route.turn_points.get(self.next_direction) if route is not None else None
 
         if turn_coords and self.__is_at_coordinates(turn_coords):
             self._driving_direction = self.next_direction
+            self.__enter_lane(route)
+            self.__emit(EventKind.TURN)
             if not self.rotation:
-                self.ui_handler.rotate_car(self.next_direction)
+                if self.ui_handler is not None:
+                    self.ui_handler.rotate_car(self.next_direction)
                 self.rotation = True
                 
             self.next_direction = None
-           
+        elif (self.driver is not None and route is not None and self.next_direction in (None, self._driving_direction)
+              and not self.road_driving_on.on_road(self.x, self.y)): # roads and intersections overlap by a few pixels
+            self.__enter_lane(route)
+            self.next_direction = None
 
-        self.__drive_straight(delta_time)
+        self.__drive_straight(distance)
+    
+    def __enter_lane(self, route: Route) -> None:
+        # With the intelligent driver model a car is in the lane of the road behind the intersection as soon as it
+        # turned or drives straight over it, so it is the leader of the cars which turn into the lane after it
+        if self.driver is not None and self._driving_direction in route.roads:
+            self.prev_road_driving_on = self.road_driving_on
+            self.road_driving_on = route.roads[self._driving_direction]
+        self.__update_lane()
 
-    def __drive_straight(self, delta_time: int) -> None:
+    def __drive_straight(self, distance: float) -> None:
         match self._driving_direction:
             case RoadDirections.NORTH:
-                self.y -= self.speed * delta_time
+                self.y -= distance
             case RoadDirections.SOUTH:
-                self.y += self.speed * delta_time
+                self.y += distance
             case RoadDirections.WEST:
-                self.x -= self.speed * delta_time
+                self.x -= distance
             case RoadDirections.EAST:
-                self.x += self.speed * delta_time
+                self.x += distance
+
+    def __set_driving(self, driving: bool) -> None:
+        # the lane counts its standing cars, so it has to know when a car stops or starts
+        if driving is not self.driving and self.lane is not None:
+            self.lane.stopped += -1 if driving else 1
+        self.driving = driving
+
+    def __emit(self, kind: EventKind) -> None:
+        if self.on_event is not None:
+            self.on_event(kind, [self.id], [self.x], [self.y], [DIRECTION_CODES[self._driving_direction]])
 
     def __is_at_coordinates(self, coords: tuple[int, int], tolerance: int = 3) -> bool:
         return (coords[0] - tolerance <= self.x <= coords[0] + tolerance and
@@ -203,38 +428,103 @@ class CarLogic:
             #logging.info("Did not find a intersection")
             return None
 
-        possible_turns_dict = next_intersection.get_possible_turns(self._driving_direction,  self.road_driving_on)
-        if not possible_turns_dict:
+        route = next_intersection.get_route(self._driving_direction,  self.road_driving_on)
+        if route is None or not route.turns:
             return None
         
-        possible_turns = list(possible_turns_dict.keys())
-        random_index = randint(0, len(possible_turns)-1)
+        if self.destination is not None and self.router is not None:
+            turn = self.router.next_turn(self.road_driving_on, self._driving_direction, self.destination)
+            if turn is not None:
+                return turn
+        
+        possible_turns = route.turns
+        random_index = self.rng.randint(0, len(possible_turns)-1)
         
         return possible_turns[random_index]
                
     def __set_road_driving_on(self) -> bool:
+        # As long as the car did not cross the boundary of its road there is nothing to look up
+        if self.road_driving_on is not None and self.road_driving_on.on_road(self.x, self.y):
+            return True # old road
+        
+        road = self.__find_road()
+        if road is None:
+            self.__check_left_network()
+            return False # still on a detected road
+        
+        # back on a road, e.g. after the few pixels between an intersection and the next road
+        self.off_network = False
+        self.next_direction = None # a new road means a new decision
+        
+        # Update prev road driving variable
+        self.prev_road_driving_on = self.road_driving_on
+        self.road_driving_on = road
+        return True # new road was detected
+    
+    def __find_road(self) -> Road | None:
+        if self.road_index is not None:
+            return self.road_index.road_at(self.x, self.y)
+        
         for road in self.all_roads:
             # Car must be on road and road should not be a intersection     
             if road.on_road(self.x, self.y) and road._road_type is not RoadType.INTERSECTION:
-                # Update prev road driving variable
-                if self.prev_road_driving_on != road:
-                        self.prev_road_driving_on = self.road_driving_on
-                        self.road_driving_on = road
-                        
-                        return True # new road was detected
-                
-                return True # old road
-        
-        return False # still on a detected road       
+                return road
+        return None
     
-    def __get_next_intersection(self) -> Road | None:
-        # get the intersection which comes next        
+    def __find_intersection(self) -> Road | None:
+        if self.road_index is not None:
+            return self.road_index.intersection_at(self.x, self.y)
+        
         for road in self.all_roads:
-            if road._road_type is RoadType.INTERSECTION: # road must be a intersection)
-                if road.get_possible_turns(self._driving_direction,  self.road_driving_on): # when i get a list with elements i know the intersection is connected with my road
-                    return road
+            if road.on_road(self.x, self.y) and road._road_type is RoadType.INTERSECTION:
+                return road
         return None
+    
+    def __check_left_network(self) -> None:
+        # Off every road and intersection: the car drives out of the map. Roads and intersections do not touch,
+        # a car in the few pixels between them has the next one less than a car length in front of it
+        if self.off_network or self.__on_network(self.x, self.y) or self.__on_network(*self.__point_ahead(CAR_LENGTH)):
+            return
+        
+        self.off_network = True
+        if self.on_leave is not None:
+            self.on_leave(self)
+    
+    def __on_network(self, x: float, y: float) -> bool:
+        # on any road or intersection, with the index only the roads of the cell are checked
+        if self.road_index is not None:
+            return self.road_index.road_at(x, y) is not None or self.road_index.intersection_at(x, y) is not None
+        return any(road.on_road(x, y) for road in self.all_roads)
+    
+    def __point_ahead(self, distance: float) -> tuple[float, float]:
+        match self._driving_direction:
+            case RoadDirections.NORTH:
+                return self.x, self.y - distance
+            case RoadDirections.SOUTH:
+                return self.x, self.y + distance
+            case RoadDirections.WEST:
+                return self.x - distance, self.y
+            case RoadDirections.EAST:
+                return self.x + distance, self.y
+    
+    def __get_next_intersection(self) -> Intersection | None:
+        # get the intersection which comes next, every road knows the intersection at its end
+        if self.road_driving_on is None:
+            return None
+        return self.road_driving_on.downstream.get(self._driving_direction)
 
+    def __update_lane(self) -> None:
+        if self.lanes is not None:
+            self.lanes.update(self)
+    
+    def car_in_front(self, all_cars: list[Car]) -> CarLogic | Car | None:
+        # The leader search of a move. With lanes the leader is already known, otherwise all cars have to be searched
+        if self.lanes is not None:
+            return self.leader
+        
+        cars_in_front = self.__get_cars_in_front(all_cars)
+        return cars_in_front[0] if cars_in_front else None
+    
     def __get_cars_in_front(self, all_cars: list[Car]) -> list[Car]:
         cars_in_front = []
 
@@ -270,8 +560,7 @@ class CarLogic:
 
         return cars_in_front
         
-    def __car_in_front_moving(self, car_in_front: list[Car]) -> bool:
-        car = car_in_front[0]
+    def __car_in_front_moving(self, car: CarLogic | Car) -> bool:
         if self.road_driving_on.road_type is RoadType.HORIZONTAL:
             too_close = abs(car.x - self.x) < self.safety_distance
         else:
@@ -283,55 +572,34 @@ class CarLogic:
     def driving_status(self) -> bool:
         return self.driving
     
+    @property
+    def driving_direction(self) -> RoadDirections:
+        return self._driving_direction
+    
     @property
     def coordinates(self) -> tuple[float, float]:
         return (self.x, self.y)
     
     
 class CarUI:
-    def __init__(self, screen, start_rotation, img):
+    __slots__ = ("screen", "img", "current_rotation")
+    
+    def __init__(self, screen, start_rotation: RoadDirections):
         self.screen = screen
-        self.img = img
+        self.img = assets.car_sprite(start_rotation) # shared with every car driving in this direction
         self.current_rotation = start_rotation
           
-    def draw(self, x, y) -> None:
-        self.screen.blit(self.img,(x, y))
+    def draw(self, x, y) -> pygame.Rect:
+        return self.screen.blit(self.img,(x, y))
     
     def first_rotation(self, rotate_to: RoadDirections):
-        angle = {   RoadDirections.EAST.value: 0,
-                    RoadDirections.NORTH.value: 90,
-                    RoadDirections.SOUTH.value: 270,
-                    RoadDirections.WEST.value: 180
-                }
-        self.img = pygame.transform.rotate(self.img, angle.get(rotate_to.value, 0))
+        self.img = assets.car_sprite(rotate_to)
+        self.current_rotation = rotate_to
     
     def rotate_car(self, rotate_to: RoadDirections):              
-        angle = {
-            RoadDirections.EAST: {
-                RoadDirections.NORTH: 90,
-                RoadDirections.SOUTH: 270,
-                RoadDirections.WEST: 180,
-            },
-            RoadDirections.NORTH: {
-                RoadDirections.EAST: 270,
-                RoadDirections.WEST: 90,
-                RoadDirections.SOUTH: 180,
-            },
-            RoadDirections.SOUTH: {
-                RoadDirections.EAST: 90,
-                RoadDirections.WEST: 270,
-                RoadDirections.NORTH: 180,
-            },
-            RoadDirections.WEST: {
-                RoadDirections.NORTH: 270,
-                RoadDirections.SOUTH: 90,
-                RoadDirections.EAST: 180,
-            }
-        }
-
-        rotation = angle.get(self.current_rotation, {}).get(rotate_to, {})
-        if not rotation:
+        # The sprites for all directions are prerendered, so turning only swaps the image
+        if rotate_to is self.current_rotation:
             logging.info("The calling function has a error, as this function should not be callen, when there is no turn")
         
-        self.img = pygame.transform.rotate(self.img, rotation)
+        self.img = assets.car_sprite(rotate_to)
         self.current_rotation = rotate_to
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules import each other by name, like when main.py is started from version_one/src
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from car_following import DriverParameters
+from constants import DIRECTION_CODES, RoadDirections, RoadType, CAR_LENGTH
+from main import HeadlessGame
+from map_generator import generate_grid, generate_network
+
+
+def positions_in_lane(sim, road, direction) -> list[float]:
+    # x of the cars driving east on the road, from the back to the front
+    if sim.fleet is not None:
+        state = sim.fleet.state
+        in_lane = state.alive & (state.road == sim.roads.index(road)) & (state.direction == DIRECTION_CODES[direction])
+        return sorted(state.x[:state.size][in_lane[:state.size]].tolist())
+    
+    positions, car = [], sim.lanes.lane(road, direction).front
+    while car is not None:
+        positions.append(car.x)
+        car = car.follower
+    return positions[::-1]
+
+
+@pytest.mark.parametrize("engine", ["object", "vectorized"])
+def test_idm_keeps_the_minimum_gap_in_a_queue(engine):
+    # One long road from the west entry to a traffic light, no car turns into its eastbound lane,
+    # so the cars of the lane only follow each other and queue up at the red light
+    sim = HeadlessGame(seed=4, engine=engine)
+    sim.car_following = "idm"
+    sim.arrival_rate = 1200
+    generate_network(sim, [700, 220], [220, 220])
+    road = sim.roads[0]
+    
+    min_distance = CAR_LENGTH + DriverParameters().min_gap - 1
+    closest_pairs = 0
+    for _ in range(3600):
+        sim.update()
+        positions = np.array(positions_in_lane(sim, road, RoadDirections.EAST))
+        distances = np.diff(positions)
+        assert (distances >= min_distance).all()
+        closest_pairs = max(closest_pairs, int((distances < min_distance + 2).sum()))
+    
+    # a queue formed at the red light, with the cars at the minimum gap behind each other
+    assert closest_pairs >= 2
+
+
+def cars_on_roads(sim, roads) -> list[list[float]]:
+    # the progress of the cars in every lane of the roads, a lane is the road a car is on and its direction
+    if sim.fleet is not None:
+        state = sim.fleet.state
+        alive = np.flatnonzero(state.alive[:state.size])
+        x, y, codes = state.x[alive], state.y[alive], state.direction[alive]
+        directions = [direction for code in codes for direction in DIRECTION_CODES if DIRECTION_CODES[direction] == code]
+    else:
+        cars = sim.all_cars()
+        x, y = [car.logic.x for car in cars], [car.logic.y for car in cars]
+        directions = [car.logic.driving_direction for car in cars]
+    
+    lanes = {}
+    for car_x, car_y, direction in zip(x, y, directions):
+        for road in roads:
+            if road.on_road(car_x, car_y):
+                progress = car_x if direction in (RoadDirections.EAST, RoadDirections.WEST) else car_y
+                lanes.setdefault((road, direction), []).append(progress)
+    return [sorted(lane) for lane in lanes.values()]
+
+
+@pytest.mark.parametrize("engine", ["object", "vectorized"])
+def test_idm_turning_traffic_on_a_grid_does_not_lock_up(engine):
+    # Cars which turn into a lane merge behind its last car and wait at the stop line while the lane is full,
+    # so no two cars of a lane overlap and the grid keeps draining even with more demand than it can carry
+    sim = HeadlessGame(seed=1, engine=engine)
+    sim.car_following = "idm"
+    sim.arrival_rate = 900
+    generate_grid(sim, 3, 3)
+    roads = [road for road in sim.roads if road.road_type is not RoadType.INTERSECTION]
+    
+    despawned = []
+    for step in range(sim.clock.steps_for(240)):
+        sim.update()
+        if step % 30 == 0:
+            for lane in cars_on_roads(sim, roads):
+                assert (np.diff(lane) >= CAR_LENGTH - 0.5).all()
+        if step % sim.clock.steps_for(60) == 0:
+            despawned.append(sim.despawned_cars)
+    
+    # every minute after the first one cars drove off the map
+    assert (np.diff(despawned[1:]) > 0).all()
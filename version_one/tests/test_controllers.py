@@ -0,0 +1,64 @@
+from random import Random
+from types import SimpleNamespace
+from constants import CAR_SPEED, ColorPhase, RoadDirections
+from corridors import HORIZONTAL_SIDES, find_corridors
+from main import HeadlessGame
+from map_generator import generate_arterial, generate_network
+
+
+def set_queues(group, stopped: int) -> None:
+    # counters in place of the queue sensors, the roads behind the intersection stay empty
+    for approach in group:
+        approach.queue = SimpleNamespace(stopped=stopped)
+        approach.exits = [SimpleNamespace(stopped=0)]
+
+
+def phases(group) -> set[ColorPhase]:
+    return {approach.traffic_light.color_phase for approach in group}
+
+
+def test_max_pressure_gives_the_green_to_the_longer_queue():
+    sim = HeadlessGame(seed=1)
+    sim.signal_control = "max-pressure"
+    sim.max_cars = 0
+    generate_network(sim, [220, 220], [220, 220])
+    controller, = sim.controllers
+    green, red = sorted(controller.groups, key=lambda group: group[0].traffic_light.starting_color_phase is not ColorPhase.GREEN)
+    assert phases(green) == {ColorPhase.GREEN} and phases(red) == {ColorPhase.RED}
+    
+    # a longer queue at the red lights ends the green, but not before min_green
+    set_queues(green, 1)
+    set_queues(red, 4)
+    sim.run_for(controller.min_green - 1)
+    assert phases(green) == {ColorPhase.GREEN}
+    sim.run_for(1 + controller.yellow_phase + 0.5)
+    assert phases(green) == {ColorPhase.RED} and phases(red) == {ColorPhase.GREEN}
+    
+    # a shorter queue at the red lights keeps the green until max_green
+    set_queues(green, 3)
+    sim.run_for(controller.max_green - controller.yellow_phase - 1)
+    assert phases(red) == {ColorPhase.GREEN}
+    sim.run_for(controller.yellow_phase + 1.5)
+    assert phases(red) == {ColorPhase.RED} and phases(green) == {ColorPhase.GREEN}
+
+
+def test_green_wave_offsets_are_the_travel_times_along_the_corridor():
+    sim = HeadlessGame(seed=1)
+    sim.signal_plan = "green-wave"
+    generate_arterial(sim, 5, Random(4))
+    corridor, = find_corridors(sim.roads, RoadDirections.EAST)
+    assert len(corridor) == 5
+    phase = sum(sim.phase_range) // 2
+    
+    def green_start(intersection) -> int:
+        # when the light for the cars of the corridor turned green
+        traffic_light = intersection.acitve_traffic_lights[HORIZONTAL_SIDES[0]]
+        if traffic_light.starting_color_phase is ColorPhase.GREEN:
+            return traffic_light.start_ticks
+        return traffic_light.start_ticks + phase * 1000
+    
+    first = corridor.intersections[0]
+    for intersection in corridor.intersections[1:]:
+        travel_ticks = (intersection.x - first.x) / CAR_SPEED * 1000
+        offset = (green_start(intersection) - green_start(first) - travel_ticks) % (2 * phase * 1000)
+        assert min(offset, 2 * phase * 1000 - offset) <= 1
@@ -0,0 +1,65 @@
+import json
+import numpy as np
+from constants import EventKind
+from demand import Demand, find_entries, load_demand
+from main import HeadlessGame
+from map_generator import generate_grid
+
+
+def arrivals(sim) -> int:
+    # the cars which arrived: on the map or still waiting in the backlog of their entry
+    return sim.spawned_cars + int(sim.demand.backlog.sum())
+
+
+def grid(seed: int = 1) -> HeadlessGame:
+    sim = HeadlessGame(seed=seed)
+    generate_grid(sim, 3, 3)
+    return sim
+
+
+def test_arrivals_follow_the_rates_of_the_periods():
+    sim = grid()
+    entries = len(find_entries(sim.roads))
+    sim.demand = Demand(sim, [(0, np.full(entries, 600.0), None), (300, np.zeros(entries), None)])
+    sim.run_for(300)
+    
+    # Poisson arrivals: the count is within four standard deviations of the rate
+    expected = 600 * 300 / 3600 * entries
+    assert abs(arrivals(sim) - expected) < 4 * expected ** 0.5
+    
+    arrived = arrivals(sim)
+    sim.run_for(60)
+    assert arrivals(sim) == arrived
+
+
+def test_the_demand_seed_repeats_the_arrivals(tmp_path):
+    def run(seed: int, demand_seed: int | None) -> list:
+        # the arrivals of every entry each second, the spawns depend on the cars in front of the entries too
+        sim = grid(seed)
+        demand = sim.demand = Demand(sim, [(0, np.full(len(find_entries(sim.roads)), 900.0), None)], demand_seed)
+        entry = {(x, y): i for i, (x, y) in enumerate(zip(demand.x.tolist(), demand.y.tolist()))}
+        spawned = np.zeros(len(entry), dtype=np.int64)
+        def count(step, kind, ids, xs, ys, values):
+            if kind is EventKind.SPAWN:
+                for x, y in zip(xs, ys):
+                    spawned[entry[float(x), float(y)]] += 1
+        sim.add_event_hook(count)
+        
+        counts = []
+        for _ in range(30):
+            sim.run_for(1)
+            counts.append((spawned + demand.backlog).tolist())
+        return counts
+    
+    assert run(1, None) == run(1, None)
+    assert run(1, None) != run(2, None)
+    # a seed of the demand does not depend on the seed of the simulation
+    assert run(1, 5) == run(2, 5) != run(1, 6)
+    
+    path = tmp_path / "demand.json"
+    sim = grid()
+    entries = len(find_entries(sim.roads))
+    path.write_text(json.dumps({"seed": 5, "periods": [{"from": 0, "rates": [900] * entries}]}))
+    sim.demand = load_demand(str(path), sim)
+    draws = sim.demand.rng.poisson(10, 20)
+    assert (draws == Demand(grid(), [(0, np.zeros(entries), None)], 5).rng.poisson(10, 20)).all()
@@ -0,0 +1,54 @@
+import pytest
+from main import HeadlessGame
+from map_file import load_map, map_bytes, read_map, save_map
+from map_generator import generate_grid
+
+
+def positions(sim) -> list[tuple[float, float]]:
+    return [(round(car.logic.x, 6), round(car.logic.y, 6)) for car in sim.all_cars()]
+
+
+def test_save_and_load_give_the_same_map(tmp_path):
+    generated = HeadlessGame(seed=1)
+    generate_grid(generated, 3, 4)
+    save_map(tmp_path / "grid.tsmap", generated)
+    
+    loaded = HeadlessGame(seed=1)
+    load_map(str(tmp_path / "grid.tsmap"), loaded)
+    
+    assert len(loaded.roads) == len(generated.roads)
+    assert (loaded.SCREEN_WIDTH, loaded.SCREEN_HEIGHT) == (generated.SCREEN_WIDTH, generated.SCREEN_HEIGHT)
+    for a, b in zip(generated.roads, loaded.roads):
+        assert (a.road_type, a.bounds, a.directions) == (b.road_type, b.bounds, b.directions)
+        # the same neighbours in the same order
+        assert [(side, generated.roads.index(road)) for side, road in a.connected_roads.items()] == \
+               [(side, loaded.roads.index(road)) for side, road in b.connected_roads.items()]
+        assert [(direction, light.get_location) for direction, light in a.traffic_light.items()] == \
+               [(direction, light.get_location) for direction, light in b.traffic_light.items()]
+    
+    # writing the loaded map again gives the same file
+    assert map_bytes(loaded) == map_bytes(generated)
+
+
+def test_read_map_checks_the_header():
+    sim = HeadlessGame(seed=1)
+    sim.generate_map()
+    data = bytearray(map_bytes(sim))
+    
+    assert read_map(bytes(data)).road_count == len(sim.roads)
+    data[:5] = b"NOMAP"
+    with pytest.raises(ValueError):
+        read_map(bytes(data))
+
+
+def test_seeded_run_on_a_loaded_map_matches_the_generated_one():
+    generated = HeadlessGame(seed=5)
+    generate_grid(generated, 2, 2)
+    loaded = HeadlessGame(seed=5)
+    load_map(map_bytes(generated), loaded)
+    
+    generated.max_cars = loaded.max_cars = 20
+    for _ in range(600):
+        generated.update()
+        loaded.update()
+    assert positions(loaded) == positions(generated)
@@ -0,0 +1,51 @@
+import pytest
+from main import HeadlessGame
+from recorder import Recorder, RecordingReader
+
+
+def record(path: str, engine: str, compress: bool = False) -> dict[int, int]:
+    # No cars for the first second, cars for ten seconds, then the map runs empty again.
+    # Small chunks, so the rows of one step are split over several chunks
+    sim = HeadlessGame(seed=1, engine=engine)
+    sim.generate_map()
+    sim.max_cars = 0
+    cars = {}
+    with Recorder(path, sim, chunk_rows=16, compress=compress):
+        for step in range(3000):
+            sim.max_cars = 4 if 60 <= step < 660 else 0
+            sim.update()
+            cars[sim.clock.steps] = sim.car_count()
+    return cars
+
+
+def test_empty_steps_are_recorded(tmp_path):
+    for engine in ("object", "vectorized"):
+        cars = record(str(tmp_path / f"{engine}.rec"), engine)
+        with RecordingReader(str(tmp_path / f"{engine}.rec")) as reader:
+            steps = reader.steps()
+            assert steps["step"].tolist() == list(cars)
+            assert steps["rows"].tolist() == list(cars.values())
+            assert cars[reader.last_step] == 0 and max(cars.values()) > 0
+
+
+def test_frames_of_empty_steps_are_empty(tmp_path):
+    cars = record(str(tmp_path / "run.rec"), "vectorized", compress=True)
+    with RecordingReader(str(tmp_path / "run.rec")) as reader:
+        # no cars from an older step are shown when the map is empty
+        for step, count in cars.items():
+            assert len(reader.frame(step)["id"]) == count
+        assert len(reader.frame(0)["id"]) == 0
+
+
+def test_a_failing_run_still_closes_its_recording(tmp_path):
+    sim = HeadlessGame(seed=1)
+    sim.generate_map()
+    with pytest.raises(RuntimeError):
+        with Recorder(str(tmp_path / "failed.rec"), sim, chunk_rows=16) as recorder:
+            sim.run(300)
+            raise RuntimeError("the simulation failed")
+    
+    assert recorder.file.closed and not sim.step_hooks
+    with RecordingReader(str(tmp_path / "failed.rec")) as reader:
+        assert reader.last_step == 300
+        assert reader.steps()["step"].tolist() == list(range(1, 301))
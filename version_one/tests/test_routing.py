@@ -0,0 +1,94 @@
+import math
+import numpy as np
+from constants import DIRECTION_CODES, RoadType
+from main import HeadlessGame
+from map_generator import generate_grid, generate_network
+from routing import Router
+
+
+def lanes_after(road, direction) -> list:
+    # the lanes a car can turn into at the end of the lane, straight from the map
+    intersection = road.downstream.get(direction)
+    route = intersection.get_route(direction, road) if intersection is not None else None
+    if route is None:
+        return []
+    return [(next_road, turn) for turn, next_road in route.roads.items() if next_road.road_type is not RoadType.INTERSECTION]
+
+
+def shortest_costs(lanes: list, weight, destination) -> dict:
+    # Bellman-Ford: the time from the end of every lane to the destination road
+    cost = {lane: 0.0 if lane[0] is destination else math.inf for lane in lanes}
+    for _ in lanes:
+        for lane in lanes:
+            if lane[0] is not destination:
+                cost[lane] = min([cost[lane]] + [cost[after] + weight(after) for after in lanes_after(*lane)])
+    return cost
+
+
+def test_next_turns_follow_the_shortest_paths_of_a_small_grid():
+    # blocks of different lengths, so the fewest turns are not always the shortest path
+    sim = HeadlessGame(seed=1)
+    generate_network(sim, [150, 480, 200, 320], [260, 150, 420])
+    router = Router(sim.roads)
+    def weight(lane) -> float:
+        road, direction = lane
+        return router.free_flow[router.road_ids[road] * 4 + DIRECTION_CODES[direction]]
+
+    roads = [road for road in sim.roads if road.road_type is not RoadType.INTERSECTION]
+    lanes = [(road, direction) for road in roads for direction in road.directions]
+    reachable = 0
+    for destination in roads:
+        cost = shortest_costs(lanes, weight, destination)
+        for road, direction in lanes:
+            if road is destination:
+                continue
+            turn = router.next_turn(road, direction, destination)
+            if cost[road, direction] == math.inf:
+                assert turn is None
+                continue
+            
+            # driving the next turns reaches the destination in the time of the shortest path
+            reachable += 1
+            lane, driven = (road, direction), 0.0
+            while lane[0] is not destination:
+                turn = router.next_turn(*lane, destination)
+                lane = next(after for after in lanes_after(*lane) if after[1] is turn)
+                driven += weight(lane)
+                assert driven <= cost[road, direction] + 1e-9
+            assert math.isclose(driven, cost[road, direction])
+    
+    assert reachable > len(lanes)
+
+
+def test_travel_time_routes_avoid_a_congested_lane():
+    sim = HeadlessGame(seed=1)
+    sim.routing = "travel-time"
+    generate_grid(sim, 3, 3)
+    router = sim.router
+    roads = [road for road in sim.roads if road.road_type is not RoadType.INTERSECTION]
+    trips = [(road, direction, destination) for road in roads for direction in road.directions for destination in roads
+             if destination is not road and lanes_after(road, direction)]
+    free_flow = {trip: router.next_turn(*trip) for trip in trips}
+    
+    # the first trip which can go around: a queue on the lane of its next turn sends it the other way
+    for road, direction, destination in trips:
+        turn = free_flow[road, direction, destination]
+        if turn is None:
+            continue
+        next_road = dict((after_turn, after) for after, after_turn in lanes_after(road, direction))[turn]
+        queue = sim.lanes.lane(next_road, turn)
+        queue.stopped = 20
+        for i in range(1, 10):
+            router.observe(sim.get_ticks() + i * router.interval * 1000)
+        if router.next_turn(road, direction, destination) is not turn:
+            break
+        queue.stopped = 0
+    else:
+        raise AssertionError("no trip avoids a congested lane")
+    
+    # once the queue is gone, the costs go back to the free flow times
+    queue.stopped = 0
+    for i in range(10, 30):
+        router.observe(sim.get_ticks() + i * router.interval * 1000)
+    keys = router.lane_keys
+    assert np.abs(router.weights[keys] - router.free_flow[keys]).max() < router.min_change
@@ -0,0 +1,161 @@
+import numpy as np
+import pytest
+from random import Random
+from benchmark import place_cars
+from clock import SimulationClock
+from constants import EventKind, PHASE_CODES, RoadType
+from main import HeadlessGame
+from map import link_roads
+from map_generator import generate_grid, generate_network
+from spatial_index import RoadIndex
+
+
+def positions(sim) -> dict[int, tuple[float, float]]:
+    if sim.fleet is not None:
+        state = sim.fleet.state
+        alive = np.flatnonzero(state.alive[:state.size])
+        return {int(i): (float(x), float(y)) for i, x, y in zip(state.id[alive], state.x[alive], state.y[alive])}
+    return {car_id: car.logic.coordinates for car_id, car in sim.cars.items()}
+
+
+def test_the_clock_counts_simulated_time_by_steps():
+    clock = SimulationClock(1 / 60)
+    for _ in range(clock.steps_for(3600)):
+        assert clock.tick() == 1 / 60
+    
+    # an hour of 1/60 s steps without the float error of adding up the step sizes
+    assert clock.steps == 216000 and clock.ticks == 3600000 and clock.seconds == 3600
+    assert SimulationClock(0.1).steps_for(2.5) == 25
+
+
+def test_a_seed_repeats_a_run():
+    # the cars move by the simulated time only, so however long the steps took the same seed ends alike
+    runs = []
+    for _ in range(2):
+        sim = HeadlessGame(seed=5)
+        sim.arrival_rate = 900
+        generate_grid(sim, 2, 2)
+        sim.run_for(20)
+        runs.append((sim.get_ticks(), positions(sim)))
+    
+    assert runs[0] == runs[1] and runs[0][0] == 20000 and runs[0][1]
+
+
+@pytest.mark.parametrize("engine", ["object", "vectorized"])
+def test_event_hooks_see_every_car_from_its_spawn(engine):
+    sim = HeadlessGame(seed=2, engine=engine)
+    sim.arrival_rate = 900
+    generate_grid(sim, 2, 2)
+    sim.run_for(10)
+    
+    # a hook added while cars drive knows those cars, the others come with a spawn event
+    known = set(positions(sim))
+    log = []
+    sim.add_event_hook(lambda step, kind, ids, xs, ys, values: log.extend((step, kind, int(i), value) for i, value in zip(ids, values)))
+    sim.run_for(60)
+    
+    assert [step for step, *_ in log] == sorted(step for step, *_ in log)
+    assert {kind for _, kind, _, _ in log} == set(EventKind)
+    for step, kind, subject, value in log:
+        if kind is EventKind.SPAWN:
+            known.add(subject)
+        elif kind is EventKind.PHASE_CHANGE:
+            assert 0 <= subject < len(sim.traffic_lights) and value in PHASE_CODES.values()
+        else:
+            assert subject in known
+        if kind is EventKind.DESPAWN:
+            known.remove(subject)
+    
+    assert known == set(positions(sim))
+
+
+def test_link_roads_connects_like_the_pairwise_search():
+    rng = Random(7)
+    lengths = [rng.randint(150, 400) for _ in range(5)], [rng.randint(150, 400) for _ in range(4)]
+    sim = HeadlessGame(seed=1)
+    generate_network(sim, *lengths)
+    intersections = [road for road in sim.roads if road.road_type is RoadType.INTERSECTION]
+    linked = [dict(intersection.connected_roads) for intersection in intersections]
+    
+    for intersection in intersections:
+        intersection.connected_roads.clear()
+        intersection.find_connected_roads(sim.roads)
+    assert linked == [intersection.connected_roads for intersection in intersections]
+    
+    for intersection in intersections:
+        intersection.connected_roads.clear()
+    link_roads(sim.roads, cell_size=60)
+    assert linked == [intersection.connected_roads for intersection in intersections]
+    assert all(len(connected) == 4 for connected in linked[1:-1]) and all(linked)
+
+
+def test_the_road_index_finds_the_road_of_a_linear_scan():
+    sim = HeadlessGame(seed=1)
+    generate_grid(sim, 3, 3)
+    index = RoadIndex(sim.roads, cell_size=70)
+    roads = [road for road in sim.roads if road.road_type is not RoadType.INTERSECTION]
+    intersections = [road for road in sim.roads if road.road_type is RoadType.INTERSECTION]
+    
+    rng = Random(3)
+    hits = 0
+    for _ in range(5000):
+        x, y = rng.uniform(-50, sim.SCREEN_WIDTH + 50), rng.uniform(-50, sim.SCREEN_HEIGHT + 50)
+        road = next((road for road in roads if road.on_road(x, y)), None)
+        assert index.road_at(x, y) is road
+        assert index.intersection_at(x, y) is next((road for road in intersections if road.on_road(x, y)), None)
+        hits += road is not None
+    
+    assert hits
+
+
+def test_the_signal_scheduler_changes_the_lights_of_a_scan():
+    # two maps with the same timing: the scheduler against updating every light in every step
+    scheduled, scanned = HeadlessGame(seed=4), HeadlessGame(seed=4)
+    generate_grid(scheduled, 2, 3)
+    generate_grid(scanned, 2, 3)
+    
+    changes = 0
+    for _ in range(scheduled.clock.steps_for(120)):
+        scheduled.clock.tick()
+        changed = scheduled.signals.update(scheduled.get_ticks())
+    
+        scanned.clock.tick()
+        expected = [i for i, traffic_light in enumerate(scanned.traffic_lights) if traffic_light.update(scanned.get_ticks())]
+    
+        # lights which change in the same step come in the order of the list
+        assert [scheduled.light_ids[traffic_light] for traffic_light in changed] == expected
+        assert [tl.color_phase for tl in scheduled.traffic_lights] == [tl.color_phase for tl in scanned.traffic_lights]
+        changes += len(changed)
+    
+    assert changes > len(scheduled.traffic_lights)
+    assert scheduled.signals.next_change_ticks == min(tl.next_change_ticks for tl in scheduled.traffic_lights)
+
+
+def test_the_vectorized_engine_drives_like_the_object_engine():
+    # The engines only differ in their random turns: until a car reached its first intersection, it is at the same place
+    sims = []
+    for engine in ("object", "vectorized"):
+        sim = HeadlessGame(seed=3, engine=engine)
+        generate_grid(sim, 2, 2)
+        sim.max_cars = 0
+        place_cars(sim, 40)
+        sims.append(sim)
+    intersections = [road for road in sims[0].roads if road.road_type is RoadType.INTERSECTION]
+    
+    turned, compared = set(), 0
+    for _ in range(1200):
+        for sim in sims:
+            sim.update()
+        cars, vehicles = positions(sims[0]), positions(sims[1])
+        assert set(vehicles) <= set(cars) | turned
+    
+        for car_id, position in cars.items():
+            if car_id in turned:
+                continue
+            if any(intersection.on_road(*position) for intersection in intersections):
+                turned.add(car_id)
+                continue
+            assert vehicles[car_id] == pytest.approx(position)
+            compared += 1
+    
+    assert len(turned) > 20 and compared > 5000
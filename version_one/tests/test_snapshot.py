@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from main import HeadlessGame
+from map_generator import generate_grid
+from snapshot import restore_snapshot, take_snapshot
+from sweep import reseed, run_scenario, sweep
+
+
+def positions(sim) -> list:
+    if sim.fleet is not None:
+        state = sim.fleet.state
+        return [state.x[:state.size].round(6).tolist(), state.y[:state.size].round(6).tolist(), state.alive[:state.size].tolist()]
+    return [(car.id, round(car.logic.x, 6), round(car.logic.y, 6)) for car in sim.all_cars()]
+
+
+def warmed_up(engine: str, seed: int = 7) -> HeadlessGame:
+    sim = HeadlessGame(seed=seed, engine=engine)
+    sim.arrival_rate = 900 # a demand, its generator is part of the snapshot too
+    generate_grid(sim, 3, 3)
+    sim.run(1200)
+    return sim
+
+
+@pytest.mark.parametrize("engine", ["object", "vectorized"])
+def test_restored_run_matches_the_uninterrupted_one(engine):
+    uninterrupted = warmed_up(engine)
+    snapshot = take_snapshot(uninterrupted)
+    uninterrupted.run(1200)
+    
+    restored = HeadlessGame(engine=engine)
+    restore_snapshot(snapshot, restored)
+    restored.run(1200)
+    
+    assert positions(uninterrupted)
+    assert positions(restored) == positions(uninterrupted)
+
+
+def test_reseeded_branches_depend_only_on_the_seed():
+    snapshot = take_snapshot(warmed_up("vectorized"))
+    
+    def branch(seed: int) -> HeadlessGame:
+        sim = HeadlessGame(engine="vectorized")
+        restore_snapshot(snapshot, sim)
+        reseed(sim, seed)
+        return sim
+    
+    first, second, other = branch(3), branch(3), branch(4)
+    # the generators of the fleet and the demand start from the seed as well
+    assert first.fleet.rng.random() == second.fleet.rng.random() != other.fleet.rng.random()
+    assert np.array_equal(first.demand.rng.random(4), second.demand.rng.random(4))
+    
+    for sim in (first, second, other):
+        sim.run(1200)
+    assert positions(first) == positions(second)
+    assert positions(first) != positions(other)
+
+
+@pytest.mark.parametrize("engine", ["object", "vectorized"])
+def test_tunables_reach_the_restored_cars(engine):
+    sim = HeadlessGame(engine=engine)
+    restore_snapshot(take_snapshot(warmed_up(engine)), sim)
+    sim.set_tunables({"safety_distance": 90, "car_following": "idm", "arrival_rate": 300})
+    
+    if engine == "vectorized":
+        assert (sim.fleet.safety_distance, sim.fleet.car_following) == (90, "idm")
+    for car in sim.cars.values():
+        assert car.logic.safety_distance == 90 and car.logic.driver is not None
+    assert (sim.demand.rates[0] == 300).all()
+    
+    sim.run(600)
+    assert sim.despawned_cars > take_snapshot(warmed_up(engine))["simulation"]["despawned_cars"]
+    
+    with pytest.raises(ValueError):
+        sim.set_tunables({"phase_range": (2, 3)})
+
+
+def test_sweeps_from_a_snapshot_measure_the_swept_values():
+    snapshot = take_snapshot(warmed_up("vectorized"))
+    settings = {"duration": 30, "engine": "vectorized", "step_size": 1 / 60, "map": None, "grid": None, "snapshot": snapshot, "regions": None}
+    
+    summaries = [run_scenario(({"arrival_rate": rate}, 0, settings))[2] for rate in (150, 1500)]
+    assert summaries[0] != summaries[1]
+
+
+def test_map_tunables_can_not_be_swept_from_a_snapshot():
+    with pytest.raises(ValueError):
+        sweep({"signal_plan": ["random", "green-wave"]}, [0], 30, snapshot="warm.snap")
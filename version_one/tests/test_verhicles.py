@@ -0,0 +1,56 @@
+from constants import EventKind
+from main import HeadlessGame
+from map_generator import generate_grid
+
+
+def event_log(sim) -> list:
+    log = []
+    sim.add_event_hook(lambda step, kind, ids, xs, ys, values: log.extend((step, kind, int(i)) for i in ids))
+    return log
+
+
+def test_car_ids_do_not_depend_on_other_simulations():
+    # two simulations stepped in turns in the same process number their cars the same way
+    first, second = HeadlessGame(seed=3), HeadlessGame(seed=3)
+    logs = []
+    for sim in (first, second):
+        sim.generate_map()
+        sim.max_cars = 10
+        logs.append(event_log(sim))
+    
+    for _ in range(1200):
+        first.update()
+        second.update()
+    
+    assert list(first.cars) == list(second.cars) and first.cars
+    assert logs[0] == logs[1] and logs[0]
+    assert min(subject for _, kind, subject in logs[0] if kind is not EventKind.PHASE_CHANGE) == 1
+
+
+def test_pooled_cars_get_new_ids():
+    sim = HeadlessGame(seed=3)
+    sim.generate_map()
+    sim.max_cars = 10
+    sim.run(3000)
+    
+    # the despawned cars were reused, but no id was given out twice
+    assert sim.despawned_cars and sim.car_pool._id_counter == sim.spawned_cars
+    assert len(set(sim.cars)) == len(sim.cars)
+    assert all(car.id == car.logic.id for car in sim.cars.values())
+
+
+def test_only_cars_off_the_map_are_leaving():
+    # a car between a road and an intersection is still on the network
+    sim = HeadlessGame(seed=1)
+    sim.arrival_rate = 900
+    generate_grid(sim, 2, 2)
+    
+    for _ in range(3600):
+        sim.update()
+        for car_id in sim.leaving_cars:
+            x, y = sim.cars[car_id].logic.coordinates
+            assert not any(road.on_road(x, y) for road in sim.roads)
+            assert not 20 < x < sim.SCREEN_WIDTH - 20 or not 20 < y < sim.SCREEN_HEIGHT - 20
+    
+    assert sim.despawned_cars
+    assert all(not car.logic.off_network for car_id, car in sim.cars.items() if car_id not in sim.leaving_cars)